@@ -5,7 +5,15 @@ from sqlalchemy.orm import joinedload
 
 from lib.db_connection import async_session
 
-from lib.models import JBPluginUUID, JBSession, JBTurn, JBUser, JBMessage, JBBot
+from lib.models import (
+    JBPluginUUID,
+    JBSession,
+    JBTurn,
+    JBUser,
+    JBMessage,
+    JBBot,
+    JBIndexerJob,
+)
 
 
 async def create_user(
@@ -218,4 +226,24 @@ async def create_bot(data):
             session.add(bot)
             await session.commit()
             return bot
-    return None
\ No newline at end of file
+    return None
+
+
+async def get_indexer_job(job_id: str):
+    query = select(JBIndexerJob).where(JBIndexerJob.id == job_id)
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(query)
+            return result.scalars().first()
+    return None
+
+
+async def get_indexer_jobs(collection_name: str = None, limit: int = 100):
+    query = select(JBIndexerJob).order_by(desc(JBIndexerJob.created_at)).limit(limit)
+    if collection_name is not None:
+        query = query.where(JBIndexerJob.collection_name == collection_name)
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(query)
+            return result.scalars().all()
+    return None
@@ -1,4 +1,4 @@
-from typing import Optional, List, Dict
+from typing import Literal, Optional, List, Dict
 from pydantic import BaseModel, Field
 
 
@@ -9,6 +9,8 @@ class JBBotUpdate(BaseModel):
     config_env: Optional[Dict] = {}
     version: Optional[str] = None
     channels: Optional[List[str]] = None
+    # not Optional, the column is NOT NULL; left out of the update unless sent
+    execution_mode: Literal["subprocess", "in_process"] = "subprocess"
 
     class Config:
         from_attributes = True
@@ -44,6 +46,8 @@ class JBBotCode(BaseModel):
     index_urls: List[str]
     version: Optional[str] = "v0.1"
     required_credentials: Optional[List[str]] = Field(default_factory=list)
+    # in_process only takes effect when flow runs with FLOW_IN_PROCESS_BOTS=true
+    execution_mode: Literal["subprocess", "in_process"] = "subprocess"
 
     class Config:
         from_attributes = True
@@ -13,6 +13,7 @@ from confluent_kafka import KafkaException
 from lib.kafka_utils import KafkaProducer
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
+from pydantic import BaseModel
 from lib.whatsapp import WhatsappHelper
 from .jb_schema import JBBotUpdate, JBBotCode, JBBotActivate
 
@@ -27,6 +28,7 @@ from lib.data_models import (
     BotConfig,
 )
 from lib.jb_logging import Logger
+from lib.plugin_reference import InvalidPluginReference, PluginReferenceSigner
 from lib.models import JBBot
 
 from .crud import (
@@ -45,6 +47,8 @@ from .crud import (
     get_bot_chat_sessions,
     update_bot,
     create_bot,
+    get_indexer_job,
+    get_indexer_jobs,
 )
 
 load_dotenv()
@@ -66,12 +70,14 @@ flow_topic = os.getenv("KAFKA_FLOW_TOPIC")
 # Connect Kafka Producer automatically using env variables
 # and SASL, if applicable
 producer = KafkaProducer.from_env_vars()
+plugin_reference_signer = PluginReferenceSigner.from_env_vars()
 
 
-def produce_message(message: str, topic: str = kafka_channel_topic):
+def produce_message(message: BaseModel, topic: str = kafka_channel_topic):
     try:
         logger.info(f"Sending msg to {topic} topic: {message}")
-        producer.send_message(topic=topic, value=message)
+        # keyed by the session of the message, see KafkaProducer.send_model
+        producer.send_model(topic, message)
     except KafkaException as e:
         raise HTTPException(status_code=500, detail=f"Error producing message: {e}")
 
@@ -131,7 +137,7 @@ async def install_bot(install_content: JBBotCode):
             bot_version=install_content.version,
         ),
     )
-    produce_message(flow_input.model_dump_json(), topic=flow_topic)
+    produce_message(flow_input, topic=flow_topic)
     return {"status": "success"}
 
 
@@ -243,6 +249,21 @@ async def get_chats(bot_id: str) -> list:
     return chats
 
 
+# status of an indexing job: per file status, chunks embedded and ETA
+@app.get("/indexer/jobs/{job_id}")
+async def get_indexer_job_status(job_id: str):
+    job = await get_indexer_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Indexer job not found")
+    return job
+
+
+@app.get("/indexer/jobs")
+async def get_indexer_job_list(collection_name: str = None, limit: int = 100):
+    jobs = await get_indexer_jobs(collection_name, limit)
+    return jobs
+
+
 @app.post("/callback")
 async def callback(request: Request):
     # if whatsapp parse with whatsapp library
@@ -328,7 +349,7 @@ async def callback(request: Request):
         )
 
         # write to channel
-        produce_message(channel_input.model_dump_json())
+        produce_message(channel_input)
 
     return 200
 
@@ -343,7 +364,19 @@ async def plugin_webhook(request: Request):
             status_code=400, detail="Plugin UUID not found in webhook data"
         )
     logger.info(f"Plugin UUID: {plugin_uuid}")
-    plugin_reference = await get_plugin_reference(plugin_uuid)
+    if PluginReferenceSigner.is_signed(plugin_uuid):
+        if plugin_reference_signer is None:
+            raise HTTPException(
+                status_code=400, detail="Signed plugin references are not enabled"
+            )
+        try:
+            plugin_reference = plugin_reference_signer.verify(plugin_uuid)
+        except InvalidPluginReference as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        plugin_reference = await get_plugin_reference(plugin_uuid)
+        if plugin_reference is None:
+            raise HTTPException(status_code=404, detail="Plugin reference not found")
     logger.info(f"Webhook Data: {webhook_data}")
     flow_input = FlowInput(
         source="api",
@@ -351,5 +384,5 @@ async def plugin_webhook(request: Request):
         turn_id=plugin_reference.turn_id,
         plugin_input=json.loads(webhook_data),
     )
-    produce_message(flow_input.model_dump_json(), topic=flow_topic)
+    produce_message(flow_input, topic=flow_topic)
     return 200
@@ -1,15 +1,14 @@
 import asyncio
-import json
 import os
 import logging
 import traceback
 from dotenv import load_dotenv
 
 from lib.data_models import (
-    ChannelInput,
     ChannelIntent,
     FlowInput,
     LanguageInput,
+    channel_input_adapter,
 )
 from lib.kafka import KafkaHandler
 from .handlers import process_incoming_messages, send_message_to_user
@@ -34,7 +33,7 @@ logger.info("Channel Topic: %s", channel_topic)
 logger.info("Language Topic: %s", language_topic)
 logger.info("Flow Topic: %s", flow_topic)
 
-consumer = KafkaHandler.get_consumer()
+consumer = KafkaHandler.get_consumer(group_id="jb-channel")
 producer = KafkaHandler.get_producer()
 
 
@@ -43,19 +42,16 @@ async def start_channel():
     logger.info("Starting Listening")
     while True:
         try:
-            msg = consumer.receive_message(channel_topic)
-            msg = json.loads(msg)
-            logger.info("Input received: %s", msg)
-            input_data = ChannelInput(**msg)
+            input_data = consumer.receive_model(channel_topic, channel_input_adapter)
             logger.info("Input received in object form: %s", input_data.model_dump(exclude_none=True))
             if input_data.intent == ChannelIntent.BOT_IN:
                 incoming_message = await process_incoming_messages(input_data)
                 if isinstance(incoming_message, FlowInput):
                     logger.info("Sending to flow")
-                    producer.send_message(flow_topic, incoming_message.model_dump_json(exclude_none=True))
+                    producer.send_model(flow_topic, incoming_message, exclude_none=True)
                 elif isinstance(incoming_message, LanguageInput):
                     logger.info("Sending to language")
-                    producer.send_message(language_topic, incoming_message.model_dump_json(exclude_none=True))
+                    producer.send_model(language_topic, incoming_message, exclude_none=True)
             elif input_data.intent == ChannelIntent.BOT_OUT:
                 await send_message_to_user(input_data)
         except Exception as e:
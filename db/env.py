@@ -37,6 +37,14 @@ db_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 config.set_main_option('sqlalchemy.url', db_url)
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # the vector store tables are created by a migration but have no models,
+    # keep autogenerate from dropping them
+    if type_ == "table" and reflected and compare_to is None and name.startswith("langchain_pg_"):
+        return False
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -53,6 +61,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -76,7 +85,9 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,39 @@
+"""Unique pid and version column on jb_fsm_state
+
+Revision ID: 2f7c9a1d4e5b
+Revises: 159ddccc1ed1
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2f7c9a1d4e5b"
+down_revision = "159ddccc1ed1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # keep only the most recently updated row per pid before adding the constraint
+    op.execute(
+        """
+        DELETE FROM jb_fsm_state a
+        USING jb_fsm_state b
+        WHERE a.pid = b.pid
+          AND (a.updated_at, a.id) < (b.updated_at, b.id)
+        """
+    )
+    op.add_column(
+        "jb_fsm_state",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_unique_constraint("jb_fsm_state_pid_key", "jb_fsm_state", ["pid"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("jb_fsm_state_pid_key", "jb_fsm_state", type_="unique")
+    op.drop_column("jb_fsm_state", "version")
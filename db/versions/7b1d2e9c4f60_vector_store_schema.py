@@ -0,0 +1,84 @@
+"""Vector store schema and indexes
+
+Revision ID: 7b1d2e9c4f60
+Revises: c41d7e9a3b05
+Create Date: 2026-10-19 18:02:11.403915
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "7b1d2e9c4f60"
+down_revision = "c41d7e9a3b05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the tables langchain-postgres creates, so that the indexer and the retriever
+    # no longer change the schema at runtime. IF NOT EXISTS keeps the tables and
+    # indexes of deployments where they were created by the indexer already
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS langchain_pg_collection (
+            uuid UUID NOT NULL PRIMARY KEY,
+            name VARCHAR NOT NULL UNIQUE,
+            cmetadata JSON
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS langchain_pg_embedding (
+            id VARCHAR NOT NULL PRIMARY KEY,
+            collection_id UUID REFERENCES langchain_pg_collection (uuid) ON DELETE CASCADE,
+            embedding vector(1536),
+            document VARCHAR,
+            cmetadata JSONB
+        )
+        """
+    )
+    # the indexer used to run this on every job, rewriting the table each time
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF (
+                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = 'langchain_pg_embedding'::regclass AND attname = 'embedding'
+            ) <> 'vector(1536)' THEN
+                ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE vector(1536);
+            END IF;
+        END
+        $$
+        """
+    )
+    # building these on an already loaded table, the HNSW graph above all, takes a
+    # while; CONCURRENTLY keeps the table writable meanwhile and cannot run inside
+    # a transaction
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_langchain_pg_embedding_id "
+            "ON langchain_pg_embedding (id)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cmetadata_gin "
+            "ON langchain_pg_embedding USING gin (cmetadata jsonb_path_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS langchain_embeddings_collection_id "
+            "ON langchain_pg_embedding (collection_id)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS langchain_embeddings_hnsw "
+            "ON langchain_pg_embedding USING hnsw (embedding vector_cosine_ops)"
+        )
+
+
+def downgrade() -> None:
+    # the tables hold indexed documents, only the indexes this revision owns are dropped
+    op.execute("DROP INDEX IF EXISTS langchain_embeddings_hnsw")
+    op.execute("DROP INDEX IF EXISTS langchain_embeddings_collection_id")
@@ -0,0 +1,128 @@
+"""Per-turn latency of the subprocess and in-process FSM execution paths.
+
+Runs a small echo bot for a number of turns through both paths and prints
+latency statistics. Run from the flow directory in an environment that has
+jb-manager-bot and cryptography installed:
+
+    python -m benchmarks.fsm_execution --turns 50
+"""
+
+import argparse
+import asyncio
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.in_process import InProcessRunner
+
+BOT_ID = "benchmark-bot"
+BOT_NAME = "EchoBot"
+BOT_CODE = """
+from jb_manager_bot import AbstractFSM, FSMOutput, MessageData, Status
+
+
+class EchoBot(AbstractFSM):
+    states = ["zero", "ask", "reply"]
+    transitions = [
+        {"source": "zero", "dest": "ask", "trigger": "next"},
+        {"source": "ask", "dest": "reply", "trigger": "next"},
+        {"source": "reply", "dest": "ask", "trigger": "next"},
+    ]
+    conditions = set()
+
+    def __init__(self, send_message, credentials=None):
+        super().__init__(send_message=send_message)
+
+    def on_enter_ask(self):
+        self.status = Status.WAIT_FOR_USER_INPUT
+
+    def on_enter_reply(self):
+        self.status = Status.WAIT_FOR_ME
+        self.send_message(
+            FSMOutput(message_data=MessageData(body=f"echo: {self.current_input}"))
+        )
+        self.status = Status.MOVE_FORWARD
+"""
+
+
+def runner_input(turn: int, state: dict) -> dict:
+    return {
+        "message_text": f"message {turn}",
+        "callback_input": None,
+        "state": state,
+        "bot_name": BOT_NAME,
+        "credentials": {},
+        "config_env": {},
+    }
+
+
+def run_subprocess(bot_dir: Path, turns: int) -> list:
+    latencies = []
+    state = {}
+    for turn in range(turns):
+        start = time.perf_counter()
+        completed_process = subprocess.run(
+            [
+                sys.executable,
+                str(bot_dir / "fsm_wrapper.py"),
+                json.dumps(runner_input(turn, state)),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for line in completed_process.stdout.splitlines():
+            fsm_op = json.loads(line)
+            if "new_state" in fsm_op:
+                state = fsm_op["new_state"]
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_in_process(bots_root: Path, turns: int) -> list:
+    runner = InProcessRunner(bots_root, max_workers=1)
+    latencies = []
+    state = {}
+    for turn in range(turns):
+        start = time.perf_counter()
+        state = await runner.run(BOT_ID, runner_input(turn, state), lambda _: None)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:<12} turns={len(latencies)} "
+        f"first={latencies[0] * 1000:8.2f}ms "
+        f"mean={statistics.mean(latencies) * 1000:8.2f}ms "
+        f"p50={statistics.median(latencies) * 1000:8.2f}ms "
+        f"p95={p95 * 1000:8.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    template_dir = Path(__file__).parent.parent / "template"
+    bots_root = Path(tempfile.mkdtemp())
+    try:
+        bot_dir = bots_root / BOT_ID
+        shutil.copytree(template_dir, bot_dir)
+        (bot_dir / "bot.py").write_text(BOT_CODE)
+        report("subprocess", run_subprocess(bot_dir, args.turns))
+        report("in_process", asyncio.run(run_in_process(bots_root, args.turns)))
+    finally:
+        shutil.rmtree(bots_root)
+
+
+if __name__ == "__main__":
+    main()
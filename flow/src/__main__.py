@@ -6,12 +6,16 @@ import logging
 import subprocess
 import shutil
 from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
 from dotenv import load_dotenv
 
 
 from . import crud
+from .in_process import IN_PROCESS_EXECUTION_MODE, InProcessRunner
 # from .extensions import save_file
 from lib.kafka_utils import KafkaConsumer, KafkaProducer
+from lib.plugin_reference import PluginReferenceSigner
+from lib.retriever_client import RetrieverClient
 from lib.data_models import (
     BotOutput,
     ChannelInput,
@@ -21,6 +25,7 @@ from lib.data_models import (
     LanguageIntent,
     MessageData,
     RAGInput,
+    RAGQuery,
     ChannelIntent,
     BotConfig,
 )
@@ -43,9 +48,15 @@ channel_topic = os.getenv("KAFKA_CHANNEL_TOPIC")
 logger.info("Connecting to topic %s", language_topic)
 
 consumer = KafkaConsumer.from_env_vars(
-    group_id="cooler_group_id", auto_offset_reset="latest"
+    group_id="jb-flow", auto_offset_reset="latest"
 )
 producer = KafkaProducer.from_env_vars()
+# None unless PLUGIN_REFERENCE_SECRET is set; bots then get no plugin_reference
+plugin_reference_signer = PluginReferenceSigner.from_env_vars()
+# None unless FLOW_IN_PROCESS_BOTS is set; bots then opt in via execution_mode
+in_process_runner = InProcessRunner.from_env_vars(Path(__file__).parent.parent / "bots")
+# None unless RETRIEVER_URL is set; dest="rag" outputs then go through Kafka
+retriever_client = RetrieverClient.from_env_vars()
 
 logger.info("Connected to topic %s", language_topic)
 
@@ -81,6 +92,8 @@ async def install_or_update_bot(bot_config: BotConfig):
 
     bot_code_file = Path(os.path.join(bot_dir, "bot.py"))
     bot_code_file.write_text(fsm_code)
+    if in_process_runner is not None:
+        in_process_runner.invalidate(bot_id)
 
     # create a requirements.txt file in the bot's directory
     requirements_file = Path(os.path.join(bot_dir, "requirements.txt"))
@@ -97,6 +110,82 @@ async def install_or_update_bot(bot_config: BotConfig):
     logger.info("Installed bot %s", bot_id)
 
 
+# new_state can be large; asyncio's default 64 KiB line limit is too small
+FSM_OUTPUT_LINE_LIMIT = 32 * 1024 * 1024
+
+
+async def run_fsm_subprocess(
+    path: Path,
+    fsm_runner_input: Dict[str, Any],
+    callback: Callable[[Dict[str, Any]], None],
+    rag_handler: Optional[Callable[[Dict[str, Any]], Awaitable[Optional[str]]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Run a turn through the bot's fsm_wrapper.py.
+
+    The wrapper prints one JSON object per line. Each callback message is passed
+    to ``callback`` as soon as its line arrives, so messages sent before a slow
+    step reach the user without waiting for the whole turn. Returns the new
+    state, or None if the run failed or wrote to stderr.
+
+    With ``rag_handler`` dest="rag" messages are answered on the wrapper's stdin
+    and the bot takes the chunks in the same process. Messages the handler
+    returns None for go to ``callback`` instead.
+    """
+    fsm_runner_input = {**fsm_runner_input, "inline_rag": rag_handler is not None}
+    process = await asyncio.create_subprocess_exec(
+        str(path / ".venv" / "bin" / "python"),
+        "-u",
+        str(path / "fsm_wrapper.py"),
+        json.dumps(fsm_runner_input),
+        stdin=asyncio.subprocess.PIPE if rag_handler is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=FSM_OUTPUT_LINE_LIMIT,
+    )
+    # drain stderr concurrently so a chatty bot cannot block on a full pipe
+    stderr_task = asyncio.create_task(process.stderr.read())
+    new_state = None
+    try:
+        async for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                fsm_op = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Ignoring non JSON output from fsm: %s", line)
+                continue
+            if "callback_message" in fsm_op:
+                message = fsm_op["callback_message"]
+                logger.info("Callback message: %s", message)
+                if rag_handler is not None and message.get("dest") == "rag":
+                    chunks = await rag_handler(message)
+                    if chunks is None:
+                        callback(message)
+                    # buffered by the transport, the wrapper reads it when the run returns
+                    process.stdin.write(
+                        (json.dumps({"message_text": chunks}) + "\n").encode()
+                    )
+                else:
+                    callback(message)
+            elif "new_state" in fsm_op:
+                new_state = fsm_op["new_state"]
+        returncode = await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    stderr = await stderr_task
+    if stderr:
+        # as before streaming, any error output fails the run and its state is
+        # not saved; messages sent before the error have already gone out
+        logger.error("Error while running fsm: %s", stderr.decode())
+        return None
+    if returncode != 0:
+        return None
+    return new_state
+
+
 async def flow_init():
     # install()
     # fetch all bots from db and install them
@@ -129,10 +218,8 @@ async def flow_loop():
     while True:
         try:
             logger.info("Waiting for message")
-            msg = consumer.receive_message(flow_topic)
-            msg = json.loads(msg)
-            logger.info("Message Recieved :: %s", msg)
-            flow_input = FlowInput(**msg)
+            flow_input = consumer.receive_model(flow_topic, FlowInput)
+            logger.info("Message Recieved :: %s", flow_input)
             # logging.info("FlowInput Pydantic:", flow_input)
 
             session_id = flow_input.session_id
@@ -187,18 +274,32 @@ async def flow_loop():
 
             # logging.info(f"Message received from {source}: {msg_text}")
 
-            state = await crud.get_state_by_pid(session_id)
+            state = await crud.get_or_create_state(session_id)
             logger.info("State: %s", state)
 
-            if state is None:
-                # logging.info(f"pid {pid} not found in db, inserting")
-                state = await crud.insert_state(session_id, "zero")
-
-            def generate_reference_id():
-                result = crud.insert_jb_plugin_uuid(
-                    flow_input.session_id, flow_input.turn_id
+            def rag_input_for(fsm_output: FSMOutput) -> RAGInput:
+                rag_query = fsm_output.rag_query or RAGQuery()
+                return RAGInput(
+                    source="flow",
+                    session_id=session_id,
+                    turn_id=flow_input.turn_id,
+                    collection_name=rag_query.collection_name or "KB_Law_Files",
+                    query=rag_query.query or msg_text,
+                    top_chunk_k_value=rag_query.top_chunk_k_value or 5,
+                    metadata=rag_query.metadata,
                 )
-                return result
+
+            async def answer_rag(callback_message: Dict[str, Any]) -> Optional[str]:
+                """Searches inline, the chunks in the shape a retriever message
+                gives the bot. None falls back to Kafka."""
+                rag_input = rag_input_for(FSMOutput(**callback_message))
+                try:
+                    chunks = await retriever_client.search(rag_input)
+                except Exception as e:
+                    logger.error("Inline retrieval failed, using %s: %s", rag_topic, e)
+                    return None
+                logger.info("FLOW -- retriever --> %d chunks", len(chunks))
+                return json.dumps({"chunks": [chunk.model_dump() for chunk in chunks]})
 
             def cb(fsm_output: FSMOutput):
                 media_url = None
@@ -244,20 +345,11 @@ async def flow_loop():
                     logger.info("FLOW -- %s --> %s", language_topic, kafka_out_msg)
 
                     logger.info("FLOW -- %s --> %s", language_topic, kafka_out_msg)
-                    producer.send_message(
-                        language_topic, kafka_out_msg.model_dump_json()
-                    )
+                    producer.send_model(language_topic, kafka_out_msg)
                 elif fsm_output.dest == "rag":
-                    rag_input = RAGInput(
-                        source="flow",
-                        session_id=session_id,
-                        turn_id=flow_input.turn_id,
-                        collection_name="KB_Law_Files",
-                        query=msg_text,
-                        top_chunk_k_value=5,
-                    )
+                    rag_input = rag_input_for(fsm_output)
                     logger.info("FLOW -- %s --> %s", rag_topic, rag_input)
-                    producer.send_message(rag_topic, rag_input.model_dump_json())
+                    producer.send_model(rag_topic, rag_input)
                 elif fsm_output.dest == "channel":
                     channel_input = ChannelInput(
                         source="flow",
@@ -284,9 +376,7 @@ async def flow_loop():
                     )
                     logger.info("FLOW -- %s --> %s", channel_topic, channel_input)
 
-                    producer.send_message(
-                        channel_topic, channel_input.model_dump_json()
-                    )
+                    producer.send_model(channel_topic, channel_input)
 
             # get name from bot id
             bot_details = await crud.get_bot_by_id(bot_id)
@@ -306,36 +396,44 @@ async def flow_loop():
                 "bot_name": bot_name,
                 "credentials": credentials,
                 "config_env": config_env,
+                # handed to 3rd party plugins, which echo it back to /webhook
+                "plugin_reference": (
+                    plugin_reference_signer.mint(session_id, flow_input.turn_id)
+                    if plugin_reference_signer is not None
+                    else None
+                ),
             }
-            completed_process = subprocess.run(
-                [
-                    str(path / ".venv" / "bin" / "python"),
-                    str(path / "fsm_wrapper.py"),
-                    json.dumps(fsm_runner_input),
-                ],
-                capture_output=True,
-                text=True,
-            )
-
-            if completed_process.stderr:
-                logger.error("Error while running fsm: %s", completed_process.stderr)
-                continue
+            new_state_variables = None
+            rag_handler = answer_rag if retriever_client is not None else None
+            if (
+                in_process_runner is not None
+                and bot_details.execution_mode == IN_PROCESS_EXECUTION_MODE
+            ):
+                new_state_variables = await in_process_runner.run(
+                    bot_id,
+                    fsm_runner_input,
+                    lambda callback_message: cb(FSMOutput(**callback_message)),
+                    rag_handler,
+                )
+            else:
+                new_state_variables = await run_fsm_subprocess(
+                    path,
+                    fsm_runner_input,
+                    lambda callback_message: cb(FSMOutput(**callback_message)),
+                    rag_handler,
+                )
 
-            # logger.error("Output from fsm: %s", completed_process.stdout)
-            for line in completed_process.stdout.split("\n"):
-                if not line:
-                    continue
-                # logger.error("Output from fsm: %s", line)
-                fsm_op = json.loads(line)
-                if "callback_message" in fsm_op:
-                    logger.info("Callback message: %s", fsm_op["callback_message"])
-                    # execute callback
-                    cb(FSMOutput(**fsm_op["callback_message"]))
-                else:
-                    # save new state to db
-                    new_state_variables = fsm_op["new_state"]
-                    saved_state = await crud.update_state_and_variables(
-                        session_id, "zerotwo", new_state_variables
+            if new_state_variables is not None:
+                # save new state to db
+                saved = await crud.save_state(
+                    session_id, "zerotwo", new_state_variables, state.version
+                )
+                if not saved:
+                    logger.error(
+                        "State for session %s was updated by a concurrent turn, "
+                        "discarding state from turn %s",
+                        session_id,
+                        flow_input.turn_id,
                     )
 
         except Exception as e:
@@ -1,12 +1,9 @@
 import uuid
-import os
 from sqlalchemy import desc, join, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import joinedload
 from lib.db_connection import async_session
-# import sync engine and sessionmaker
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from lib.models import JBFSMState, JBSession, JBPluginUUID, JBBot
+from lib.models import JBFSMState, JBSession, JBBot
 
 
 # async def create_user(phone_number: str, first_name: str, last_name: str) -> JBUser:
@@ -31,40 +28,45 @@ from lib.models import JBFSMState, JBSession, JBPluginUUID, JBBot
 #     return None
 
 
-async def get_state_by_pid(pid: str) -> JBFSMState:
-    query = select(JBFSMState).where(JBFSMState.pid == pid)
-    async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(query)
-            state = result.scalars().first()
-            return state
-    return None
+async def get_or_create_state(pid: str) -> JBFSMState:
+    """Load the FSM state row for a session, creating an empty one if missing.
 
-
-async def insert_state(pid: str, state: str, variables: dict = dict()) -> JBFSMState:
-    state_id = str(uuid.uuid4())
-    state = JBFSMState(id=state_id, pid=pid, state=state, variables=variables)
+    Runs as a single ``INSERT ... ON CONFLICT (pid) DO UPDATE ... RETURNING``
+    so concurrent first turns for the same session resolve to the same row.
+    """
+    stmt = insert(JBFSMState).values(
+        id=str(uuid.uuid4()), pid=pid, state="zero", variables={}, version=0
+    )
+    # no-op update so RETURNING yields the existing row on conflict
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[JBFSMState.pid], set_={"pid": stmt.excluded.pid}
+    ).returning(JBFSMState)
     async with async_session() as session:
         async with session.begin():
-            session.add(state)
-            await session.commit()
-            return state
-    return None
-
-
-async def update_state_and_variables(pid: str, state: str, variables: dict) -> JBFSMState:
+            result = await session.execute(
+                stmt, execution_options={"populate_existing": True}
+            )
+            return result.scalars().first()
+
+
+async def save_state(
+    pid: str, state: str, variables: dict, expected_version: int
+) -> bool:
+    """Compare-and-swap save of the FSM state.
+
+    The row is only written if its version still equals ``expected_version``
+    (the version that was loaded at the start of the turn). Returns False if
+    another turn for the same session saved in between.
+    """
+    stmt = (
+        update(JBFSMState)
+        .where(JBFSMState.pid == pid, JBFSMState.version == expected_version)
+        .values(state=state, variables=variables, version=JBFSMState.version + 1)
+    )
     async with async_session() as session:
         async with session.begin():
-            # await session.query(JBFSMState).filter(JBFSMState.pid == pid).update({"state": state, "variables": variables})
-            stmt = (
-                update(JBFSMState)
-                .where(JBFSMState.pid == pid)
-                .values(state=state, variables=variables)
-            )
-            await session.execute(stmt)
-            await session.commit()
-            return state
-    return None
+            result = await session.execute(stmt)
+            return result.rowcount == 1
 
 
 async def get_session_with_bot(session_id:str):
@@ -102,39 +104,3 @@ async def get_pid_by_session_id(session_id: str):
             result = await session.execute(query)
             s = result.scalars().first()
             return s
-
-
-db_name = os.getenv("POSTGRES_DATABASE_NAME")
-db_user = os.getenv("POSTGRES_DATABASE_USERNAME")
-db_password = os.getenv("POSTGRES_DATABASE_PASSWORD")
-db_host = os.getenv("POSTGRES_DATABASE_HOST")
-db_port = os.getenv("POSTGRES_DATABASE_PORT")
-sync_db_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-sync_engine = create_engine(
-    sync_db_url,
-    future=True,
-    echo=False,
-    max_overflow=50,
-    pool_size=25,
-    pool_timeout=60,
-    pool_recycle=3600,
-    pool_pre_ping=True
-)
-
-
-sync_session = sessionmaker(
-    bind=sync_engine, autocommit=False, autoflush=False, expire_on_commit=False
-)
-
-def insert_jb_plugin_uuid(session_id: str, turn_id: str):
-    # Create a query to insert a new row into JBPluginMapping
-    JB_IDENTIFIER = 'jbkey'
-    reference_id = f'{JB_IDENTIFIER}{str(uuid.uuid4())[:25]}{JB_IDENTIFIER}'
-    plugin_uid = JBPluginUUID(id=reference_id, session_id=session_id, turn_id=turn_id)
-
-    with sync_session() as session:
-        with session.begin():
-            session.add(plugin_uid)
-            session.commit()
-            return reference_id
-    return False
\ No newline at end of file
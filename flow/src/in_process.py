@@ -0,0 +1,187 @@
+"""In-process execution of trusted bots.
+
+By default every turn runs the bot in a fresh subprocess of its own venv through
+``fsm_wrapper.py``. For bots we author ourselves that isolation is pure overhead,
+so bots with ``execution_mode == "in_process"`` can instead be imported into the
+flow process once and run on a worker thread.
+
+The bot module is imported from ``bots/<bot_id>/bot.py`` under a private module
+name, so bots never shadow each other or flow's own modules. The file's mtime is
+checked on every turn and the module is re-imported when the bot is reinstalled.
+
+In-process bots run with flow's interpreter and dependencies (not the bot venv)
+and have full access to the flow process, so this must only be enabled for
+trusted code.
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet
+
+logger = logging.getLogger("flow")
+
+IN_PROCESS_EXECUTION_MODE = "in_process"
+
+
+def decrypt_credentials(credentials: dict) -> dict:
+    decrypted_credentials = {}
+    for key in credentials:
+        decrypted_credentials[key] = (
+            Fernet(os.getenv("ENCRYPTION_KEY"))
+            .decrypt(credentials[key].encode())
+            .decode()
+        )
+    return decrypted_credentials
+
+
+def fsm_output_to_dict(fsm_output) -> Dict[str, Any]:
+    """Flatten a jb_manager_bot FSMOutput the same way fsm_wrapper.py does."""
+    output = json.loads(fsm_output.model_dump_json())
+    output["header"] = output["message_data"]["header"]
+    output["footer"] = output["message_data"]["footer"]
+    output["text"] = output["message_data"]["body"]
+    output.pop("message_data")
+    return output
+
+
+class InProcessRunner:
+    def __init__(self, bots_root_directory: Path, max_workers: int = 8):
+        self.bots_root_directory = Path(bots_root_directory)
+        # bots spend most of a turn waiting on LLM/HTTP calls, so threads are enough
+        # and let the send_message callback reach the kafka producer directly
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="fsm"
+        )
+        self._modules: Dict[str, Tuple[int, ModuleType]] = {}
+
+    @classmethod
+    def from_env_vars(cls, bots_root_directory: Path) -> Optional["InProcessRunner"]:
+        """
+        Creates an InProcessRunner from environment variables.
+        Uses the following environment variables:
+        - FLOW_IN_PROCESS_BOTS: allow bots to run in process (default: False)
+        - FLOW_IN_PROCESS_WORKERS: size of the worker thread pool (default: 8)
+        Returns None if in-process execution is not allowed.
+        """
+        enabled = os.getenv("FLOW_IN_PROCESS_BOTS")
+        if not (isinstance(enabled, str) and enabled.lower() == "true"):
+            return None
+        max_workers = int(os.getenv("FLOW_IN_PROCESS_WORKERS", 8))
+        return cls(bots_root_directory, max_workers=max_workers)
+
+    @staticmethod
+    def module_name(bot_id: str) -> str:
+        return "_jb_bot_" + "".join(c if c.isalnum() else "_" for c in bot_id)
+
+    def load(self, bot_id: str) -> ModuleType:
+        """Return the bot module, importing it again if bot.py has changed."""
+        bot_file = self.bots_root_directory / bot_id / "bot.py"
+        mtime = bot_file.stat().st_mtime_ns
+        cached = self._modules.get(bot_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        name = self.module_name(bot_id)
+        spec = importlib.util.spec_from_file_location(name, bot_file)
+        module = importlib.util.module_from_spec(spec)
+        # pydantic and dataclasses resolve annotations through sys.modules
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            sys.modules.pop(name, None)
+            self._modules.pop(bot_id, None)
+            raise
+        self._modules[bot_id] = (mtime, module)
+        logger.info("Loaded bot %s in process", bot_id)
+        return module
+
+    def invalidate(self, bot_id: str):
+        """Drop the cached module, e.g. when the bot is reinstalled."""
+        self._modules.pop(bot_id, None)
+        sys.modules.pop(self.module_name(bot_id), None)
+
+    @staticmethod
+    def _run_machine(
+        bot_class, runner_input: Dict[str, Any], callback: Callable[[Dict], None]
+    ) -> Dict[str, Any]:
+        plugin_variables = {}
+        if runner_input.get("plugin_reference") is not None:
+            plugin_variables["plugin_reference"] = runner_input["plugin_reference"]
+        return bot_class.run_machine(
+            send_message=lambda fsm_output: callback(fsm_output_to_dict(fsm_output)),
+            user_input=runner_input.get("message_text"),
+            callback_input=runner_input.get("callback_input"),
+            state=runner_input.get("state"),
+            credentials=decrypt_credentials(runner_input.get("credentials")),
+            **plugin_variables,
+        )
+
+    async def run(
+        self,
+        bot_id: str,
+        runner_input: Dict[str, Any],
+        callback: Callable[[Dict], None],
+        rag_handler: Optional[Callable[[Dict], Awaitable[Optional[str]]]] = None,
+    ) -> Dict[str, Any]:
+        """Run one turn of the bot and return its new state.
+
+        ``runner_input`` has the same shape as the JSON passed to fsm_wrapper.py and
+        ``callback`` receives each message in the same shape fsm_wrapper.py prints.
+
+        With ``rag_handler`` dest="rag" messages are answered inline, like
+        fsm_wrapper.py does with inline_rag: the search starts while the bot
+        keeps running and the bot is run again with the chunks. Messages the
+        handler returns None for go to ``callback`` instead.
+        """
+        module = self.load(bot_id)
+        bot_class = getattr(module, runner_input["bot_name"])
+        loop = asyncio.get_running_loop()
+        answers = []
+
+        def on_message(message: Dict):
+            if rag_handler is not None and message.get("dest") == "rag":
+                answers.append(
+                    (
+                        message,
+                        asyncio.run_coroutine_threadsafe(rag_handler(message), loop),
+                    )
+                )
+            else:
+                callback(message)
+
+        state = await loop.run_in_executor(
+            self.executor, self._run_machine, bot_class, runner_input, on_message
+        )
+        # each answer is run in the order of the outputs, outputs of these runs
+        # are answered after them
+        while answers:
+            pending, answers = answers, []
+            for message, future in pending:
+                chunks = await asyncio.wrap_future(future)
+                if chunks is None:
+                    callback(message)
+                    continue
+                runner_input = {
+                    **runner_input,
+                    "message_text": chunks,
+                    "callback_input": None,
+                    "state": state,
+                }
+                state = await loop.run_in_executor(
+                    self.executor,
+                    self._run_machine,
+                    bot_class,
+                    runner_input,
+                    on_message,
+                )
+        return state
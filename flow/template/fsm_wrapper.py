@@ -15,13 +15,20 @@ def decrypt_credentials(credentials: dict) -> dict:
     return decrypted_credentials
 
 
+rag_requests = 0
+
+
 def callback_function(fsm_output: FSMOutput):
+    global rag_requests
     output = json.loads(fsm_output.model_dump_json())
     output["header"] = output["message_data"]["header"]
     output["footer"] = output["message_data"]["footer"]
     output["text"] = output["message_data"]["body"]
     output.pop("message_data")
-    print(json.dumps({"callback_message": output}))
+    if inline_rag and output["dest"] == "rag":
+        rag_requests += 1
+    # one message per line, flushed so flow can forward it immediately
+    print(json.dumps({"callback_message": output}), flush=True)
 
 
 runner_input = json.loads(sys.argv[1])
@@ -31,15 +38,40 @@ fsm_state_dict = runner_input.get("state")
 bot_name = runner_input.get("bot_name")
 credentials = runner_input.get("credentials")
 config_env = runner_input.get("config_env")
+inline_rag = runner_input.get("inline_rag", False)
+# the bot finds it in self.variables["plugin_reference"] and hands it to plugins
+plugin_variables = {}
+if runner_input.get("plugin_reference") is not None:
+    plugin_variables["plugin_reference"] = runner_input["plugin_reference"]
 
 jb_bot: AbstractFSM = getattr(bot, bot_name)
+credentials = decrypt_credentials(credentials)
 
 new_state = jb_bot.run_machine(
     send_message=callback_function,
     user_input=message_text,
     callback_input=callback_input,
     state=fsm_state_dict,
-    credentials=decrypt_credentials(credentials),
+    credentials=credentials,
+    **plugin_variables,
 )
 
-print(json.dumps({"new_state": new_state}))
+# with inline_rag flow answers every dest="rag" output with a line on stdin, the
+# chunks or null when it sent the query to the retriever over Kafka instead. The
+# bot takes each answer in this run, in the order of its outputs, as it would
+# take the retriever messages one turn after the other
+while rag_requests:
+    answers = [json.loads(sys.stdin.readline()) for _ in range(rag_requests)]
+    rag_requests = 0
+    for answer in answers:
+        if answer["message_text"] is None:
+            continue
+        new_state = jb_bot.run_machine(
+            send_message=callback_function,
+            user_input=answer["message_text"],
+            state=new_state,
+            credentials=credentials,
+            **plugin_variables,
+        )
+
+print(json.dumps({"new_state": new_state}), flush=True)
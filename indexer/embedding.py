@@ -0,0 +1,233 @@
+"""Embedding stage of the indexer.
+
+Chunks are grouped into requests bounded by input count and token count, and
+several requests run concurrently within a requests per minute and tokens per
+minute budget. Rate limited and transient failures are retried with backoff,
+honouring Retry-After, and a 429 pauses every request, not just the one that
+got it. Collections embedded by a local model (``EmbeddingBackend.LOCAL``) are
+only bounded by batch size and concurrency.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+import openai
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+
+from lib.data_models import EmbeddingBackend
+from lib.local_embeddings import LocalEmbeddings
+from lib.retry import retry_delay
+
+logger = logging.getLogger("indexer")
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def embeddings_from_env_vars(
+    max_batch_size: int, backend: EmbeddingBackend = EmbeddingBackend.OPENAI
+) -> Embeddings:
+    if backend == EmbeddingBackend.LOCAL:
+        return LocalEmbeddings.from_env_vars()
+    # one request per batch and no client side retries, EmbeddingStage retries
+    if os.environ["OPENAI_API_TYPE"] == "azure":
+        return AzureOpenAIEmbeddings(
+            model=OPENAI_EMBEDDING_MODEL,
+            azure_deployment=os.environ["AZURE_DEPLOYMENT_NAME"],
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            openai_api_type=os.environ["OPENAI_API_TYPE"],
+            openai_api_key=os.environ["AZURE_OPENAI_API_KEY"],
+            chunk_size=max_batch_size,
+            max_retries=0,
+        )
+    return OpenAIEmbeddings(client="", chunk_size=max_batch_size, max_retries=0)
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, refilled continuously."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed * self.requests_per_minute / 60,
+        )
+        self._tokens = min(
+            self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int):
+        # a request larger than the whole budget waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                paused = self._paused_until - time.monotonic()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    continue
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                )
+                await asyncio.sleep(wait)
+
+
+class EmbeddingStage:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 256,
+        max_batch_tokens: int = 100000,
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[int] = 3000,
+        tokens_per_minute: Optional[int] = 1000000,
+        max_retries: int = 6,
+        retry_base_delay: float = 1,
+        retry_max_delay: float = 60,
+    ):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        # without a budget requests are not rate limited and tokens are not counted
+        self.limiter = None
+        self.encoding = None
+        if requests_per_minute and tokens_per_minute:
+            self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.slots = asyncio.Semaphore(max_concurrency)
+
+    @classmethod
+    def from_env_vars(
+        cls, backend: EmbeddingBackend = EmbeddingBackend.OPENAI
+    ) -> "EmbeddingStage":
+        """
+        Creates an EmbeddingStage for the backend from environment variables.
+        Uses the following environment variables:
+        - OPENAI_API_TYPE and the matching OpenAI/Azure credentials, or the
+          EMBEDDING_LOCAL_* variables of LocalEmbeddings for the local backend
+        - INDEXER_EMBEDDING_BATCH_SIZE: most chunks in one request (default: 256,
+          older Azure deployments of text-embedding-ada-002 accept 16)
+        - INDEXER_EMBEDDING_BATCH_TOKENS: most tokens in one request (default: 100000)
+        - INDEXER_EMBEDDING_CONCURRENCY: requests in flight (default: 4)
+        - INDEXER_EMBEDDING_RPM: requests per minute budget (default: 3000)
+        - INDEXER_EMBEDDING_TPM: tokens per minute budget (default: 1000000)
+        The budgets do not apply to the local backend.
+        """
+        max_batch_size = int(os.getenv("INDEXER_EMBEDDING_BATCH_SIZE", 256))
+        embeddings = embeddings_from_env_vars(max_batch_size, backend)
+        if backend == EmbeddingBackend.LOCAL:
+            return cls(
+                embeddings,
+                max_batch_size=max_batch_size,
+                max_concurrency=int(os.getenv("INDEXER_EMBEDDING_CONCURRENCY", 4)),
+                requests_per_minute=None,
+                tokens_per_minute=None,
+            )
+        return cls(
+            embeddings,
+            max_batch_size=max_batch_size,
+            max_batch_tokens=int(os.getenv("INDEXER_EMBEDDING_BATCH_TOKENS", 100000)),
+            max_concurrency=int(os.getenv("INDEXER_EMBEDDING_CONCURRENCY", 4)),
+            requests_per_minute=int(os.getenv("INDEXER_EMBEDDING_RPM", 3000)),
+            tokens_per_minute=int(os.getenv("INDEXER_EMBEDDING_TPM", 1000000)),
+        )
+
+    @property
+    def model(self) -> str:
+        """Saved with the collection, its queries must be embedded by the same model."""
+        return getattr(self.embeddings, "model", None) or OPENAI_EMBEDDING_MODEL
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return 0
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def batches(self, texts: List[str]) -> List[Tuple[List[int], int]]:
+        """Indexes of ``texts`` grouped into requests, with their token counts."""
+        batches, batch, batch_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if batch and (
+                len(batch) == self.max_batch_size
+                or batch_tokens + tokens > self.max_batch_tokens
+            ):
+                batches.append((batch, batch_tokens))
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += tokens
+        if batch:
+            batches.append((batch, batch_tokens))
+        return batches
+
+    async def _embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                async with self.slots:
+                    if self.limiter is not None:
+                        await self.limiter.acquire(tokens)
+                    return await self.embeddings.aembed_documents(texts)
+            except _RETRYABLE_ERRORS as error:
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(
+                    attempt, error, self.retry_base_delay, self.retry_max_delay
+                )
+                if (
+                    isinstance(error, openai.RateLimitError)
+                    and self.limiter is not None
+                ):
+                    self.limiter.pause(delay)
+                logger.warning(
+                    "Embedding request failed (%s), retrying in %.1fs", error, delay
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds ``texts`` in concurrent requests, in the same order."""
+        batches = self.batches(texts)
+        results = await asyncio.gather(
+            *(
+                self._embed_batch([texts[i] for i in batch], tokens)
+                for batch, tokens in batches
+            )
+        )
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for (batch, _), batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
@@ -1,73 +1,86 @@
 import asyncio
+import hashlib
 import json
 import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import asyncpg
-import docx2txt
-import fitz
-import pandas as pd
 from dotenv import load_dotenv
+from embedding import OPENAI_EMBEDDING_MODEL, EmbeddingStage
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
 from langchain_postgres.vectorstores import PGVector
 from model import InternalServerException
+from parsing import ParallelParser, ParsedFile, ParseError, ParseStats
+from pgvector.asyncpg import register_vector
 
-from lib.data_models import IndexerInput
-from lib.kafka_utils import KafkaConsumer
+from lib.data_models import EmbeddingBackend, IndexerInput, VectorQuantization
 
 load_dotenv()
 
-kafka_bootstrap_servers = os.getenv("KAFKA_BROKER")
-kafka_topic = os.getenv("KAFKA_CONSUMER_TOPIC")
-print("kafka_bootstrap_servers", kafka_bootstrap_servers)
-print("kafka", kafka_topic)
-consumer = KafkaConsumer.from_env_vars(
-    group_id="test_grp_id", auto_offset_reset="latest"
-)
+# partial HNSW index per quantized collection, the retriever orders by the same
+# expressions and re-ranks the candidates by the full precision embedding
+QUANTIZED_INDEXES = {
+    VectorQuantization.HALFVEC: "(embedding::halfvec(1536)) halfvec_cosine_ops",
+    VectorQuantization.BINARY: "(binary_quantize(embedding)::bit(1536)) bit_hamming_ops",
+}
 
 
-def docx_parser(docx_file_path):
-    text = docx2txt.process(docx_file_path)
-    return text
+def per_collection_from_env_var(env_var: str, enum_type):
+    """Parses "collection:value" pairs, e.g. "KB_Law_Files:binary,faq:halfvec";
+    "*:halfvec" applies to every collection."""
+    values = {}
+    for entry in os.getenv(env_var, "").split(","):
+        if entry.strip():
+            collection_name, _, value = entry.partition(":")
+            values[collection_name.strip()] = enum_type(value.strip())
+    return values
 
 
-def pdf_parser(pdf_file_path):
-    doc = fitz.open(pdf_file_path)
-    content = "\n"
-    for page in doc:
-        text = page.get_text("text", textpage=None, sort=False)
-        content += text
-    return content
+def quantization_from_env_vars():
+    """INDEXER_QUANTIZATION maps collections to a quantization."""
+    return per_collection_from_env_var("INDEXER_QUANTIZATION", VectorQuantization)
 
 
-def xlsx_parser(excel_file_path):
-    df = pd.read_excel(excel_file_path)
-    text = df.to_string(index=False)
-    return text
+def embedding_backend_from_env_vars():
+    """INDEXER_EMBEDDING_BACKEND maps collections to an embedding backend, e.g.
+    "faq:local" or "*:local" for offline indexing; OpenAI otherwise."""
+    return per_collection_from_env_var("INDEXER_EMBEDDING_BACKEND", EmbeddingBackend)
 
 
-def json_parser(json_file_path):
-    file = open(json_file_path, "r")
-    data = json.load(file)
-    text = json.dumps(data, indent=4)
-    return text
+def sha256_text(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
 
 
-class TextConverter:
-    async def textify(self, filepath: str) -> str:
-        if filepath.endswith(".pdf"):
-            content = pdf_parser(filepath)
-        elif filepath.endswith(".docx"):
-            content = docx_parser(filepath)
-        elif filepath.endswith(".xlsx"):
-            content = xlsx_parser(filepath)
-        elif filepath.endswith(".json"):
-            content = json_parser(filepath)
-        else:
-            with open(filepath, "r") as f:
-                content = f.read()
-        return content
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class IndexingProgress:
+    """What an indexing run has done so far, saved with its job by the heartbeat."""
+
+    def __init__(self, files: List[str]):
+        self.files: Dict[str, Dict[str, Any]] = {
+            file: {"status": "queued"} for file in files
+        }
+        self.chunks_total: Optional[int] = None
+        self.chunks_embedded = 0
+        self.chunks_reused = 0
+        self.chunks_deleted: Optional[int] = None
+        self.started = time.monotonic()
+
+    def eta_seconds(self) -> Optional[float]:
+        done = self.chunks_embedded + self.chunks_reused
+        if not self.chunks_total or not done:
+            return None
+        elapsed = time.monotonic() - self.started
+        return max(self.chunks_total - done, 0) * elapsed / done
 
 
 class LangchainIndexer:
@@ -81,79 +94,534 @@ class LangchainIndexer:
         self.db_host = os.getenv("POSTGRES_DATABASE_HOST")
         self.db_port = os.getenv("POSTGRES_DATABASE_PORT")
         self.db_url = f"postgresql+psycopg2://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
-        self.text_converter = TextConverter()
+        self.parser = ParallelParser.from_env_vars()
+        # chunks embedded and written at a time, bounds the memory of an indexing job
+        self.write_batch_size = int(os.getenv("INDEXER_WRITE_BATCH_SIZE", 256))
+        self.max_batches_in_flight = int(
+            os.getenv("INDEXER_WRITE_BATCHES_IN_FLIGHT", 4)
+        )
+        # index builds after a load
+        self.maintenance_work_mem_mb = int(
+            os.getenv("INDEXER_MAINTENANCE_WORK_MEM_MB", 1024)
+        )
+        self.maintenance_workers = int(os.getenv("INDEXER_MAINTENANCE_WORKERS", 2))
+        # share of a quantized collection that has to change for its index to be
+        # rebuilt, and of the table that a load has to add to rebuild the shared one
+        self.rebuild_fraction = float(os.getenv("INDEXER_INDEX_REBUILD_FRACTION", 0.3))
+        self.quantization = quantization_from_env_vars()
+        self.embedding_backends = embedding_backend_from_env_vars()
+        # collections that are all quantized do not need the float32 HNSW index, without
+        # it the others are searched exactly within their collection
+        full_precision_index = os.getenv("INDEXER_FULL_PRECISION_INDEX", "true")
+        self.full_precision_index = full_precision_index.lower() != "false"
+        # shared by the jobs running at the same time, so they split one rate budget
+        self.embedders: Dict[EmbeddingBackend, EmbeddingStage] = {}
 
-    async def create_pg_vector_index_if_not_exists(self):
-        # Establish an asynchronous connection to the database
-        print("Inside create_pg_vector_index_if_not_exists")
-        connection = await asyncpg.connect(
+    def get_embedder(self, backend: EmbeddingBackend) -> EmbeddingStage:
+        if backend not in self.embedders:
+            self.embedders[backend] = EmbeddingStage.from_env_vars(backend)
+        return self.embedders[backend]
+
+    def get_quantization(self, indexer_input: IndexerInput):
+        if indexer_input.quantization is not None:
+            return indexer_input.quantization
+        return self.quantization.get(
+            indexer_input.collection_name, self.quantization.get("*")
+        )
+
+    def get_embedding_backend(self, indexer_input: IndexerInput) -> EmbeddingBackend:
+        if indexer_input.embedding_backend is not None:
+            return indexer_input.embedding_backend
+        return self.embedding_backends.get(
+            indexer_input.collection_name,
+            self.embedding_backends.get("*", EmbeddingBackend.OPENAI),
+        )
+
+    async def connect(self) -> asyncpg.Connection:
+        return await asyncpg.connect(
             host=self.db_host,
             user=self.db_user,
             password=self.db_password,
             database=self.db_name,
             port=self.db_port,
         )
+
+    async def ensure_index(
+        self, connection: asyncpg.Connection, name: str, definition: str
+    ):
+        """Builds the index without blocking writes, replacing an invalid one left
+        behind by a failed concurrent build."""
+        valid = await connection.fetchval(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = $1",
+            name,
+        )
+        if valid:
+            return
+        if valid is not None:
+            await connection.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        await connection.execute(
+            f"CREATE INDEX CONCURRENTLY {name} ON langchain_pg_embedding {definition}"
+        )
+
+    async def create_pg_vector_index_if_not_exists(
+        self,
+        collection_name: str = None,
+        quantization: VectorQuantization = None,
+        rebuild: bool = False,
+    ):
+        """Builds the indexes of the vector store after a load.
+
+        The tables, the column type and the shared indexes come from the
+        7b1d2e9c4f60 migration. Indexes are built CONCURRENTLY, outside of a
+        transaction, so searches and loads of other collections keep running.
+        With ``rebuild`` the quantized index of the collection is built anew
+        next to the old one and swapped in, instead of keeping the graph that
+        was patched row by row during the load. The shared full precision index
+        is built here too when ``drop_full_precision_index_for_load`` dropped it.
+        """
+        print("Inside create_pg_vector_index_if_not_exists")
+        connection = await self.connect()
         try:
-            # Create an asynchronous cursor object to interact with the database
-            async with connection.transaction():
-                # Execute the alter table query
-                await connection.execute(
-                    "ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE vector(1536)"
+            await connection.execute(
+                f"SET maintenance_work_mem = '{int(self.maintenance_work_mem_mb)}MB'"
+            )
+            await connection.execute(
+                f"SET max_parallel_maintenance_workers = {int(self.maintenance_workers)}"
+            )
+            if self.full_precision_index:
+                await self.ensure_index(
+                    connection,
+                    "langchain_embeddings_hnsw",
+                    "USING hnsw (embedding vector_cosine_ops)",
                 )
+            else:
                 await connection.execute(
-                    "CREATE INDEX IF NOT EXISTS langchain_embeddings_hnsw ON langchain_pg_embedding USING hnsw (embedding vector_cosine_ops)"
+                    "DROP INDEX CONCURRENTLY IF EXISTS langchain_embeddings_hnsw"
+                )
+            if collection_name is not None and quantization is not None:
+                collection_id = await connection.fetchval(
+                    "SELECT uuid FROM langchain_pg_collection WHERE name = $1",
+                    collection_name,
+                )
+                index_name = (
+                    f"langchain_embeddings_{quantization.value}_{collection_id.hex}"
                 )
+                # a literal predicate, so that the planner can match it at plan time
+                definition = (
+                    f"USING hnsw ({QUANTIZED_INDEXES[quantization]}) "
+                    f"WHERE collection_id = '{collection_id}'::uuid"
+                )
+                exists = await connection.fetchval("SELECT to_regclass($1)", index_name)
+                if rebuild and exists is not None:
+                    new_name = f"langchain_embeddings_rebuild_{collection_id.hex}"
+                    await connection.execute(
+                        f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}"
+                    )
+                    await self.ensure_index(connection, new_name, definition)
+                    # searches use whichever of the two matches while the old one goes
+                    await connection.execute(f"DROP INDEX CONCURRENTLY {index_name}")
+                    await connection.execute(
+                        f"ALTER INDEX {new_name} RENAME TO {index_name}"
+                    )
+                else:
+                    await self.ensure_index(connection, index_name, definition)
+            await self.drop_stale_quantized_indexes(connection)
         finally:
             # Close the connection
             await connection.close()
 
-    async def index(self, indexer_input: IndexerInput):
-        source_chunks = []
-        counter = 0
-        for file in indexer_input.files:
-            file_path = os.path.join(os.environ["DOCUMENT_LOCAL_STORAGE_PATH"], file)
-            print("file_path", file_path)
-            content = await self.text_converter.textify(file_path)
-            for chunk in self.splitter.split_text(content):
-                new_metadata = {
-                    "chunk-id": str(counter),
-                    "document_name": file,
-                }
-                source_chunks.append(
-                    Document(page_content=chunk, metadata=new_metadata)
+    async def drop_full_precision_index_for_load(
+        self, collection_name: str, chunks_total: int
+    ) -> bool:
+        """Drops the shared HNSW index before a load that adds a large share of the
+        table, so that the INSERTs do not patch its graph row by row. It is built
+        again, in one pass, by ``create_pg_vector_index_if_not_exists``.
+
+        The chunks the collection does not hold yet are estimated from its row
+        count, and compared with ``rebuild_fraction`` of the table size planner
+        estimate. Until the index is back, the other full precision collections
+        are searched exactly. Returns whether the index was dropped.
+        """
+        if not self.full_precision_index:
+            return False
+        connection = await self.connect()
+        try:
+            table_rows = await connection.fetchval(
+                "SELECT greatest(reltuples, 0)::bigint FROM pg_class "
+                "WHERE oid = 'langchain_pg_embedding'::regclass"
+            )
+            collection_rows = await connection.fetchval(
+                "SELECT count(*) FROM langchain_pg_embedding e "
+                "JOIN langchain_pg_collection c ON c.uuid = e.collection_id "
+                "WHERE c.name = $1",
+                collection_name,
+            )
+            new_rows = chunks_total - collection_rows
+            if new_rows <= self.rebuild_fraction * max(table_rows, 1):
+                return False
+            print(
+                f"Collection {collection_name}: about {new_rows} new chunks in a table "
+                f"of {table_rows}, dropping langchain_embeddings_hnsw for the load"
+            )
+            await connection.execute(
+                "DROP INDEX CONCURRENTLY IF EXISTS langchain_embeddings_hnsw"
+            )
+            return True
+        finally:
+            await connection.close()
+
+    async def drop_stale_quantized_indexes(self, connection):
+        """Drop the quantized indexes of deleted collections and of collections
+        whose quantization changed."""
+        wanted = {
+            f"langchain_embeddings_{row['quantization']}_{row['uuid'].hex}"
+            for row in await connection.fetch(
+                "SELECT uuid, cmetadata->>'quantization' AS quantization "
+                "FROM langchain_pg_collection"
+            )
+        }
+        indexes = await connection.fetch(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'langchain_pg_embedding' "
+            "AND indexname ~ '^langchain_embeddings_(halfvec|binary)_[0-9a-f]{32}$'"
+        )
+        for row in indexes:
+            if row["indexname"] not in wanted:
+                await connection.execute(
+                    f"DROP INDEX CONCURRENTLY IF EXISTS {row['indexname']}"
                 )
-                counter += 1
+
+    def iter_chunks(
+        self, indexer_input: IndexerInput, parsed_files: Dict[str, ParsedFile]
+    ) -> Iterator[Tuple[Document, str]]:
+        """Yields (chunk, id) one section at a time, in the order of the files in
+        the request, with the page or rows the chunk came from in its metadata."""
+        counter = 0
+        # a file listed twice would give the same ids twice
+        for file in dict.fromkeys(indexer_input.files):
+            parsed = parsed_files[file]
+            occurrences = Counter()
+            for section in self.parser.read_sections(parsed):
+                for chunk in self.splitter.split_text(section.text):
+                    chunk_hash = sha256_text(chunk)
+                    occurrences[chunk_hash] += 1
+                    new_metadata = {
+                        "chunk-id": str(counter),
+                        "document_name": file,
+                        "document_hash": parsed.file_hash,
+                        "chunk_hash": chunk_hash,
+                        **section.metadata,
+                    }
+                    # stable across re-indexing while the chunk text is unchanged, ids
+                    # are unique across collections so the collection name is part of it
+                    chunk_id = sha256_text(
+                        f"{indexer_input.collection_name}\x00{file}\x00"
+                        f"{chunk_hash}\x00{occurrences[chunk_hash]}"
+                    )
+                    yield Document(page_content=chunk, metadata=new_metadata), chunk_id
+                    counter += 1
+
+    async def write_chunks(
+        self,
+        connection: asyncpg.Connection,
+        collection_id,
+        chunks: List[Tuple[Document, str]],
+        vectors: List[List[float]],
+    ):
+        """COPYs embedded chunks into a staging table and moves them into the collection."""
+        await connection.copy_records_to_table(
+            "indexer_new_chunks",
+            records=[
+                (chunk_id, vector, document.page_content, json.dumps(document.metadata))
+                for (document, chunk_id), vector in zip(chunks, vectors)
+            ],
+        )
+        async with connection.transaction():
+            await connection.execute(
+                """
+                INSERT INTO langchain_pg_embedding (id, collection_id, embedding, document, cmetadata)
+                SELECT id, $1, embedding, document, cmetadata FROM indexer_new_chunks
+                ON CONFLICT (id) DO UPDATE SET
+                    collection_id = EXCLUDED.collection_id,
+                    embedding = EXCLUDED.embedding,
+                    document = EXCLUDED.document,
+                    cmetadata = EXCLUDED.cmetadata
+                """,
+                collection_id,
+            )
+            await connection.execute("TRUNCATE indexer_new_chunks")
+
+    async def sync_collection(
+        self,
+        db: PGVector,
+        embedder: EmbeddingStage,
+        chunks: Iterator[Tuple[Document, str]],
+        collection_metadata: dict,
+        progress: Optional[IndexingProgress] = None,
+    ):
+        """Makes the collection hold exactly ``chunks``, embedding only the ones it
+        does not have yet and deleting the ones that are gone.
+
+        Chunks are read in batches of ``write_batch_size``. The ids seen so far go
+        to a temporary table rather than memory, and chunks whose ids are not in it
+        are deleted at the end. New chunks of a few batches are embedded
+        concurrently while the next batches are read.
+
+        Every batch is committed as it is written, a run that is interrupted
+        and started again embeds only the chunks that were not written yet.
+        """
+        progress = progress if progress is not None else IndexingProgress([])
+        connection = await self.connect()
         try:
-            if os.environ["OPENAI_API_TYPE"] == "azure":
-                embeddings = AzureOpenAIEmbeddings(
-                    model="text-embedding-ada-002",
-                    azure_deployment=os.environ["AZURE_DEPLOYMENT_NAME"],
-                    azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-                    openai_api_type=os.environ["OPENAI_API_TYPE"],
-                    openai_api_key=os.environ["AZURE_OPENAI_API_KEY"],
+            await register_vector(connection)
+            collection_id = await connection.fetchval(
+                "SELECT uuid FROM langchain_pg_collection WHERE name = $1",
+                db.collection_name,
+            )
+            # chunks embedded by another model are in another vector space, none can be reused
+            previous_model = await connection.fetchrow(
+                "SELECT coalesce(cmetadata->>'embedding_backend', $2) AS backend, "
+                "coalesce(cmetadata->>'embedding_model', $3) AS model "
+                "FROM langchain_pg_collection WHERE uuid = $1",
+                collection_id,
+                EmbeddingBackend.OPENAI.value,
+                OPENAI_EMBEDDING_MODEL,
+            )
+            if (previous_model["backend"], previous_model["model"]) != (
+                collection_metadata["embedding_backend"],
+                collection_metadata["embedding_model"],
+            ):
+                print(
+                    f"Collection {db.collection_name}: embedding model changed from "
+                    f"{previous_model['backend']}:{previous_model['model']}, re-embedding"
                 )
-            else:
-                embeddings = OpenAIEmbeddings(client="")
-            db = PGVector.from_documents(
-                embedding=embeddings,
-                documents=source_chunks,
+                async with connection.transaction():
+                    await connection.execute(
+                        "DELETE FROM langchain_pg_embedding WHERE collection_id = $1",
+                        collection_id,
+                    )
+                    # a resumed job keeps what it embedded with the new model
+                    await connection.execute(
+                        "UPDATE langchain_pg_collection SET cmetadata = $2::json WHERE uuid = $1",
+                        collection_id,
+                        json.dumps(collection_metadata),
+                    )
+            # dropped with the connection
+            await connection.execute(
+                "CREATE TEMPORARY TABLE indexer_seen_ids (id varchar)"
+            )
+            await connection.execute(
+                "CREATE TEMPORARY TABLE indexer_new_chunks "
+                "(id varchar, embedding vector, document varchar, cmetadata jsonb)"
+            )
+            # the connection runs one statement at a time
+            db_lock = asyncio.Lock()
+            # batches waiting for embeddings, bounds the memory of an indexing job
+            in_flight = asyncio.Semaphore(self.max_batches_in_flight)
+            tasks = set()
+
+            async def embed_and_write(new: List[Tuple[Document, str]]):
+                try:
+                    vectors = await embedder.embed(
+                        [document.page_content for document, _ in new]
+                    )
+                    async with db_lock:
+                        await self.write_chunks(connection, collection_id, new, vectors)
+                    progress.chunks_embedded += len(new)
+                finally:
+                    in_flight.release()
+
+            embedded = reused = 0
+            batches = batched(chunks, self.write_batch_size)
+            try:
+                # splitting is CPU bound, batches are read off the event loop
+                while batch := await asyncio.to_thread(next, batches, None):
+                    # an INSERT cannot update the same row twice
+                    unique = {}
+                    for document, chunk_id in batch:
+                        unique.setdefault(chunk_id, (document, chunk_id))
+                    batch = list(unique.values())
+                    ids = [chunk_id for _, chunk_id in batch]
+                    async with db_lock:
+                        await connection.copy_records_to_table(
+                            "indexer_seen_ids",
+                            records=[(chunk_id,) for chunk_id in ids],
+                        )
+                        existing = {
+                            row["id"]: json.loads(row["cmetadata"] or "{}")
+                            for row in await connection.fetch(
+                                "SELECT id, cmetadata FROM langchain_pg_embedding "
+                                "WHERE collection_id = $1 AND id = ANY($2::varchar[])",
+                                collection_id,
+                                ids,
+                            )
+                        }
+                        # unchanged chunks keep their embedding, only chunk-id may have moved
+                        moved = [
+                            (chunk_id, json.dumps(document.metadata))
+                            for document, chunk_id in batch
+                            if chunk_id in existing
+                            and existing[chunk_id] != document.metadata
+                        ]
+                        if moved:
+                            await connection.executemany(
+                                "UPDATE langchain_pg_embedding SET cmetadata = $2::jsonb WHERE id = $1",
+                                moved,
+                            )
+                    new = [
+                        (document, chunk_id)
+                        for document, chunk_id in batch
+                        if chunk_id not in existing
+                    ]
+                    embedded += len(new)
+                    reused += len(batch) - len(new)
+                    progress.chunks_reused += len(batch) - len(new)
+                    if new:
+                        await in_flight.acquire()
+                        tasks.add(asyncio.create_task(embed_and_write(new)))
+                    # fail as soon as a batch fails rather than after reading everything
+                    for task in [task for task in tasks if task.done()]:
+                        tasks.discard(task)
+                        task.result()
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            await connection.execute("ANALYZE indexer_seen_ids")
+            async with connection.transaction():
+                stale = await connection.fetchval(
+                    """
+                    WITH deleted AS (
+                        DELETE FROM langchain_pg_embedding e
+                        WHERE e.collection_id = $1
+                        AND NOT EXISTS (SELECT 1 FROM indexer_seen_ids s WHERE s.id = e.id)
+                        RETURNING 1
+                    )
+                    SELECT count(*) FROM deleted
+                    """,
+                    collection_id,
+                )
+                # the retriever drops cached results of the collection when indexed_at changes
+                await connection.execute(
+                    "UPDATE langchain_pg_collection SET cmetadata = $2::json WHERE uuid = $1",
+                    collection_id,
+                    json.dumps(collection_metadata),
+                )
+            progress.chunks_deleted = stale
+            print(
+                f"Collection {db.collection_name}: {embedded} chunks embedded, "
+                f"{reused} reused, {stale} deleted"
+            )
+            return embedded, reused, stale
+        finally:
+            await connection.close()
+
+    def count_chunks(
+        self, indexer_input: IndexerInput, parsed_files: Dict[str, ParsedFile]
+    ) -> Counter:
+        """Chunks per file, read from the section cache without embedding anything."""
+        return Counter(
+            document.metadata["document_name"]
+            for document, _ in self.iter_chunks(indexer_input, parsed_files)
+        )
+
+    async def index(
+        self, indexer_input: IndexerInput, progress: Optional[IndexingProgress] = None
+    ):
+        progress = (
+            progress if progress is not None else IndexingProgress(indexer_input.files)
+        )
+        file_paths = {
+            os.path.join(os.environ["DOCUMENT_LOCAL_STORAGE_PATH"], file): file
+            for file in indexer_input.files
+        }
+        # every file is parsed into the section cache before the collection is touched
+        parsed_files = {}
+        stats = ParseStats()
+        try:
+            async for parsed in self.parser.parse(list(file_paths), stats):
+                print("file_path", parsed.file_path)
+                file = file_paths[parsed.file_path]
+                parsed_files[file] = parsed
+                progress.files[file] = {
+                    "status": "parsed",
+                    "cached": parsed.cached,
+                    "seconds": round(parsed.seconds, 3),
+                }
+        except ParseError as e:
+            progress.files[file_paths[e.file_path]] = {
+                "status": "failed",
+                "error": e.message,
+            }
+            raise InternalServerException(f"Error parsing documents: {e}")
+        except Exception as e:
+            raise InternalServerException(f"Error parsing documents: {e}")
+        finally:
+            for line in stats.summary():
+                print("Parsed", line)
+
+        # a cheap pass over the cached sections, it gives the job its total and ETA
+        chunks_per_file = await asyncio.to_thread(
+            self.count_chunks, indexer_input, parsed_files
+        )
+        progress.chunks_total = sum(chunks_per_file.values())
+        for file in indexer_input.files:
+            progress.files[file]["chunks"] = chunks_per_file[file]
+
+        quantization = self.get_quantization(indexer_input)
+        backend = self.get_embedding_backend(indexer_input)
+        try:
+            embedder = self.get_embedder(backend)
+        except Exception as e:
+            raise InternalServerException(
+                f"Error loading {backend.value} embeddings: {e}"
+            )
+        collection_metadata = {
+            "indexed_at": datetime.now(timezone.utc).isoformat(),
+            # the retriever embeds the queries of the collection with the same model
+            "embedding_backend": backend.value,
+            "embedding_model": embedder.model,
+        }
+        if quantization is not None:
+            # tells the retriever to search the quantized index of the collection
+            collection_metadata["quantization"] = quantization.value
+        try:
+            # creates the collection if it does not exist yet
+            db = PGVector(
+                embeddings=embedder.embeddings,
                 collection_name=indexer_input.collection_name,
                 connection=self.db_url,
-                pre_delete_collection=True,  # delete collection if it already exists
+                collection_metadata=collection_metadata,
+                # the extension and the tables come from the migrations
+                create_extension=False,
+            )
+            dropped = await self.drop_full_precision_index_for_load(
+                indexer_input.collection_name, progress.chunks_total
             )
+            try:
+                embedded, reused, stale = await self.sync_collection(
+                    db,
+                    embedder,
+                    self.iter_chunks(indexer_input, parsed_files),
+                    collection_metadata,
+                    progress,
+                )
+            except Exception:
+                # the other collections must not be left without their index
+                if dropped:
+                    await self.create_pg_vector_index_if_not_exists()
+                raise
             print(
                 f"Embeddings have been created for the collection: {db.collection_name}"
             )
-            await self.create_pg_vector_index_if_not_exists()
+            changed = embedded + stale
+            await self.create_pg_vector_index_if_not_exists(
+                indexer_input.collection_name,
+                quantization,
+                rebuild=changed > self.rebuild_fraction * max(embedded + reused, 1),
+            )
         except Exception as e:
             raise InternalServerException(e.__str__())
-
-
-langchain_indexer = LangchainIndexer()
-while True:
-    message = consumer.receive_message(kafka_topic)
-    print("Indexer Message:", message)
-    data = json.loads(message)
-    indexer_input = IndexerInput(**data)
-
-    asyncio.run(langchain_indexer.index(indexer_input))
+        for file in indexer_input.files:
+            progress.files[file]["status"] = "indexed"
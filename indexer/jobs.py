@@ -0,0 +1,360 @@
+"""Indexing jobs, persisted in the jb_indexer_job table.
+
+A Kafka message only enqueues a job. Up to INDEXER_MAX_JOBS jobs are indexed at
+the same time, at most one per collection, and a running job saves its progress
+(per file status, chunks embedded, ETA) with every heartbeat.
+
+A job whose worker stops heartbeating, because the indexer crashed or was
+redeployed, is claimed again and resumes where it stopped: parsed files come
+from the section cache and chunks that were already written keep their
+embeddings, only the rest is embedded.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import uuid
+from typing import Optional, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+from indexing import IndexingProgress, LangchainIndexer
+
+from lib.data_models import IndexerInput
+from lib.kafka_utils import KafkaConsumer
+
+load_dotenv()
+
+kafka_bootstrap_servers = os.getenv("KAFKA_BROKER")
+kafka_topic = os.getenv("KAFKA_CONSUMER_TOPIC")
+
+# a running job is stale when its heartbeat is older than the timeout
+_STALE = "heartbeat_at < now() - make_interval(secs => $1)"
+# longest wait between retries of a consumer or worker loop that failed
+_MAX_RETRY_DELAY = 60
+
+
+class JobQueue:
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        worker: str,
+        heartbeat_timeout: float = 120,
+        max_attempts: int = 3,
+    ):
+        self.pool = pool
+        self.worker = worker
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_env_vars(cls, pool: asyncpg.Pool) -> "JobQueue":
+        """
+        Creates a JobQueue from environment variables.
+        Uses the following environment variables:
+        - HOSTNAME: name of this indexer, saved with the jobs it runs (default: host name)
+        - INDEXER_JOB_HEARTBEAT_TIMEOUT: seconds without a heartbeat after which a
+          running job is claimed again (default: 120)
+        - INDEXER_JOB_MAX_ATTEMPTS: times a job is claimed before it is failed (default: 3)
+        """
+        hostname = os.getenv("HOSTNAME", socket.gethostname())
+        return cls(
+            pool,
+            worker=f"{hostname}:{os.getpid()}",
+            heartbeat_timeout=float(os.getenv("INDEXER_JOB_HEARTBEAT_TIMEOUT", 120)),
+            max_attempts=int(os.getenv("INDEXER_JOB_MAX_ATTEMPTS", 3)),
+        )
+
+    async def enqueue(self, job_id: str, indexer_input: IndexerInput):
+        """Adds the job, or queues a failed job with the same id again. A message
+        delivered twice does not index the collection twice."""
+        await self.pool.execute(
+            """
+            INSERT INTO jb_indexer_job (id, collection_name, status, request, files)
+            VALUES ($1, $2, 'queued', $3::json, $4::json)
+            ON CONFLICT (id) DO UPDATE SET
+                status = 'queued',
+                request = EXCLUDED.request,
+                files = EXCLUDED.files,
+                attempts = 0,
+                error = NULL,
+                finished_at = NULL,
+                updated_at = now()
+            WHERE jb_indexer_job.status = 'failed'
+            """,
+            job_id,
+            indexer_input.collection_name,
+            indexer_input.model_dump_json(),
+            json.dumps(IndexingProgress(indexer_input.files).files),
+        )
+
+    async def claim(self) -> Optional[Tuple[str, IndexerInput, int]]:
+        """Takes the oldest queued or stale job of a collection that no other
+        worker is indexing, or returns None."""
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                # claims are serialized, two workers must not both see a collection as idle
+                await connection.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext('jb_indexer_job'))"
+                )
+                await connection.execute(
+                    f"""
+                    UPDATE jb_indexer_job SET
+                        status = 'failed',
+                        error = 'Indexer stopped during the job ' || attempts || ' times',
+                        finished_at = now(),
+                        updated_at = now()
+                    WHERE status = 'running' AND {_STALE} AND attempts >= $2
+                    """,
+                    self.heartbeat_timeout,
+                    self.max_attempts,
+                )
+                row = await connection.fetchrow(
+                    f"""
+                    UPDATE jb_indexer_job SET
+                        status = 'running',
+                        worker = $2,
+                        attempts = attempts + 1,
+                        heartbeat_at = now(),
+                        started_at = coalesce(started_at, now()),
+                        updated_at = now()
+                    WHERE id = (
+                        SELECT j.id FROM jb_indexer_job j
+                        WHERE (j.status = 'queued' OR (j.status = 'running' AND j.{_STALE}))
+                        AND NOT EXISTS (
+                            SELECT 1 FROM jb_indexer_job r
+                            WHERE r.collection_name = j.collection_name AND r.id <> j.id
+                            AND r.status = 'running' AND NOT r.{_STALE}
+                        )
+                        ORDER BY j.created_at
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, request, attempts
+                    """,
+                    self.heartbeat_timeout,
+                    self.worker,
+                )
+        if row is None:
+            return None
+        return (
+            row["id"],
+            IndexerInput.model_validate_json(row["request"]),
+            row["attempts"],
+        )
+
+    async def save_progress(self, job_id: str, progress: IndexingProgress) -> bool:
+        """Heartbeat of a running job. False when the job is no longer ours,
+        it was claimed again after missing heartbeats."""
+        eta = progress.eta_seconds()
+        status = await self.pool.execute(
+            """
+            UPDATE jb_indexer_job SET
+                files = $3::json,
+                chunks_total = $4,
+                chunks_embedded = $5,
+                chunks_reused = $6,
+                heartbeat_at = now(),
+                estimated_finish_at = now() + make_interval(secs => $7),
+                updated_at = now()
+            WHERE id = $1 AND worker = $2 AND status = 'running'
+            """,
+            job_id,
+            self.worker,
+            json.dumps(progress.files),
+            progress.chunks_total,
+            progress.chunks_embedded,
+            progress.chunks_reused,
+            eta,
+        )
+        return status != "UPDATE 0"
+
+    async def finish(
+        self, job_id: str, progress: IndexingProgress, error: Optional[str] = None
+    ):
+        await self.pool.execute(
+            """
+            UPDATE jb_indexer_job SET
+                status = $3,
+                error = $4,
+                files = $5::json,
+                chunks_total = $6,
+                chunks_embedded = $7,
+                chunks_reused = $8,
+                chunks_deleted = $9,
+                estimated_finish_at = NULL,
+                finished_at = now(),
+                updated_at = now()
+            WHERE id = $1 AND worker = $2
+            """,
+            job_id,
+            self.worker,
+            "failed" if error is not None else "completed",
+            error,
+            json.dumps(progress.files),
+            progress.chunks_total,
+            progress.chunks_embedded,
+            progress.chunks_reused,
+            progress.chunks_deleted,
+        )
+
+
+class JobRunner:
+    def __init__(
+        self,
+        queue: JobQueue,
+        indexer: LangchainIndexer,
+        max_jobs: int = 2,
+        heartbeat_interval: float = 10,
+        poll_interval: float = 5,
+    ):
+        self.queue = queue
+        self.indexer = indexer
+        self.max_jobs = max_jobs
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.wake = asyncio.Event()
+
+    @classmethod
+    def from_env_vars(cls, queue: JobQueue, indexer: LangchainIndexer) -> "JobRunner":
+        """
+        Creates a JobRunner from environment variables.
+        Uses the following environment variables:
+        - INDEXER_MAX_JOBS: jobs indexed at the same time (default: 2)
+        - INDEXER_JOB_HEARTBEAT_INTERVAL: seconds between progress updates (default: 10)
+        - INDEXER_JOB_POLL_INTERVAL: seconds between looks for jobs left by
+          other indexers (default: 5)
+        """
+        return cls(
+            queue,
+            indexer,
+            max_jobs=int(os.getenv("INDEXER_MAX_JOBS", 2)),
+            heartbeat_interval=float(os.getenv("INDEXER_JOB_HEARTBEAT_INTERVAL", 10)),
+            poll_interval=float(os.getenv("INDEXER_JOB_POLL_INTERVAL", 5)),
+        )
+
+    def retry_delay(self, failures: int) -> float:
+        return min(self.poll_interval * 2 ** (failures - 1), _MAX_RETRY_DELAY)
+
+    async def consume(self, consumer: KafkaConsumer):
+        failures = 0
+        while True:
+            try:
+                # the consumer blocks, the jobs keep running meanwhile
+                indexer_input = await asyncio.to_thread(
+                    consumer.receive_model, kafka_topic, IndexerInput
+                )
+                failures = 0
+            except ValueError as e:
+                print(f"Invalid indexer message: {e}")
+                continue
+            except Exception as e:
+                # Kafka is unavailable, the other loops keep running
+                failures += 1
+                delay = self.retry_delay(failures)
+                print(f"Consuming indexer messages failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            print("Indexer Message:", indexer_input)
+            job_id = indexer_input.job_id or str(uuid.uuid4())
+            await self.enqueue(job_id, indexer_input)
+            print(f"Queued job {job_id} for collection {indexer_input.collection_name}")
+            self.wake.set()
+
+    async def enqueue(self, job_id: str, indexer_input: IndexerInput):
+        """Enqueues the job, retrying until the database takes it. The offset of
+        the message is committed already, giving up would lose the request."""
+        failures = 0
+        while True:
+            try:
+                await self.queue.enqueue(job_id, indexer_input)
+                return
+            except Exception as e:
+                failures += 1
+                delay = self.retry_delay(failures)
+                print(f"Job {job_id}: enqueueing failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def run_job(self, job_id: str, indexer_input: IndexerInput, attempt: int):
+        print(
+            f"Job {job_id}: indexing {indexer_input.collection_name}, attempt {attempt}"
+        )
+        progress = IndexingProgress(indexer_input.files)
+        task = asyncio.create_task(self.indexer.index(indexer_input, progress))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.heartbeat_interval)
+                if done:
+                    break
+                if not await self.queue.save_progress(job_id, progress):
+                    print(f"Job {job_id}: claimed by another indexer, stopping")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    return
+        except BaseException:
+            # without heartbeats the job goes stale and is claimed again, it must
+            # not keep indexing next to the indexer that claims it
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        try:
+            task.result()
+        except Exception as e:
+            print(f"Job {job_id}: failed: {e}")
+            await self.queue.finish(job_id, progress, error=str(e))
+            return
+        await self.queue.finish(job_id, progress)
+        print(f"Job {job_id}: completed")
+
+    async def work(self):
+        failures = 0
+        while True:
+            try:
+                claimed = await self.queue.claim()
+                failures = 0
+                if claimed is None:
+                    try:
+                        await asyncio.wait_for(self.wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.wake.clear()
+                    continue
+                await self.run_job(*claimed)
+            except Exception as e:
+                failures += 1
+                delay = self.retry_delay(failures)
+                print(f"Indexer worker failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def run(self, consumer: KafkaConsumer):
+        await asyncio.gather(
+            self.consume(consumer), *(self.work() for _ in range(self.max_jobs))
+        )
+
+
+async def main():
+    indexer = LangchainIndexer()
+    pool = await asyncpg.create_pool(
+        host=indexer.db_host,
+        user=indexer.db_user,
+        password=indexer.db_password,
+        database=indexer.db_name,
+        port=indexer.db_port,
+    )
+    consumer = KafkaConsumer.from_env_vars(
+        group_id="jb-indexer", auto_offset_reset="latest"
+    )
+    runner = JobRunner.from_env_vars(JobQueue.from_env_vars(pool), indexer)
+    try:
+        await runner.run(consumer)
+    finally:
+        indexer.parser.close()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    # parser processes import this module, they must not consume from Kafka
+    print("kafka_bootstrap_servers", kafka_bootstrap_servers)
+    print("kafka", kafka_topic)
+    asyncio.run(main())
@@ -0,0 +1,332 @@
+"""Document parsers and the process pool the indexer parses uploads with.
+
+PyMuPDF, docx2txt and pandas hold the GIL while they parse, so files are parsed
+in a bounded pool of worker processes. Every file has a time limit, enforced
+inside its worker.
+
+Parsers yield sections (PDF pages, blocks of spreadsheet rows, blocks of text
+lines) which the worker streams into a cache file keyed by the file hash, so
+neither the worker nor the indexer ever holds a whole document in memory.
+"""
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+import docx2txt
+import fitz
+import openpyxl
+import pandas as pd
+
+
+class Section(NamedTuple):
+    """A page, a block of rows or a whole small document, with where it came from."""
+
+    text: str
+    metadata: Dict[str, Any]
+
+
+def pdf_sections(pdf_file_path: str) -> Iterator[Section]:
+    with fitz.open(pdf_file_path) as doc:
+        for number, page in enumerate(doc, start=1):
+            text = page.get_text("text", textpage=None, sort=False)
+            yield Section(text, {"page": number})
+
+
+def xlsx_sections(
+    excel_file_path: str, rows_per_section: int = 200
+) -> Iterator[Section]:
+    # read only mode streams the rows instead of loading the whole sheet
+    workbook = openpyxl.load_workbook(excel_file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [
+            str(column) if column is not None else f"Unnamed: {i}"
+            for i, column in enumerate(header)
+        ]
+        block, first_row = [], 2
+        for row_number, row in enumerate(rows, start=2):
+            block.append(row)
+            if len(block) == rows_per_section:
+                yield _rows_section(columns, block, first_row, row_number)
+                block, first_row = [], row_number + 1
+        if block:
+            yield _rows_section(columns, block, first_row, first_row + len(block) - 1)
+    finally:
+        workbook.close()
+
+
+def _rows_section(columns: List[str], rows: List[tuple], first_row: int, last_row: int):
+    text = pd.DataFrame(rows, columns=columns).to_string(index=False)
+    return Section(text, {"row_start": first_row, "row_end": last_row})
+
+
+def text_sections(file_path: str, max_chars: int = 64 * 1024) -> Iterator[Section]:
+    with open(file_path, "r") as f:
+        lines, size, first_line = [], 0, 1
+        for line_number, line in enumerate(f, start=1):
+            lines.append(line)
+            size += len(line)
+            if size >= max_chars:
+                yield Section(
+                    "".join(lines), {"line_start": first_line, "line_end": line_number}
+                )
+                lines, size, first_line = [], 0, line_number + 1
+        if lines:
+            yield Section(
+                "".join(lines),
+                {"line_start": first_line, "line_end": first_line + len(lines) - 1},
+            )
+
+
+def docx_sections(docx_file_path: str) -> Iterator[Section]:
+    yield Section(docx2txt.process(docx_file_path), {})
+
+
+def json_sections(json_file_path: str) -> Iterator[Section]:
+    with open(json_file_path, "r") as f:
+        data = json.load(f)
+    yield Section(json.dumps(data, indent=4), {})
+
+
+def iter_sections(filepath: str) -> Iterator[Section]:
+    if filepath.endswith(".pdf"):
+        return pdf_sections(filepath)
+    elif filepath.endswith(".docx"):
+        return docx_sections(filepath)
+    elif filepath.endswith(".xlsx"):
+        return xlsx_sections(filepath)
+    elif filepath.endswith(".json"):
+        return json_sections(filepath)
+    return text_sections(filepath)
+
+
+def sha256_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SectionCache:
+    """Sections of parsed files, one JSON line each, keyed by the sha256 of the file
+    contents. A re-index only parses the files that changed, and the indexer reads
+    the sections back one at a time."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, file_hash: str) -> str:
+        return os.path.join(self.directory, f"{file_hash}.jsonl")
+
+    def exists(self, file_hash: str) -> bool:
+        return os.path.exists(self.path(file_hash))
+
+    def read(self, file_hash: str) -> Iterator[Section]:
+        with open(self.path(file_hash), "r", encoding="utf-8") as f:
+            for line in f:
+                section = json.loads(line)
+                yield Section(section["text"], section["metadata"])
+
+    def write(self, file_hash: str, sections: Iterable[Section]) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path(file_hash)}.{os.getpid()}.tmp"
+        count = 0
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for section in sections:
+                    f.write(json.dumps(section._asdict(), ensure_ascii=False))
+                    f.write("\n")
+                    count += 1
+            os.replace(tmp_path, self.path(file_hash))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return count
+
+
+class ParsedFile(NamedTuple):
+    file_path: str
+    file_hash: str
+    seconds: float
+    cached: bool
+
+
+class ParseTimeout(Exception):
+    pass
+
+
+class ParseError(Exception):
+    def __init__(self, file_path: str, message: str):
+        super().__init__(f"{file_path}: {message}")
+        self.file_path = file_path
+        self.message = message
+
+
+def _raise_timeout(signum, frame):
+    raise ParseTimeout()
+
+
+def read_file(file_path: str, cache_dir: str, timeout: float) -> ParsedFile:
+    """Runs in a worker process: parses the file into the section cache unless
+    it is there already. Sections are written as they are parsed."""
+    start = time.perf_counter()
+    cache = SectionCache(cache_dir)
+    file_hash = sha256_file(file_path)
+    if cache.exists(file_hash):
+        return ParsedFile(file_path, file_hash, time.perf_counter() - start, True)
+    # the alarm interrupts the parser between bytecodes, e.g. after the current PDF page
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        cache.write(file_hash, iter_sections(file_path))
+    except ParseTimeout:
+        raise TimeoutError(f"Parsing {file_path} took more than {timeout}s") from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return ParsedFile(file_path, file_hash, time.perf_counter() - start, False)
+
+
+def file_format(file_path: str) -> str:
+    return os.path.splitext(file_path)[1].lstrip(".").lower() or "txt"
+
+
+class ParseStats:
+    """Parse counts and times per file format."""
+
+    def __init__(self):
+        self.files: Dict[str, int] = defaultdict(int)
+        self.cached: Dict[str, int] = defaultdict(int)
+        self.failed: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.max_seconds: Dict[str, float] = defaultdict(float)
+
+    def add(self, parsed: ParsedFile):
+        name = file_format(parsed.file_path)
+        self.files[name] += 1
+        if parsed.cached:
+            self.cached[name] += 1
+            return
+        self.seconds[name] += parsed.seconds
+        self.max_seconds[name] = max(self.max_seconds[name], parsed.seconds)
+
+    def add_failure(self, file_path: str):
+        self.failed[file_format(file_path)] += 1
+
+    def summary(self) -> List[str]:
+        lines = []
+        for name in sorted(set(self.files) | set(self.failed)):
+            parsed = self.files[name] - self.cached[name]
+            lines.append(
+                f"{name}: {self.files[name]} files ({self.cached[name]} cached, "
+                f"{self.failed[name]} failed), {self.seconds[name]:.1f}s parsing, "
+                f"mean {self.seconds[name] / max(parsed, 1):.2f}s, "
+                f"max {self.max_seconds[name]:.2f}s"
+            )
+        return lines
+
+
+class ParallelParser:
+    def __init__(
+        self,
+        cache_dir: str,
+        max_workers: Optional[int] = None,
+        timeout: float = 300,
+    ):
+        self.cache_dir = cache_dir
+        self.cache = SectionCache(cache_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_env_vars(cls) -> "ParallelParser":
+        """
+        Creates a ParallelParser from environment variables.
+        Uses the following environment variables:
+        - INDEXER_PARSE_CACHE_DIR: where parsed text is cached
+          (default: $DOCUMENT_LOCAL_STORAGE_PATH/.parsed)
+        - INDEXER_PARSE_WORKERS: parser processes (default: number of CPUs)
+        - INDEXER_PARSE_TIMEOUT: seconds a single file may take to parse (default: 300)
+        """
+        cache_dir = os.getenv(
+            "INDEXER_PARSE_CACHE_DIR",
+            os.path.join(os.getenv("DOCUMENT_LOCAL_STORAGE_PATH", "."), ".parsed"),
+        )
+        workers = os.getenv("INDEXER_PARSE_WORKERS")
+        return cls(
+            cache_dir,
+            max_workers=int(workers) if workers else None,
+            timeout=float(os.getenv("INDEXER_PARSE_TIMEOUT", 300)),
+        )
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawned rather than forked, the indexer process has Kafka client threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def _read(self, file_path: str, stats: ParseStats) -> ParsedFile:
+        loop = asyncio.get_running_loop()
+        try:
+            parsed = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self.pool, read_file, file_path, self.cache_dir, self.timeout
+                ),
+                # hashing and the cache are not covered by the alarm in the worker
+                timeout=self.timeout * 2,
+            )
+        except asyncio.TimeoutError:
+            stats.add_failure(file_path)
+            raise ParseError(file_path, f"took more than {self.timeout * 2}s") from None
+        except Exception as e:
+            stats.add_failure(file_path)
+            raise ParseError(file_path, str(e)) from e
+        stats.add(parsed)
+        return parsed
+
+    async def parse(
+        self, file_paths: List[str], stats: Optional[ParseStats] = None
+    ) -> AsyncIterator[ParsedFile]:
+        """Yields the files as they are parsed, in completion order. The first
+        file that fails raises a ParseError and the remaining ones are cancelled."""
+        stats = stats if stats is not None else ParseStats()
+        tasks = [asyncio.ensure_future(self._read(path, stats)) for path in file_paths]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def read_sections(self, parsed: ParsedFile) -> Iterator[Section]:
+        return self.cache.read(parsed.file_hash)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,136 @@
+"""Encode and decode cost of Kafka messages, before and after the envelope.
+
+"json" is the path services used to take, ``model_dump_json()`` on the
+producer and ``Model(**json.loads(value))`` on the consumer. "envelope" is the
+path of KafkaProducer.send_model and KafkaConsumer.receive_model: the envelope
+header and the JSON of pydantic-core, validated from the bytes by a
+discriminated TypeAdapter. Run from the jb-lib directory:
+
+    python -m benchmarks.serialization --rounds 20000
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from lib.data_models import (
+    BotInput,
+    BotOutput,
+    ChannelInput,
+    ChannelIntent,
+    FlowInput,
+    LanguageInput,
+    LanguageIntent,
+    MessageData,
+    MessageType,
+    OptionsListType,
+    RAGResponse,
+    channel_input_adapter,
+    language_input_adapter,
+)
+from lib.kafka import envelope
+
+
+def messages():
+    channel_output = ChannelInput(
+        source="language",
+        session_id="f3126ced-637b-417e-9a48-92ca9c396144",
+        message_id="4c1b2a1e-6d7e-4a8f-9b0c-1d2e3f4a5b6c",
+        turn_id="1d1997f8-3598-46b5-93b3-46fa780eb727",
+        intent=ChannelIntent.BOT_OUT,
+        data=BotOutput(
+            message_type=MessageType.INTERACTIVE,
+            message_data=MessageData(
+                message_text="Please choose an option below: " * 4
+            ),
+            options_list=[
+                OptionsListType(id=str(i), title=f"Option {i}") for i in range(3)
+            ],
+            header="header",
+            footer="footer",
+        ),
+    )
+    language_input = LanguageInput(
+        source="channel",
+        session_id="f3126ced-637b-417e-9a48-92ca9c396144",
+        message_id="4c1b2a1e-6d7e-4a8f-9b0c-1d2e3f4a5b6c",
+        turn_id="1d1997f8-3598-46b5-93b3-46fa780eb727",
+        intent=LanguageIntent.LANGUAGE_IN,
+        data=BotInput(
+            message_type=MessageType.TEXT,
+            message_data=MessageData(message_text="How do I file a complaint?"),
+        ),
+    )
+    rag_response = FlowInput(
+        source="retriever",
+        session_id="f3126ced-637b-417e-9a48-92ca9c396144",
+        turn_id="1d1997f8-3598-46b5-93b3-46fa780eb727",
+        rag_response=[
+            RAGResponse(
+                chunk="lorem ipsum " * 340, metadata={"document_name": "faq.pdf"}
+            )
+            for _ in range(5)
+        ],
+    )
+    return [
+        (
+            "ChannelInput",
+            channel_output,
+            ChannelInput,
+            channel_input_adapter.validate_json,
+        ),
+        (
+            "LanguageInput",
+            language_input,
+            LanguageInput,
+            language_input_adapter.validate_json,
+        ),
+        ("FlowInput+rag", rag_response, FlowInput, FlowInput.model_validate_json),
+    ]
+
+
+def timed(function, rounds: int) -> list:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, path: str, size: int, encode: list, decode: list):
+    print(
+        f"{name:<14} {path:<9} bytes={size:<6} "
+        f"encode p50={statistics.median(encode) * 1e6:7.2f}us "
+        f"decode p50={statistics.median(decode) * 1e6:7.2f}us "
+        f"mean={statistics.mean(decode) * 1e6:7.2f}us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, message, model, validate_json in messages():
+        value = message.model_dump_json().encode("utf-8")
+        report(
+            name,
+            "json",
+            len(value),
+            timed(lambda: message.model_dump_json().encode("utf-8"), args.rounds),
+            timed(lambda: model(**json.loads(value.decode("utf-8"))), args.rounds),
+        )
+        packed = envelope.pack(message.model_dump_json())
+        report(
+            name,
+            "envelope",
+            len(packed),
+            timed(lambda: envelope.pack(message.model_dump_json()), args.rounds),
+            timed(lambda: validate_json(envelope.unpack(packed)), args.rounds),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from enum import Enum
-from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, model_validator
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 class MessageData(BaseModel):
@@ -19,7 +19,8 @@ class MessageType(Enum):
     DIALOG = "dialog"
 
 
-class ChannelIntent(Enum):
+class ChannelIntent(str, Enum):
+    # str, so that JSON values match the Literal discriminators below
     BOT_IN = "bot_in"
     BOT_OUT = "bot_out"
 
@@ -67,24 +68,41 @@ class ChannelInput(BaseModel):
     data: BotInput | BotOutput
     dialog: Optional[str] = None
 
-    @model_validator(mode="before")
-    @classmethod
-    def validate_data(cls, values):
-        """Validates data field"""
+    def __init__(self, **values):
+        # a data dict is the model of the intent. Not a model_validator, the
+        # variants below would inherit it; they reset __init__ too, pydantic
+        # calls a custom __init__ when it validates and that is slow from JSON
         data = values.get("data")
-        if isinstance(data, (BotInput, BotOutput)):
-            return values
-        intent = values.get("intent")
-        if intent == ChannelIntent.BOT_IN.value:
-            values["data"] = BotInput(**data)
-        elif intent == ChannelIntent.BOT_OUT.value:
-            values["data"] = BotOutput(**data)
-        else:
-            raise ValueError("Invalid type")
-        return values
-
-
-class LanguageIntent(Enum):
+        if isinstance(data, dict):
+            intent = values.get("intent")
+            if intent == ChannelIntent.BOT_IN:
+                values["data"] = BotInput(**data)
+            elif intent == ChannelIntent.BOT_OUT:
+                values["data"] = BotOutput(**data)
+            else:
+                raise ValueError("Invalid type")
+        super().__init__(**values)
+
+
+class ChannelBotIn(ChannelInput):
+    intent: Literal[ChannelIntent.BOT_IN]
+    data: BotInput
+    __init__ = BaseModel.__init__
+
+
+class ChannelBotOut(ChannelInput):
+    intent: Literal[ChannelIntent.BOT_OUT]
+    data: BotOutput
+    __init__ = BaseModel.__init__
+
+
+# validates a ChannelInput from Kafka, data is validated as the model of the intent
+channel_input_adapter: TypeAdapter[ChannelInput] = TypeAdapter(
+    Annotated[Union[ChannelBotIn, ChannelBotOut], Field(discriminator="intent")]
+)
+
+
+class LanguageIntent(str, Enum):
     LANGUAGE_IN = "language_in"
     LANGUAGE_OUT = "language_out"
 
@@ -100,21 +118,35 @@ class LanguageInput(BaseModel):
     # options_list: Optional[List[OptionsListType]] = None
     data: BotInput | BotOutput
 
-    @model_validator(mode="before")
-    @classmethod
-    def validate_data(cls, values):
-        """Validates data field"""
+    def __init__(self, **values):
+        # as ChannelInput.__init__
         data = values.get("data")
-        if isinstance(data, (BotInput, BotOutput)):
-            return values
-        intent = values.get("intent")
-        if intent == LanguageIntent.LANGUAGE_IN.value:
-            values["data"] = BotInput(**data)
-        elif intent == LanguageIntent.LANGUAGE_OUT.value:
-            values["data"] = BotOutput(**data)
-        else:
-            raise ValueError("Invalid type")
-        return values
+        if isinstance(data, dict):
+            intent = values.get("intent")
+            if intent == LanguageIntent.LANGUAGE_IN:
+                values["data"] = BotInput(**data)
+            elif intent == LanguageIntent.LANGUAGE_OUT:
+                values["data"] = BotOutput(**data)
+            else:
+                raise ValueError("Invalid type")
+        super().__init__(**values)
+
+
+class LanguageIn(LanguageInput):
+    intent: Literal[LanguageIntent.LANGUAGE_IN]
+    data: BotInput
+    __init__ = BaseModel.__init__
+
+
+class LanguageOut(LanguageInput):
+    intent: Literal[LanguageIntent.LANGUAGE_OUT]
+    data: BotOutput
+    __init__ = BaseModel.__init__
+
+
+language_input_adapter: TypeAdapter[LanguageInput] = TypeAdapter(
+    Annotated[Union[LanguageIn, LanguageOut], Field(discriminator="intent")]
+)
 
 
 class UploadFile(BaseModel):
@@ -123,6 +155,15 @@ class UploadFile(BaseModel):
     filename: str
 
 
+class RAGQuery(BaseModel):
+    """Overrides for a dest="rag" output, unset fields keep flow's defaults."""
+
+    collection_name: Optional[str] = None
+    query: Optional[str] = None
+    top_chunk_k_value: Optional[int] = None
+    metadata: Optional[Dict[str, Any]] = None  # e.g. {"document_name": "faq.pdf"}
+
+
 class FSMOutput(BaseModel):
     dest: str = "out"
     type: MessageType = MessageType.TEXT
@@ -139,6 +180,7 @@ class FSMOutput(BaseModel):
     menu_title: Optional[str] = None
     form_token: Optional[str] = None
     plugin_uuid: Optional[str] = None
+    rag_query: Optional[RAGQuery] = None
 
 
 class RAGResponse(BaseModel):
@@ -177,8 +219,26 @@ class RAGInput(BaseModel):
     collection_name: str
     query: str
     top_chunk_k_value: int
+    metadata: Optional[Dict[str, Any]] = None  # filter on chunk metadata
+
+
+class VectorQuantization(Enum):
+    HALFVEC = "halfvec"
+    BINARY = "binary"
+
+
+class EmbeddingBackend(Enum):
+    OPENAI = "openai"  # OpenAI or Azure OpenAI text-embedding-ada-002
+    LOCAL = "local"  # ONNX model on the CPU, see lib.local_embeddings
 
 
 class IndexerInput(BaseModel):
     collection_name: str
     files: List[str]
+    # index the collection on quantized embeddings, re-ranked at full precision
+    quantization: Optional[VectorQuantization] = None
+    # model the chunks and the queries of the collection are embedded with
+    embedding_backend: Optional[EmbeddingBackend] = None
+    # id of the indexing job, reported by GET /indexer/jobs/{job_id}; the indexer
+    # makes one up when the producer does not set it
+    job_id: Optional[str] = None
@@ -1,3 +1,5 @@
+from .claim_check import ClaimCheck, ClaimCheckError
+from .envelope import EnvelopeError
 from .kafka_producer import KafkaProducer
 from .kafka_consumer import KafkaConsumer
-from .handler import KafkaHandler
\ No newline at end of file
+from .handler import KafkaHandler
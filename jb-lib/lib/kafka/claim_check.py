@@ -0,0 +1,261 @@
+"""Claim check for large Kafka messages.
+
+Top level fields of a JSON message that are larger than the threshold (the
+chunk texts of a rag_response, a webhook body in plugin_input, bot state) are
+saved in the jb_kafka_payload table and taken out of the message, which carries
+a reference ``"__jb_claim_check__": {"id": "<id>", "fields": [...]}`` at its top
+level instead. The consumer puts the fields back when it reads the message, so
+services see the same messages as before.
+
+Only the top level key is a reference. The top level keys of a message are the
+fields of a data model, so user data, such as a plugin_input that holds
+``{"__jb_claim_check__": ...}``, is never taken for one, and producers refuse
+messages that have the key at the top level themselves.
+
+Messages under the threshold, most of them, are sent as they are and the
+consumer only looks for references with a substring check. Saved payloads
+expire after a TTL and producers delete the expired ones now and then.
+
+The Kafka clients are synchronous, so is the store: a small pool of psycopg2
+connections shared by the threads of the service.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Union
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CHECK_KEY = "__jb_claim_check__"
+_CLAIM_CHECK_KEY_BYTES = CLAIM_CHECK_KEY.encode("utf-8")
+_PAYLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ClaimCheckError(Exception):
+    """A message references a payload that is no longer saved, e.g. it expired,
+    or its reference is malformed."""
+
+
+class PayloadStore:
+    """Payloads in the jb_kafka_payload table."""
+
+    def __init__(self, dsn: str, max_connections: int = 4):
+        self.dsn = dsn
+        self.max_connections = max_connections
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env_vars(cls) -> "PayloadStore":
+        """
+        Creates a PayloadStore from environment variables.
+        Uses the following environment variables:
+        - POSTGRES_DATABASE_HOST, POSTGRES_DATABASE_PORT, POSTGRES_DATABASE_NAME,
+          POSTGRES_DATABASE_USERNAME, POSTGRES_DATABASE_PASSWORD
+        - KAFKA_CLAIM_CHECK_CONNECTIONS: connections to the database (default: 4)
+        """
+        dsn = psycopg2.extensions.make_dsn(
+            host=os.getenv("POSTGRES_DATABASE_HOST"),
+            port=os.getenv("POSTGRES_DATABASE_PORT"),
+            dbname=os.getenv("POSTGRES_DATABASE_NAME"),
+            user=os.getenv("POSTGRES_DATABASE_USERNAME"),
+            password=os.getenv("POSTGRES_DATABASE_PASSWORD"),
+        )
+        return cls(
+            dsn, max_connections=int(os.getenv("KAFKA_CLAIM_CHECK_CONNECTIONS", 4))
+        )
+
+    @contextmanager
+    def cursor(self):
+        # connected on first use, services that never see a large message never connect
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(1, self.max_connections, self.dsn)
+        connection = self._pool.getconn()
+        broken = False
+        try:
+            with connection, connection.cursor() as cursor:
+                yield cursor
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._pool.putconn(connection, close=broken)
+
+    def put(self, payload_id: str, payload: str, ttl: float):
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO jb_kafka_payload (id, payload, expires_at)
+                VALUES (%s, %s, now() + make_interval(secs => %s))
+                """,
+                (payload_id, payload, ttl),
+            )
+
+    def get_many(self, payload_ids: Iterable[str]) -> Dict[str, str]:
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, payload FROM jb_kafka_payload
+                WHERE id = ANY(%s) AND expires_at > now()
+                """,
+                (list(payload_ids),),
+            )
+            return dict(cursor.fetchall())
+
+    def delete_expired(self, limit: int = 1000) -> int:
+        # bounded, a large backlog is deleted over several runs
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                DELETE FROM jb_kafka_payload WHERE id IN (
+                    SELECT id FROM jb_kafka_payload WHERE expires_at <= now() LIMIT %s
+                )
+                """,
+                (limit,),
+            )
+            return cursor.rowcount
+
+
+class ClaimCheck:
+    def __init__(
+        self,
+        store,
+        enabled: bool = True,
+        threshold: int = 16 * 1024,
+        ttl: float = 24 * 3600,
+        cleanup_interval: float = 600,
+    ):
+        self.store = store
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = time.monotonic()
+        self._cleanup_lock = threading.Lock()
+
+    @classmethod
+    def from_env_vars(cls) -> "ClaimCheck":
+        """
+        Creates a ClaimCheck from environment variables.
+        Uses the following environment variables:
+        - KAFKA_CLAIM_CHECK: whether producers offload large fields (default: False).
+          Consumers resolve references whether it is set or not.
+        - KAFKA_CLAIM_CHECK_THRESHOLD: bytes above which a message is checked, and
+          a field is offloaded (default: 16384)
+        - KAFKA_CLAIM_CHECK_TTL: seconds an offloaded field is kept (default: 86400)
+        - KAFKA_CLAIM_CHECK_CLEANUP_INTERVAL: seconds between deletes of expired
+          fields by a producer (default: 600)
+        """
+        return cls(
+            PayloadStore.from_env_vars(),
+            enabled=os.getenv("KAFKA_CLAIM_CHECK", "false").lower() == "true",
+            threshold=int(os.getenv("KAFKA_CLAIM_CHECK_THRESHOLD", 16 * 1024)),
+            ttl=float(os.getenv("KAFKA_CLAIM_CHECK_TTL", 24 * 3600)),
+            cleanup_interval=float(
+                os.getenv("KAFKA_CLAIM_CHECK_CLEANUP_INTERVAL", 600)
+            ),
+        )
+
+    def offload(self, value: Union[str, bytes]) -> Union[str, bytes]:
+        """Returns the message with its large fields replaced by a reference.
+        Raises ValueError if the message has the reference key at the top level."""
+        if self.references(value):
+            message = json.loads(value)
+            if isinstance(message, dict) and CLAIM_CHECK_KEY in message:
+                raise ValueError(f"{CLAIM_CHECK_KEY} is reserved for claim checks")
+        if not self.enabled or len(value) <= self.threshold // 4:
+            return value  # short of the threshold even at 4 bytes per character
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        if len(value.encode("utf-8")) <= self.threshold:
+            return value
+        try:
+            message = json.loads(value)
+        except ValueError:
+            return value
+        if not isinstance(message, dict):
+            return value
+        fields = {}
+        for name, field in message.items():
+            encoded = json.dumps(field, ensure_ascii=False)
+            if len(encoded.encode("utf-8")) > self.threshold:
+                fields[name] = field
+        if not fields:
+            return value
+        payload_id = uuid.uuid4().hex
+        try:
+            self.store.put(payload_id, json.dumps(fields, ensure_ascii=False), self.ttl)
+        except Exception:
+            # the message may be too large for the broker, it is sent all the same
+            logger.exception(
+                "Could not offload %s, sending the message as it is", list(fields)
+            )
+            return value
+        for name in fields:
+            del message[name]
+        message[CLAIM_CHECK_KEY] = {"id": payload_id, "fields": list(fields)}
+        self._cleanup_if_due()
+        return json.dumps(message, ensure_ascii=False)
+
+    @staticmethod
+    def references(value: Union[str, bytes]) -> bool:
+        if isinstance(value, bytes):
+            return _CLAIM_CHECK_KEY_BYTES in value
+        return CLAIM_CHECK_KEY in value
+
+    def resolve(self, value: str) -> str:
+        """Returns the message with its offloaded fields put back."""
+        if not self.references(value):
+            return value
+        message = json.loads(value)
+        if not isinstance(message, dict) or CLAIM_CHECK_KEY not in message:
+            return value  # the key is in the data of a field
+        reference = message.pop(CLAIM_CHECK_KEY)
+        if not (
+            isinstance(reference, dict)
+            and isinstance(reference.get("id"), str)
+            and _PAYLOAD_ID.match(reference["id"])
+            and isinstance(reference.get("fields"), list)
+            and all(isinstance(name, str) for name in reference["fields"])
+            and not set(reference["fields"]).intersection(message)
+        ):
+            raise ClaimCheckError(f"Malformed claim check reference {reference!r:.200}")
+        payload_id = reference["id"]
+        payload = self.store.get_many([payload_id]).get(payload_id)
+        if payload is None:
+            raise ClaimCheckError(f"Payload {payload_id} not found")
+        fields = json.loads(payload)
+        for name in reference["fields"]:
+            if name not in fields:
+                raise ClaimCheckError(f"Payload {payload_id} has no field {name}")
+            message[name] = fields[name]
+        return json.dumps(message, ensure_ascii=False)
+
+    def _cleanup_if_due(self):
+        now = time.monotonic()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        if not self._cleanup_lock.acquire(blocking=False):
+            return  # already deleting
+        self._last_cleanup = now
+        threading.Thread(target=self._cleanup, daemon=True).start()
+
+    def _cleanup(self):
+        try:
+            deleted = self.store.delete_expired()
+            if deleted:
+                logger.info("Deleted %d expired Kafka payloads", deleted)
+        except Exception:
+            logger.exception("Could not delete expired Kafka payloads")
+        finally:
+            self._cleanup_lock.release()
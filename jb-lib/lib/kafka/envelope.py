@@ -0,0 +1,35 @@
+"""Versioned envelope of the messages sent on Kafka.
+
+A message is a two byte header, a zero byte and the schema version, followed
+by the body. Version 1 bodies are the UTF-8 JSON of a data model as serialized
+by pydantic-core, which consumers validate straight from the bytes with
+``model_validate_json`` or a TypeAdapter, without building an intermediate dict.
+
+JSON text never starts with a zero byte, so consumers also read messages of
+producers that send plain JSON, e.g. during a rolling deployment.
+"""
+
+from typing import Union
+
+MAGIC = b"\x00"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+
+
+class EnvelopeError(ValueError):
+    """The message has a schema version this consumer does not read."""
+
+
+def pack(body: Union[str, bytes]) -> bytes:
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return HEADER + body
+
+
+def unpack(value: bytes) -> bytes:
+    """Returns the body of the message."""
+    if not value.startswith(MAGIC):
+        return value  # plain JSON
+    if value[1:2] != HEADER[1:]:
+        raise EnvelopeError(f"Unsupported message schema version {value[1:2].hex()}")
+    return value[len(HEADER) :]
@@ -16,11 +16,15 @@ class KafkaHandler:
         return cls.__producer__
 
     @classmethod
-    def get_consumer(cls) -> KafkaConsumer:
+    def get_consumer(cls, group_id: str) -> KafkaConsumer:
+        """`group_id` is the consumer group of the service, each service has
+        its own, see KafkaConsumer.from_env_vars."""
         if cls.__consumer__ is None:
-            group_id = "cooler_group_id"
-            logger.info("Creating Kafka Consumer with group_id: %s", group_id)
             cls.__consumer__ = KafkaConsumer.from_env_vars(
                 group_id=group_id, auto_offset_reset="latest"
             )
+            logger.info(
+                "Created Kafka Consumer with group_id: %s",
+                cls.__consumer__.consumer_config["group.id"],
+            )
         return cls.__consumer__
@@ -1,6 +1,12 @@
 import os
-from typing import Dict, Optional
+from typing import Dict, Optional, Type, TypeVar, Union
 from confluent_kafka import Consumer, KafkaException
+from pydantic import TypeAdapter
+
+from . import envelope
+from .claim_check import ClaimCheck
+
+T = TypeVar("T")
 
 
 class KafkaConsumer:
@@ -16,9 +22,11 @@ class KafkaConsumer:
         sasl_username="",
         sasl_password="",
         consumer_config: Optional[Dict] = None,  # can be used to override previous configs
+        claim_check: Optional[ClaimCheck] = None,
     ):
         if consumer_config is None:
             consumer_config = {}
+        self.claim_check = claim_check
         self.bootstrap_servers = bootstrap_servers
         if use_sasl:
             self.consumer_config = {
@@ -43,7 +51,12 @@ class KafkaConsumer:
         self.subscribed_topics = []
 
     @classmethod
-    def from_env_vars(cls, group_id: str, auto_offset_reset: str):
+    def from_env_vars(
+        cls,
+        group_id: str,
+        auto_offset_reset: str,
+        consumer_config: Optional[Dict] = None,  # can be used to override previous configs
+    ):
         """
         Creates a KafkaConsumer from environment variables.
         Uses the following environment variables:
@@ -51,8 +64,27 @@ class KafkaConsumer:
         - KAFKA_USE_SASL: whether to use SASL authentication (default: False)
         - KAFKA_CONSUMER_USERNAME: SASL username (default: "")
         - KAFKA_CONSUMER_PASSWORD: SASL password (default: "")
+        - KAFKA_CONSUMER_GROUP_ID: consumer group of the service (default: group_id)
+        - KAFKA_GROUP_INSTANCE_ID: static membership id of this replica, unique in
+          the group and kept across restarts, e.g. the pod name of a StatefulSet.
+          A replica that restarts within the session timeout gets its partitions
+          back without a rebalance (default: unset, dynamic membership)
+        - KAFKA_PARTITION_ASSIGNMENT_STRATEGY: (default: cooperative-sticky, a
+          rebalance only moves the partitions that change owner, the other
+          replicas keep consuming)
         You can further override these by providing arguments in the consumer_config dict.
+        Offloaded fields are read back with ClaimCheck.from_env_vars.
         """
+        group_id = os.getenv("KAFKA_CONSUMER_GROUP_ID", group_id)
+        group_config = {
+            "partition.assignment.strategy": os.getenv(
+                "KAFKA_PARTITION_ASSIGNMENT_STRATEGY", "cooperative-sticky"
+            ),
+        }
+        group_instance_id = os.getenv("KAFKA_GROUP_INSTANCE_ID")
+        if group_instance_id:
+            group_config["group.instance.id"] = group_instance_id
+        consumer_config = {**group_config, **(consumer_config or {})}
         kafka_broker = os.getenv("KAFKA_BROKER")
         use_sasl = os.getenv("KAFKA_USE_SASL")
         consumer_username = os.getenv("KAFKA_CONSUMER_USERNAME")
@@ -65,29 +97,75 @@ class KafkaConsumer:
                 raise ValueError(
                     "KAFKA_USE_SASL is set to True, but KAFKA_CONSUMER_USERNAME or KAFKA_CONSUMER_PASSWORD is not set"
                 )
-            cls.__consumer__ = KafkaConsumer(
+            return KafkaConsumer(
                 kafka_broker,
                 group_id,
                 auto_offset_reset,
                 use_sasl=True,
                 sasl_username=consumer_username,
                 sasl_password=consumer_password,
+                consumer_config=consumer_config,
+                claim_check=ClaimCheck.from_env_vars(),
             )
         else:
-            return KafkaConsumer(kafka_broker, group_id, auto_offset_reset)
+            return KafkaConsumer(
+                kafka_broker,
+                group_id,
+                auto_offset_reset,
+                consumer_config=consumer_config,
+                claim_check=ClaimCheck.from_env_vars(),
+            )
 
     def subscribe(self, topics: list):
         self.consumer.subscribe(topics)
         self.subscribed = True
         self.subscribed_topics = topics
 
-    def receive_message(self, topic, timeout=60) -> str:
+    def _poll(self, topic, timeout: Optional[float]) -> Optional[bytes]:
         if not self.subscribed:
             self.subscribe([topic])
         while True:
-            msg = self.consumer.poll(timeout)
+            msg = self.consumer.poll(60 if timeout is None else timeout)
             if msg is None:
-                continue
+                if timeout is None:
+                    continue
+                return None
             if msg.error():
                 raise KafkaException(msg.error())
-            return msg.value().decode("utf-8")
+            return envelope.unpack(msg.value())
+
+    def receive_message(self, topic, timeout=None, resolve=True) -> Optional[str]:
+        """Returns the next message of the topic. Waits for one as long as it
+        takes, or returns None if none arrives within `timeout` seconds. With
+        resolve=False offloaded fields are left as references, for consumers that
+        may not need them; they can be fetched later with `resolve()`."""
+        body = self._poll(topic, timeout)
+        if body is None:
+            return None
+        value = body.decode("utf-8")
+        return self.resolve(value) if resolve else value
+
+    def receive_model(
+        self,
+        topic,
+        model: Union[Type[T], TypeAdapter[T]],
+        timeout=None,
+    ) -> Optional[T]:
+        """Returns the next message of the topic validated as `model`, a data
+        model or a TypeAdapter, e.g. lib.data_models.channel_input_adapter.
+        The JSON is validated from the message bytes by pydantic-core. Like
+        `receive_message`, returns None if `timeout` is given and expires."""
+        body = self._poll(topic, timeout)
+        if body is None:
+            return None
+        if self.claim_check is not None and self.claim_check.references(body):
+            body = self.claim_check.resolve(body.decode("utf-8"))
+        if isinstance(model, TypeAdapter):
+            return model.validate_json(body)
+        return model.model_validate_json(body)
+
+    def resolve(self, value: str) -> str:
+        """Puts back the fields of a message that were offloaded by the producer."""
+        if self.claim_check is None:
+            return value
+        return self.claim_check.resolve(value)
@@ -1,7 +1,11 @@
 import os
 import socket
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
 from confluent_kafka import Producer
+from pydantic import BaseModel
+
+from . import envelope
+from .claim_check import ClaimCheck
 
 
 class KafkaProducer:
@@ -16,9 +20,13 @@ class KafkaProducer:
         producer_config: Optional[
             Dict
         ] = None,  # can be used to override previous configs
+        claim_check: Optional[ClaimCheck] = None,
+        use_envelope: bool = False,
     ):
         if producer_config is None:
             producer_config = {}
+        self.claim_check = claim_check
+        self.use_envelope = use_envelope
         self.bootstrap_servers = bootstrap_servers
         if use_sasl:
             self.producer_config = {
@@ -52,10 +60,17 @@ class KafkaProducer:
         - KAFKA_USE_SASL: whether to use SASL authentication (default: False)
         - KAFKA_PRODUCER_USERNAME: SASL username (default: "")
         - KAFKA_PRODUCER_PASSWORD: SASL password (default: "")
+        - KAFKA_ENVELOPE: whether messages are sent in the versioned envelope of
+          lib.kafka.envelope (default: False, plain JSON). Consumers that predate
+          the envelope cannot read it, so roll it out in two steps: first deploy
+          the new lib to every consumer (they read both formats), then set
+          KAFKA_ENVELOPE=true on the producers
         You can further override these by providing arguments in the producer_config dict.
+        Large fields are offloaded as configured in ClaimCheck.from_env_vars.
         """
         if producer_config is None:
             producer_config = {}
+        use_envelope = os.getenv("KAFKA_ENVELOPE", "false").lower() == "true"
         kafka_broker = os.getenv("KAFKA_BROKER")
         use_sasl = os.getenv("KAFKA_USE_SASL")
         producer_username = os.getenv("KAFKA_PRODUCER_USERNAME")
@@ -75,23 +90,67 @@ class KafkaProducer:
                 sasl_username=producer_username,
                 sasl_password=producer_password,
                 producer_config=producer_config,
+                claim_check=ClaimCheck.from_env_vars(),
+                use_envelope=use_envelope,
             )
         else:
             return KafkaProducer(
-                kafka_broker, client_id, producer_config=producer_config
+                kafka_broker,
+                client_id,
+                producer_config=producer_config,
+                claim_check=ClaimCheck.from_env_vars(),
+                use_envelope=use_envelope,
             )
 
+    def _encode(self, value: Union[str, bytes]) -> Union[str, bytes]:
+        if self.claim_check is not None:
+            value = self.claim_check.offload(value)
+        if self.use_envelope:
+            value = envelope.pack(value)
+        return value
+
     def send_message(
-        self, topic: str, value: str, key: Optional[str] = None, callback_func=None
+        self,
+        topic: str,
+        value: Union[str, bytes],
+        key: Optional[str] = None,
+        callback_func=None,
     ):
         """Sends a message to a topic (via `produce()`) and flushes."""
 
+        value = self._encode(value)
         self.producer.produce(topic, value=value, key=key, callback=callback_func)
         self.producer.flush()
 
+    def send_model(
+        self,
+        topic: str,
+        model: BaseModel,
+        key: Optional[str] = None,
+        callback_func=None,
+        **dump_kwargs,
+    ):
+        """Sends a data model, serialized to JSON by pydantic-core. `dump_kwargs`
+        go to `model_dump_json()`, e.g. exclude_none=True.
+
+        The message is keyed by the session_id of the model unless `key` is
+        given. Messages with the same key go to the same partition, so the
+        messages of a session are consumed in the order they were sent, by one
+        replica of the consuming service."""
+        if key is None:
+            key = getattr(model, "session_id", None)
+        self.send_message(
+            topic, model.model_dump_json(**dump_kwargs), key, callback_func
+        )
+
     def _send_message_async(
-        self, topic: str, value: str, key: Optional[str] = None, callback_func=None
+        self,
+        topic: str,
+        value: Union[str, bytes],
+        key: Optional[str] = None,
+        callback_func=None,
     ):
+        value = self._encode(value)
         self.producer.produce(topic, value=value, key=key, callback=callback_func)
 
     def poll_for_callback(self, timeout=1.0):
@@ -0,0 +1,179 @@
+"""Sentence embeddings computed on the CPU from a local ONNX model.
+
+The model directory holds ``model.onnx``, a sentence-transformer style encoder
+exported to ONNX (e.g. with ``optimum-cli export onnx``), and the
+``tokenizer.json`` of its tokenizer. Texts are tokenized a batch at a time,
+run through the model, mean pooled over the attention mask and L2 normalized
+with numpy. onnxruntime and the tokenizer release the GIL, so batches run in a
+bounded thread pool and the event loop keeps serving while they do.
+
+Vectors are padded with zeros to ``dimensions``, the width of the
+langchain_pg_embedding column. Padding changes neither the cosine distance nor
+the inner product, so collections embedded locally share the table and its
+indexes with collections embedded by OpenAI.
+
+Needs the optional ``onnxruntime`` and ``tokenizers`` packages
+(``poetry install -E local-embeddings`` in the indexer and the retriever).
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+try:
+    import numpy as np
+    import onnxruntime
+    from tokenizers import Tokenizer
+except ImportError:  # optional, only the local embedding backend needs them
+    onnxruntime = None
+
+
+class LocalEmbeddings:
+    """Implements the embed_documents/embed_query interface of langchain
+    Embeddings, and the async variants without blocking the event loop."""
+
+    def __init__(
+        self,
+        session,
+        tokenizer,
+        model: str,
+        dimensions: int = 1536,
+        batch_size: int = 32,
+        threads: int = 2,
+    ):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.model = model
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.input_names = {model_input.name for model_input in session.get_inputs()}
+        self.pool = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="embedding"
+        )
+
+    @classmethod
+    def from_path(
+        cls,
+        model_path: str,
+        model: Optional[str] = None,
+        dimensions: int = 1536,
+        batch_size: int = 32,
+        max_length: int = 512,
+        threads: int = 2,
+    ) -> "LocalEmbeddings":
+        if onnxruntime is None:
+            raise ImportError(
+                "Local embeddings need onnxruntime and tokenizers, "
+                "install them with poetry install -E local-embeddings"
+            )
+        options = onnxruntime.SessionOptions()
+        # the pool runs ``threads`` batches at a time, they share the cores
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // threads)
+        session = onnxruntime.InferenceSession(
+            os.path.join(model_path, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=max_length)
+        tokenizer.enable_padding()  # to the longest text of the batch
+        return cls(
+            session,
+            tokenizer,
+            model=model or os.path.basename(os.path.normpath(model_path)),
+            dimensions=dimensions,
+            batch_size=batch_size,
+            threads=threads,
+        )
+
+    @classmethod
+    def from_env_vars(cls) -> "LocalEmbeddings":
+        """
+        Creates LocalEmbeddings from environment variables.
+        Uses the following environment variables:
+        - EMBEDDING_LOCAL_MODEL_PATH: directory with model.onnx and tokenizer.json
+        - EMBEDDING_LOCAL_MODEL_NAME: name saved with the collections embedded by the
+          model (default: name of the model directory)
+        - EMBEDDING_LOCAL_BATCH_SIZE: texts run through the model at once (default: 32)
+        - EMBEDDING_LOCAL_MAX_LENGTH: tokens per text, longer texts are truncated
+          (default: 512)
+        - EMBEDDING_LOCAL_THREADS: batches run at the same time (default: 2)
+        """
+        return cls.from_path(
+            os.environ["EMBEDDING_LOCAL_MODEL_PATH"],
+            model=os.getenv("EMBEDDING_LOCAL_MODEL_NAME"),
+            batch_size=int(os.getenv("EMBEDDING_LOCAL_BATCH_SIZE", 32)),
+            max_length=int(os.getenv("EMBEDDING_LOCAL_MAX_LENGTH", 512)),
+            threads=int(os.getenv("EMBEDDING_LOCAL_THREADS", 2)),
+        )
+
+    def _embed_batch(self, texts: List[str]) -> "np.ndarray":
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        output = self.session.run(
+            None,
+            {name: value for name, value in inputs.items() if name in self.input_names},
+        )[0]
+        if output.ndim == 3:
+            # token embeddings, mean pooled over the tokens that are not padding
+            mask = attention_mask[:, :, None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        output = output / np.maximum(
+            np.linalg.norm(output, axis=1, keepdims=True), 1e-12
+        )
+        if output.shape[1] > self.dimensions:
+            raise ValueError(
+                f"{self.model} has {output.shape[1]} dimensions, "
+                f"the vector store holds {self.dimensions}"
+            )
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        vectors[:, : output.shape[1]] = output
+        return vectors
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
+        # texts of similar length are batched together, there is less padding to run
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        return [
+            order[start : start + self.batch_size]
+            for start in range(0, len(order), self.batch_size)
+        ]
+
+    def _collect(
+        self, texts: List[str], batches: List[List[int]], results
+    ) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for batch, batch_vectors in zip(batches, results):
+            vectors[batch] = batch_vectors
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = self._batches(texts)
+        results = self.pool.map(
+            self._embed_batch, [[texts[i] for i in batch] for batch in batches]
+        )
+        return self._collect(texts, batches, results)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        batches = self._batches(texts)
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self.pool, self._embed_batch, [texts[i] for i in batch]
+                )
+                for batch in batches
+            )
+        )
+        return self._collect(texts, batches, results)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
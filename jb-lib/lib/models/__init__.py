@@ -33,6 +33,7 @@ class JBBot(Base):
     credentials = Column(JSON) # {"API_KEY and other secrets"}
     version = Column(String, nullable=False) # 0.0.1
     channels = Column(JSON) # w, tele
+    execution_mode = Column(String, nullable=False, server_default="subprocess") # subprocess or in_process
     created_at = Column(
         TIMESTAMP(timezone=True), 
         server_default=func.now(), 
@@ -237,10 +238,11 @@ class JBFSMState(Base):
         nullable=False,
         onupdate=func.now(),
     )
-    pid = Column(String)  # , ForeignKey('jb_users.id'))
+    pid = Column(String, unique=True)  # session id, one state row per session
     state = Column(String)
     variables = Column(JSON)
     message = Column(String)
+    version = Column(Integer, nullable=False, server_default="0") # bumped on every save
 
 
 class JBPluginUUID(Base):
@@ -259,6 +261,59 @@ class JBPluginUUID(Base):
         onupdate=func.now(),
     )
 
+class JBQueryEmbedding(Base):
+    __tablename__ = "jb_query_embedding"
+
+    id = Column(String, primary_key=True)  # sha256 of model and normalized query
+    model = Column(String, nullable=False)
+    query = Column(Text, nullable=False)
+    embedding = Column(ARRAY(Float), nullable=False)
+    created_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class JBKafkaPayload(Base):
+    """Large fields of Kafka messages, shipped by reference (see lib.kafka.claim_check)."""
+
+    __tablename__ = "jb_kafka_payload"
+
+    id = Column(String, primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON object of the offloaded fields
+    created_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+
+
+class JBIndexerJob(Base):
+    __tablename__ = "jb_indexer_job"
+
+    id = Column(String, primary_key=True)
+    collection_name = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # queued, running, completed or failed
+    request = Column(JSON, nullable=False)  # the IndexerInput of the job
+    files = Column(JSON)  # {file: {"status": ..., "chunks": ..., "error": ...}}
+    chunks_total = Column(Integer)
+    chunks_embedded = Column(Integer, nullable=False, server_default="0")
+    chunks_reused = Column(Integer, nullable=False, server_default="0")
+    chunks_deleted = Column(Integer)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    error = Column(Text)
+    worker = Column(String)
+    heartbeat_at = Column(TIMESTAMP(timezone=True))
+    estimated_finish_at = Column(TIMESTAMP(timezone=True))
+    started_at = Column(TIMESTAMP(timezone=True))
+    finished_at = Column(TIMESTAMP(timezone=True))
+    created_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        onupdate=func.now(),
+    )
 
 
 # class LangchainPgCollection(Base):
@@ -0,0 +1,86 @@
+"""Stateless references used to route 3rd party plugin webhooks back to a session.
+
+Flow mints a reference for every turn when PLUGIN_REFERENCE_SECRET is set and
+hands it to the bot as the ``plugin_reference`` variable. The bot passes it to
+the plugin, which echoes it back in its webhook body. Signed references carry
+the session and turn ids together with an expiry and an HMAC, so the api can
+verify them without a database lookup. They keep the ``jbkey...jbkey`` framing
+of the DB-backed references and only use hex digits inside the frame, so the
+framing can never appear in the payload.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import NamedTuple, Optional
+
+JB_IDENTIFIER = "jbkey"
+SIGNATURE_SEPARATOR = "."
+
+
+class InvalidPluginReference(ValueError):
+    """Raised when a signed plugin reference is malformed, tampered or expired."""
+
+
+class PluginReference(NamedTuple):
+    session_id: str
+    turn_id: str
+
+
+class PluginReferenceSigner:
+    def __init__(self, secret: str, ttl: int = 24 * 60 * 60):
+        if not secret:
+            raise ValueError("secret must not be empty")
+        self.secret = secret.encode()
+        self.ttl = ttl
+
+    @classmethod
+    def from_env_vars(cls) -> Optional["PluginReferenceSigner"]:
+        """
+        Creates a PluginReferenceSigner from environment variables.
+        Uses the following environment variables:
+        - PLUGIN_REFERENCE_SECRET: HMAC key; signed references are disabled if not set
+        - PLUGIN_REFERENCE_TTL: validity of a reference in seconds (default: 86400)
+        """
+        secret = os.getenv("PLUGIN_REFERENCE_SECRET")
+        if not secret:
+            return None
+        ttl = int(os.getenv("PLUGIN_REFERENCE_TTL", 24 * 60 * 60))
+        return cls(secret, ttl=ttl)
+
+    @staticmethod
+    def is_signed(reference_id: str) -> bool:
+        """DB-backed references never contain the signature separator."""
+        return SIGNATURE_SEPARATOR in reference_id
+
+    def _sign(self, payload: str) -> str:
+        # 128 bits of the digest are plenty for a short lived token
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def mint(self, session_id: str, turn_id: str) -> str:
+        expires_at = int(time.time()) + self.ttl
+        payload = json.dumps([session_id, turn_id, expires_at]).encode().hex()
+        signature = self._sign(payload)
+        return (
+            f"{JB_IDENTIFIER}{payload}{SIGNATURE_SEPARATOR}{signature}{JB_IDENTIFIER}"
+        )
+
+    def verify(self, reference_id: str) -> PluginReference:
+        if not (
+            reference_id.startswith(JB_IDENTIFIER)
+            and reference_id.endswith(JB_IDENTIFIER)
+        ):
+            raise InvalidPluginReference("Reference is not framed by the JB identifier")
+        body = reference_id[len(JB_IDENTIFIER) : -len(JB_IDENTIFIER)]
+        payload, _, signature = body.partition(SIGNATURE_SEPARATOR)
+        if not hmac.compare_digest(self._sign(payload), signature):
+            raise InvalidPluginReference("Reference signature mismatch")
+        try:
+            session_id, turn_id, expires_at = json.loads(bytes.fromhex(payload))
+        except ValueError as e:
+            raise InvalidPluginReference("Malformed reference payload") from e
+        if expires_at < time.time():
+            raise InvalidPluginReference("Reference expired")
+        return PluginReference(session_id=session_id, turn_id=turn_id)
@@ -0,0 +1,60 @@
+"""HTTP client for the retriever's search endpoint.
+
+A bot's dest="rag" output normally goes to the retriever through Kafka and the
+chunks come back to flow as a new message, which runs the bot once more. With
+this client flow (or any other service) searches inline and gets the chunks
+back in the same turn. The retriever serves the endpoint when
+RETRIEVER_HTTP_PORT is set.
+"""
+
+import logging
+import os
+from typing import List, Optional
+
+import httpx
+
+from .data_models import RAGInput, RAGResponse
+
+logger = logging.getLogger("retriever_client")
+
+
+class RetrieverClient:
+    def __init__(self, base_url: str, timeout: float = 10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env_vars(cls) -> Optional["RetrieverClient"]:
+        """
+        Creates a RetrieverClient from environment variables.
+        Uses the following environment variables:
+        - RETRIEVER_URL: base url of the retriever, e.g. http://retriever:8000
+        - RETRIEVER_TIMEOUT: seconds a search may take (default: 10)
+        Returns None if RETRIEVER_URL is not set.
+        """
+        base_url = os.getenv("RETRIEVER_URL")
+        if not base_url:
+            return None
+        return cls(base_url, timeout=float(os.getenv("RETRIEVER_TIMEOUT", 10)))
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # one pooled client, connections are reused across searches
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout
+            )
+        return self._client
+
+    async def search(self, rag_input: RAGInput) -> List[RAGResponse]:
+        response = await self.client.post(
+            "/search", json=rag_input.model_dump(mode="json")
+        )
+        response.raise_for_status()
+        return [RAGResponse(**chunk) for chunk in response.json()]
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,23 @@
+"""Backoff for retrying rate limited and transient API failures."""
+
+import random
+
+
+def retry_delay(
+    attempt: int, error: Exception, base_delay: float, max_delay: float
+) -> float:
+    """Seconds to wait before retry number ``attempt`` (from 0) after ``error``.
+
+    A ``Retry-After`` header on the error's response is honoured, otherwise the
+    delay doubles with every attempt, with jitter so that concurrent callers
+    don't retry in lockstep. Either way it is capped at ``max_delay``.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), max_delay)
+    except ValueError:
+        pass
+    delay = min(base_delay * 2**attempt, max_delay)
+    return delay * (0.5 + random.random() / 2)
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+from lib.kafka.claim_check import CLAIM_CHECK_KEY, ClaimCheck, ClaimCheckError
+
+
+class FakeStore:
+    def __init__(self):
+        self.payloads = {}
+        self.reads = 0
+
+    def put(self, payload_id, payload, ttl):
+        self.payloads[payload_id] = payload
+
+    def get_many(self, payload_ids):
+        self.reads += 1
+        return {i: self.payloads[i] for i in payload_ids if i in self.payloads}
+
+    def delete_expired(self, limit=1000):
+        return 0
+
+
+def claim_check(**kwargs):
+    return ClaimCheck(FakeStore(), threshold=100, **kwargs)
+
+
+def test_small_message_is_sent_as_is():
+    check = claim_check()
+    value = json.dumps({"text": "hello"})
+    assert check.offload(value) is value
+    assert check.resolve(value) is value
+    assert check.store.payloads == {}
+    assert check.store.reads == 0
+
+
+def test_large_fields_are_offloaded_and_resolved():
+    check = claim_check()
+    message = {
+        "session_id": "s1",
+        "rag_response": [{"chunk": "नमस्ते " * 20}, {"chunk": "b" * 80}],
+        "state": {"variables": "c" * 120},
+    }
+    offloaded = check.offload(json.dumps(message))
+    sent = json.loads(offloaded)
+    assert sent["session_id"] == "s1"
+    assert "rag_response" not in sent and "state" not in sent
+    assert sent[CLAIM_CHECK_KEY]["fields"] == ["rag_response", "state"]
+    assert len(check.store.payloads) == 1  # one payload per message
+    assert json.loads(check.resolve(offloaded)) == message
+    assert check.store.reads == 1
+
+
+def test_disabled_producer_still_resolves():
+    store = FakeStore()
+    producer = ClaimCheck(store, threshold=100)
+    consumer = ClaimCheck(store, enabled=False, threshold=100)
+    message = {"plugin_input": "x" * 500}
+    assert consumer.offload(json.dumps(message)) == json.dumps(message)
+    assert (
+        json.loads(consumer.resolve(producer.offload(json.dumps(message)))) == message
+    )
+
+
+def test_expired_payload():
+    check = claim_check()
+    offloaded = check.offload(json.dumps({"plugin_input": "x" * 500}))
+    check.store.payloads.clear()
+    with pytest.raises(ClaimCheckError):
+        check.resolve(offloaded)
+
+
+def test_store_failure_sends_message_inline():
+    check = claim_check()
+
+    def put(*args):
+        raise ConnectionError("database is down")
+
+    check.store.put = put
+    value = json.dumps({"plugin_input": "x" * 500})
+    assert check.offload(value) == value
+
+
+def test_reference_in_user_data_is_not_resolved():
+    check = claim_check()
+    check.store.payloads["0" * 32] = json.dumps({"plugin_input": "secret"})
+    # e.g. a webhook body, it is data of the plugin_input field
+    message = {"plugin_input": {CLAIM_CHECK_KEY: "0" * 32}}
+    value = check.offload(json.dumps(message))
+    assert json.loads(check.resolve(value)) == message
+    assert check.store.reads == 0
+
+
+def test_reserved_key_at_top_level():
+    check = claim_check(enabled=False)
+    with pytest.raises(ValueError):
+        check.offload(json.dumps({CLAIM_CHECK_KEY: {"id": "0" * 32, "fields": []}}))
+
+
+@pytest.mark.parametrize(
+    "reference",
+    [
+        "0" * 32,
+        {"id": "../" + "0" * 29, "fields": ["text"]},
+        {"id": "0" * 32, "fields": "text"},
+        {"id": "0" * 32, "fields": ["session_id"]},
+    ],
+)
+def test_malformed_reference(reference):
+    check = claim_check()
+    value = json.dumps({"session_id": "s1", CLAIM_CHECK_KEY: reference})
+    with pytest.raises(ClaimCheckError):
+        check.resolve(value)
@@ -0,0 +1,180 @@
+import json
+
+import pytest
+from lib.data_models import (
+    BotInput,
+    BotOutput,
+    ChannelBotOut,
+    ChannelInput,
+    ChannelIntent,
+    FlowInput,
+    LanguageIn,
+    LanguageInput,
+    MessageData,
+    MessageType,
+    RAGResponse,
+    channel_input_adapter,
+    language_input_adapter,
+)
+from lib.kafka import ClaimCheck, EnvelopeError, KafkaConsumer, KafkaProducer
+from lib.kafka import envelope
+
+
+class FakeProducer:
+    def __init__(self, config):
+        self.messages = []
+
+    def produce(self, topic, value, key=None, callback=None):
+        self.messages.append(value)
+
+    def flush(self):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    def __init__(self, config):
+        self.messages = []
+
+    def subscribe(self, topics):
+        pass
+
+    def poll(self, timeout):
+        return self.messages.pop(0) if self.messages else None
+
+
+class FakeStore:
+    def __init__(self):
+        self.payloads = {}
+
+    def put(self, payload_id, payload, ttl):
+        self.payloads[payload_id] = payload
+
+    def get_many(self, payload_ids):
+        return {i: self.payloads[i] for i in payload_ids}
+
+
+def channel_output():
+    return ChannelInput(
+        source="flow",
+        session_id="s1",
+        turn_id="t1",
+        intent=ChannelIntent.BOT_OUT,
+        data=BotOutput(
+            message_type=MessageType.TEXT,
+            message_data=MessageData(message_text="hello"),
+        ),
+    )
+
+
+@pytest.fixture(autouse=True)
+def fake_clients(monkeypatch):
+    monkeypatch.setattr("lib.kafka.kafka_producer.Producer", FakeProducer)
+    monkeypatch.setattr("lib.kafka.kafka_consumer.Consumer", FakeConsumer)
+
+
+def roundtrip(messages, claim_check=None, use_envelope=True):
+    producer = KafkaProducer(
+        "kafka:9092", claim_check=claim_check, use_envelope=use_envelope
+    )
+    for message in messages:
+        producer.send_model("topic", message)
+    sent = [
+        value.encode("utf-8") if isinstance(value, str) else value
+        for value in producer.producer.messages
+    ]
+    consumer = KafkaConsumer("kafka:9092", "group", "latest", claim_check=claim_check)
+    consumer.consumer.messages = [FakeMessage(value) for value in sent]
+    return sent, consumer
+
+
+def test_pack_unpack():
+    body = b'{"source":"api"}'
+    assert envelope.unpack(envelope.pack(body)) == body
+    assert envelope.unpack(envelope.pack(body.decode())) == body
+    assert envelope.unpack(body) == body  # plain JSON of an older producer
+
+
+def test_unsupported_version():
+    with pytest.raises(EnvelopeError):
+        envelope.unpack(b"\x00\x7f{}")
+
+
+def test_adapters_validate_data_by_intent():
+    # a BOT_OUT data with the fields of a BotInput is still a BotOutput
+    channel_input = channel_input_adapter.validate_json(
+        channel_output().model_dump_json()
+    )
+    assert isinstance(channel_input, ChannelBotOut)
+    assert isinstance(channel_input, ChannelInput)
+    assert type(channel_input.data) is BotOutput
+    assert channel_input.intent == ChannelIntent.BOT_OUT
+
+    language_input = language_input_adapter.validate_json(
+        b'{"source": "channel", "session_id": "s1", "turn_id": "t1", "intent": "language_in",'
+        b' "data": {"message_type": "text", "message_data": {"message_text": "hi"}}}'
+    )
+    assert isinstance(language_input, LanguageIn)
+    assert type(language_input.data) is BotInput
+
+
+def test_dicts_are_validated_by_intent():
+    message = json.loads(channel_output().model_dump_json())
+    assert type(ChannelInput(**message).data) is BotOutput
+    message["intent"] = "language_out"
+    assert type(LanguageInput(**message).data) is BotOutput
+    with pytest.raises(ValueError):
+        LanguageInput(**{**message, "intent": "bot_out"})
+
+
+def test_producer_to_consumer():
+    flow_input = FlowInput(source="api", session_id="s1", message_text="hi")
+    sent, consumer = roundtrip([channel_output(), flow_input])
+    assert all(value.startswith(envelope.HEADER) for value in sent)
+    channel_input = consumer.receive_model("topic", channel_input_adapter)
+    assert channel_input.model_dump() == channel_output().model_dump()
+    assert consumer.receive_model("topic", FlowInput) == flow_input
+
+
+def test_consumer_timeout():
+    _, consumer = roundtrip([channel_output()])
+    assert consumer.receive_model("topic", channel_input_adapter, 1.0) is not None
+    assert consumer.receive_model("topic", channel_input_adapter, 1.0) is None
+    assert consumer.receive_message("topic", timeout=1.0) is None
+
+
+def test_consumer_reads_plain_json():
+    _, consumer = roundtrip([channel_output()], use_envelope=False)
+    assert json.loads(consumer.receive_message("topic")) == json.loads(
+        channel_output().model_dump_json()
+    )
+
+
+def test_claim_checked_model():
+    claim_check = ClaimCheck(FakeStore(), threshold=100)
+    flow_input = FlowInput(
+        source="retriever",
+        session_id="s1",
+        rag_response=[RAGResponse(chunk="x" * 200)],
+    )
+    sent, consumer = roundtrip([flow_input], claim_check=claim_check)
+    assert b"x" * 200 not in sent[0]
+    assert consumer.receive_model("topic", FlowInput) == flow_input
+
+
+def test_envelope_is_opt_in(monkeypatch):
+    monkeypatch.setenv("KAFKA_BROKER", "kafka:9092")
+    monkeypatch.delenv("KAFKA_ENVELOPE", raising=False)
+    assert not KafkaProducer.from_env_vars().use_envelope
+    monkeypatch.setenv("KAFKA_ENVELOPE", "true")
+    assert KafkaProducer.from_env_vars().use_envelope
@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from lib.local_embeddings import LocalEmbeddings
+
+
+class FakeTokenizer:
+    """One token per word, padded to the longest text of the batch."""
+
+    def encode_batch(self, texts):
+        length = max(len(text.split()) for text in texts)
+        encodings = []
+        for text in texts:
+            ids = [len(word) for word in text.split()]
+            padding = length - len(ids)
+            encodings.append(
+                SimpleNamespace(
+                    ids=ids + [0] * padding,
+                    attention_mask=[1] * len(ids) + [0] * padding,
+                    type_ids=[0] * length,
+                )
+            )
+        return encodings
+
+
+class FakeSession:
+    """Token embeddings [id, 1, 0]; padding tokens get large values that pooling must ignore."""
+
+    def __init__(self):
+        self.batches = []
+
+    def get_inputs(self):
+        return [
+            SimpleNamespace(name="input_ids"),
+            SimpleNamespace(name="attention_mask"),
+        ]
+
+    def run(self, output_names, inputs):
+        assert set(inputs) == {"input_ids", "attention_mask"}
+        self.batches.append(len(inputs["input_ids"]))
+        ids = inputs["input_ids"].astype(np.float32)
+        mask = inputs["attention_mask"].astype(np.float32)
+        padding = (1 - mask) * 1000
+        tokens = np.stack(
+            [ids + padding, np.ones_like(ids), np.zeros_like(ids)], axis=-1
+        )
+        return [tokens]
+
+
+def embeddings(**kwargs):
+    return LocalEmbeddings(
+        FakeSession(), FakeTokenizer(), model="fake", dimensions=8, **kwargs
+    )
+
+
+def test_mean_pooled_normalized_and_padded():
+    vector = embeddings().embed_query("abc abc")
+    expected = np.array([3, 1, 0]) / np.linalg.norm([3, 1, 0])
+    assert len(vector) == 8
+    assert np.allclose(vector[:3], expected)
+    assert vector[3:] == [0] * 5
+
+
+def test_padding_tokens_are_ignored():
+    local = embeddings()
+    alone = local.embed_query("ab")
+    # batched with a longer text, "ab" is padded
+    assert np.allclose(local.embed_documents(["ab", "abcd abcd abcd"])[0], alone)
+
+
+def test_order_is_kept_across_batches():
+    local = embeddings(batch_size=2)
+    texts = ["a a a a", "abcdef", "ab ab", "abc", "a"]
+    vectors = local.embed_documents(texts)
+    assert local.session.batches == [2, 2, 1]
+    assert [np.round(vector[0] / vector[1]) for vector in vectors] == [1, 6, 2, 3, 1]
+
+
+def test_too_many_dimensions():
+    local = LocalEmbeddings(FakeSession(), FakeTokenizer(), model="fake", dimensions=2)
+    with pytest.raises(ValueError):
+        local.embed_query("a")
+
+
+@pytest.mark.asyncio
+async def test_async_matches_sync():
+    local = embeddings(batch_size=1)
+    texts = ["abc", "a a", "abcd ab"]
+    assert await local.aembed_documents(texts) == local.embed_documents(texts)
+    assert await local.aembed_query("abc") == local.embed_query("abc")
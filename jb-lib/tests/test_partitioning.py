@@ -0,0 +1,191 @@
+"""Per-session ordering with N replicas of a service.
+
+Kafka keeps messages in order within a partition, sends messages with the same
+key to the same partition, and assigns each partition of a topic to one member
+of a consumer group at a time (https://kafka.apache.org/documentation/#intro_concepts_and_terms,
+#theconsumer). The tests check the part that is ours, that every message is
+keyed by its session, against a broker that follows those rules: the default
+partitioner of librdkafka (consistent_random) hashes keys with CRC32.
+"""
+
+import random
+import zlib
+
+import pytest
+from lib.data_models import (
+    BotInput,
+    FlowInput,
+    IndexerInput,
+    LanguageInput,
+    LanguageIntent,
+    MessageData,
+    MessageType,
+    language_input_adapter,
+)
+from lib.kafka import KafkaConsumer, KafkaHandler, KafkaProducer
+
+PARTITIONS = 6
+
+
+class FakeBroker:
+    def __init__(self, partitions=PARTITIONS):
+        self.partitions = [[] for _ in range(partitions)]
+        self.positions = [0] * partitions
+
+    def produce(self, key, value):
+        if key is None:
+            partition = random.randrange(len(self.partitions))
+        else:
+            partition = zlib.crc32(key.encode("utf-8")) % len(self.partitions)
+        self.partitions[partition].append(value)
+
+
+broker = FakeBroker()
+
+
+class FakeProducer:
+    def __init__(self, config):
+        self.keys = []
+
+    def produce(self, topic, value, key=None, callback=None):
+        self.keys.append(key)
+        # consumers get bytes back, whatever was produced
+        broker.produce(key, value.encode("utf-8") if isinstance(value, str) else value)
+
+    def flush(self):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+class FakeConsumer:
+    def __init__(self, config):
+        self.config = config
+        self.assignment = []
+
+    def subscribe(self, topics):
+        pass
+
+    def pending(self):
+        return any(
+            broker.positions[partition] < len(broker.partitions[partition])
+            for partition in self.assignment
+        )
+
+    def poll(self, timeout):
+        for partition in self.assignment:
+            if broker.positions[partition] < len(broker.partitions[partition]):
+                value = broker.partitions[partition][broker.positions[partition]]
+                broker.positions[partition] += 1
+                return FakeMessage(value)
+        return None
+
+
+@pytest.fixture(autouse=True)
+def fake_clients(monkeypatch):
+    global broker
+    broker = FakeBroker()
+    monkeypatch.setattr("lib.kafka.kafka_producer.Producer", FakeProducer)
+    monkeypatch.setattr("lib.kafka.kafka_consumer.Consumer", FakeConsumer)
+    monkeypatch.setenv("KAFKA_BROKER", "kafka:9092")
+
+
+def language_input(session_id, turn):
+    return LanguageInput(
+        source="channel",
+        session_id=session_id,
+        turn_id=str(turn),
+        intent=LanguageIntent.LANGUAGE_IN,
+        data=BotInput(
+            message_type=MessageType.TEXT,
+            message_data=MessageData(message_text=f"message {turn}"),
+        ),
+    )
+
+
+def test_messages_are_keyed_by_session():
+    producer = KafkaProducer("kafka:9092")
+    producer.send_model("language", language_input("s1", 0))
+    producer.send_model("flow", FlowInput(source="api", session_id="s2"))
+    producer.send_model("flow", FlowInput(source="api", session_id="s2"), key="other")
+    producer.send_model("indexer", IndexerInput(collection_name="faq", files=[]))
+    assert producer.producer.keys == ["s1", "s2", "other", None]
+
+
+def test_consumer_group_config(monkeypatch):
+    consumer = KafkaConsumer.from_env_vars(
+        group_id="jb-flow", auto_offset_reset="latest"
+    )
+    assert consumer.consumer_config["group.id"] == "jb-flow"
+    assert (
+        consumer.consumer_config["partition.assignment.strategy"]
+        == "cooperative-sticky"
+    )
+    assert "group.instance.id" not in consumer.consumer_config
+
+    monkeypatch.setenv("KAFKA_CONSUMER_GROUP_ID", "jb-flow-staging")
+    monkeypatch.setenv("KAFKA_GROUP_INSTANCE_ID", "flow-0")
+    monkeypatch.setenv("KAFKA_USE_SASL", "true")
+    monkeypatch.setenv("KAFKA_CONSUMER_USERNAME", "user")
+    monkeypatch.setenv("KAFKA_CONSUMER_PASSWORD", "password")
+    consumer = KafkaConsumer.from_env_vars(
+        group_id="jb-flow", auto_offset_reset="latest"
+    )
+    assert consumer is not None
+    assert consumer.consumer_config["group.id"] == "jb-flow-staging"
+    assert consumer.consumer_config["group.instance.id"] == "flow-0"
+    assert consumer.consumer_config["security.protocol"] == "SASL_SSL"
+
+
+def test_handler_consumer_group(monkeypatch):
+    monkeypatch.setattr(KafkaHandler, "__consumer__", None)
+    consumer = KafkaHandler.get_consumer(group_id="jb-channel")
+    assert consumer.consumer_config["group.id"] == "jb-channel"
+
+
+@pytest.mark.parametrize("replicas", [1, 2, 3, 6])
+def test_session_order_with_replicas(replicas):
+    rng = random.Random(replicas)
+    sessions = [f"session-{i}" for i in range(20)]
+    producer = KafkaProducer("kafka:9092")
+    turns = {session: 0 for session in sessions}
+    for _ in range(400):
+        session = rng.choice(sessions)
+        producer.send_model("language", language_input(session, turns[session]))
+        turns[session] += 1
+
+    consumers = [
+        KafkaConsumer("kafka:9092", "jb-language", "latest") for _ in range(replicas)
+    ]
+    for partition in range(PARTITIONS):
+        consumers[partition % replicas].consumer.assignment.append(partition)
+
+    received = {session: [] for session in sessions}
+    pending = 400
+    rebalanced = replicas == 1
+    while pending:
+        if pending <= 200 and not rebalanced:
+            # a rebalance moves a partition to another replica, it continues
+            # from the position the first one reached
+            partition = consumers[0].consumer.assignment.pop()
+            consumers[1].consumer.assignment.append(partition)
+            rebalanced = True
+        # replicas consume at their own pace
+        consumer = consumers[rng.randrange(replicas)]
+        if not consumer.consumer.pending():
+            continue
+        message = consumer.receive_model("language", language_input_adapter)
+        received[message.session_id].append(int(message.turn_id))
+        pending -= 1
+
+    for session in sessions:
+        assert received[session] == list(range(turns[session]))
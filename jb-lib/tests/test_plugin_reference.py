@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from lib.plugin_reference import (
+    InvalidPluginReference,
+    PluginReference,
+    PluginReferenceSigner,
+)
+
+# the parser the api runs on webhook bodies
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "api"))
+from app.utils import extract_reference_id  # noqa: E402
+
+
+class TestPluginReferenceSigner:
+    signer = PluginReferenceSigner("secret", ttl=60)
+
+    def test_round_trip(self):
+        reference_id = self.signer.mint("session-1", "turn-1")
+        assert PluginReferenceSigner.is_signed(reference_id)
+        assert self.signer.verify(reference_id) == PluginReference(
+            session_id="session-1", turn_id="turn-1"
+        )
+
+    def test_survives_webhook_framing(self):
+        reference_id = self.signer.mint("jbkey-session", "turn")
+        webhook_body = f'{{"order": "{reference_id}", "status": "paid"}}'
+        extracted = extract_reference_id(webhook_body)
+        assert extracted == reference_id
+        assert self.signer.verify(extracted).session_id == "jbkey-session"
+
+    def test_legacy_reference_is_not_signed(self):
+        assert not PluginReferenceSigner.is_signed(
+            "jbkey1b4e28ba-2fa1-11d2-883f-0jbkey"
+        )
+
+    def test_tampered_reference(self):
+        reference_id = self.signer.mint("session-1", "turn-1")
+        other = PluginReferenceSigner("other-secret").mint("session-2", "turn-1")
+        payload = other[len("jbkey") :].split(".")[0]
+        forged = "jbkey" + payload + reference_id[reference_id.index(".") :]
+        with pytest.raises(InvalidPluginReference):
+            self.signer.verify(forged)
+        with pytest.raises(InvalidPluginReference):
+            PluginReferenceSigner("other-secret").verify(reference_id)
+
+    def test_expired_reference(self):
+        reference_id = self.signer.mint("session-1", "turn-1")
+        with patch("lib.plugin_reference.time.time", return_value=10**12):
+            with pytest.raises(InvalidPluginReference):
+                self.signer.verify(reference_id)
+
+    @patch("lib.plugin_reference.os.getenv")
+    def test_from_env_vars(self, mock_getenv):
+        mock_getenv.return_value = None
+        assert PluginReferenceSigner.from_env_vars() is None
+        mock_getenv.side_effect = lambda key, default=None: {
+            "PLUGIN_REFERENCE_SECRET": "secret",
+            "PLUGIN_REFERENCE_TTL": "30",
+        }.get(key, default)
+        signer = PluginReferenceSigner.from_env_vars()
+        assert signer.ttl == 30
@@ -0,0 +1,55 @@
+import json
+
+import httpx
+import pytest
+from lib.data_models import RAGInput, RAGResponse
+from lib.retriever_client import RetrieverClient
+
+RAG_INPUT = RAGInput(
+    source="flow",
+    session_id="session-1",
+    turn_id="turn-1",
+    collection_name="faq",
+    query="what is the fee?",
+    top_chunk_k_value=2,
+    metadata={"document_name": "faq.pdf"},
+)
+
+
+def client_with(handler) -> RetrieverClient:
+    client = RetrieverClient("http://retriever:8000/")
+    client._client = httpx.AsyncClient(
+        base_url=client.base_url, transport=httpx.MockTransport(handler)
+    )
+    return client
+
+
+@pytest.mark.asyncio
+async def test_search():
+    def handler(request: httpx.Request):
+        assert request.url == "http://retriever:8000/search"
+        assert json.loads(request.content) == RAG_INPUT.model_dump(mode="json")
+        return httpx.Response(200, json=[{"chunk": "Rs. 100", "metadata": {"page": 2}}])
+
+    client = client_with(handler)
+    assert await client.search(RAG_INPUT) == [
+        RAGResponse(chunk="Rs. 100", metadata={"page": 2})
+    ]
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_search_error():
+    client = client_with(lambda request: httpx.Response(400, json={"detail": "no"}))
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.search(RAG_INPUT)
+    await client.close()
+
+
+def test_from_env_vars(monkeypatch):
+    monkeypatch.delenv("RETRIEVER_URL", raising=False)
+    assert RetrieverClient.from_env_vars() is None
+    monkeypatch.setenv("RETRIEVER_URL", "http://retriever:8000")
+    monkeypatch.setenv("RETRIEVER_TIMEOUT", "2.5")
+    client = RetrieverClient.from_env_vars()
+    assert (client.base_url, client.timeout) == ("http://retriever:8000", 2.5)
@@ -0,0 +1,23 @@
+from types import SimpleNamespace
+
+from lib.retry import retry_delay
+
+
+def error(headers):
+    return (
+        Exception()
+        if headers is None
+        else SimpleNamespace(response=SimpleNamespace(headers=headers))
+    )
+
+
+def test_retry_after_is_honoured_up_to_the_cap():
+    assert retry_delay(0, error({"retry-after": "3"}), 1, 60) == 3
+    assert retry_delay(0, error({"retry-after": "300"}), 1, 60) == 60
+
+
+def test_exponential_backoff_with_jitter():
+    for attempt in range(4):
+        delay = retry_delay(attempt, error(None), 1, 60)
+        assert 2**attempt / 2 <= delay <= 2**attempt
+    assert retry_delay(10, error({"retry-after": "soon"}), 1, 60) <= 60
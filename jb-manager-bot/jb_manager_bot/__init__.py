@@ -1,4 +1,5 @@
-__all__ = ["FSMOutput", "MessageData", "MessageType", "Status", "UploadFile", "AbstractFSM", "OptionsListType"]
+__all__ = ["FSMOutput", "MessageData", "MessageType", "Status", "UploadFile", "AbstractFSM", "OptionsListType", "RAGQuery", "SentenceStreamer"]
 
-from jb_manager_bot.data_models import FSMOutput, MessageData, MessageType, Status, UploadFile, OptionsListType
+from jb_manager_bot.data_models import FSMOutput, MessageData, MessageType, Status, UploadFile, OptionsListType, RAGQuery
 from jb_manager_bot.abstract_fsm import AbstractFSM
+from jb_manager_bot.streaming import SentenceStreamer
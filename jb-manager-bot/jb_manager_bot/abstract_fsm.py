@@ -2,16 +2,141 @@
 """
 
 from abc import ABC
-from typing import Any, Dict, List, Set
-from transitions import Machine
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from transitions import Machine, MachineError
 
 from jb_manager_bot.data_models import Status
 
+_TRANSITION_KEYS = {
+    "trigger",
+    "source",
+    "dest",
+    "conditions",
+    "unless",
+    "prepare",
+    "before",
+    "after",
+}
+
+
+def _listify(value) -> Tuple:
+    if value is None:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return (value,)
+
+
+class _CompiledTransition(NamedTuple):
+    dest: Optional[str]
+    conditions: Tuple[Tuple[Any, bool], ...]
+    prepare: Tuple
+    before: Tuple
+    after: Tuple
+
+
+class _CompiledMachine(NamedTuple):
+    """Transition table of an FSM class, built once per class.
+
+    ``events[trigger][source]`` lists the transitions in the order
+    ``transitions.Machine`` would evaluate them.
+    """
+
+    states: Tuple[str, ...]
+    events: Dict[str, Dict[str, List[_CompiledTransition]]]
+    on_enter: Dict[str, str]
+    on_exit: Dict[str, str]
+
+
+def _compile_machine(owner, states, transitions) -> Optional[_CompiledMachine]:
+    """Compile states and transitions with the semantics of ``transitions.Machine``.
+
+    Returns None if the definition uses a feature only ``transitions.Machine``
+    understands (state objects, dotted callback paths, ...), in which case the
+    FSM falls back to building a Machine per instance.
+    """
+    states = list(states)
+    if not all(isinstance(state, str) for state in states):
+        return None
+    if "zero" not in states:
+        states.append("zero")
+    transitions = sorted(
+        transitions,
+        key=lambda x: (x.get("source"), x.get("conditions", "")),
+        reverse=True,
+    )
+
+    events: Dict[str, Dict[str, List[_CompiledTransition]]] = {}
+    for transition in transitions:
+        if not set(transition) <= _TRANSITION_KEYS:
+            return None
+        callbacks = [
+            func
+            for key in ("conditions", "unless", "prepare", "before", "after")
+            for func in _listify(transition.get(key))
+        ]
+        if any(isinstance(func, str) and "." in func for func in callbacks):
+            return None
+
+        source = transition["source"]
+        sources = states if source == "*" else _listify(source)
+        for state in sources:
+            if state not in states:
+                raise ValueError(f"State '{state}' is not a registered state.")
+        dest = transition.get("dest")
+        if dest is not None and dest != "=" and dest not in states:
+            raise ValueError(f"State '{dest}' is not a registered state.")
+
+        conditions = tuple(
+            [(func, True) for func in _listify(transition.get("conditions"))]
+            + [(func, False) for func in _listify(transition.get("unless"))]
+        )
+        table = events.setdefault(transition["trigger"], {})
+        for state in sources:
+            table.setdefault(state, []).append(
+                _CompiledTransition(
+                    dest=state if dest == "=" else dest,
+                    conditions=conditions,
+                    prepare=_listify(transition.get("prepare")),
+                    before=_listify(transition.get("before")),
+                    after=_listify(transition.get("after")),
+                )
+            )
+
+    return _CompiledMachine(
+        states=tuple(states),
+        events=events,
+        on_enter={
+            state: f"on_enter_{state}"
+            for state in states
+            if callable(getattr(owner, f"on_enter_{state}", None))
+        },
+        on_exit={
+            state: f"on_exit_{state}"
+            for state in states
+            if callable(getattr(owner, f"on_exit_{state}", None))
+        },
+    )
+
+
+def _trigger_method(trigger: str):
+    def method(self, *args, **kwargs):
+        return self.trigger(trigger, *args, **kwargs)
+
+    method.__name__ = trigger
+    method.__doc__ = f"Trigger the '{trigger}' event."
+    method.__jb_trigger__ = True
+    return method
+
 
 class AbstractFSM(ABC):
     """Abstraction of the FSM class.
     Each use case will have its own FSM class.
     The FSM class will be used to define the states and transitions.
+
+    Plugins are given in ``self.plugins`` either as FSM instances or as zero
+    argument factories returning one. Factories are only called the first time
+    the plugin is run, so turns that never touch a plugin never build it.
     """
 
     states: List[str] = []
@@ -30,23 +155,127 @@ class AbstractFSM(ABC):
         self.variables = {}
         self.outputs = {}
         self.plugins = self.plugins if hasattr(self, "plugins") else {}
-        transitions = list(
-            sorted(
-                self.transitions,
-                key=lambda x: (x.get("source"), x.get("conditions", "")),
-                reverse=True,
+        self.__plugin_states__ = {}
+
+        if "states" in self.__dict__ or "transitions" in self.__dict__:
+            # definition customised per instance, nothing to share with the class
+            self.check_sanity()
+            self.__compiled__ = _compile_machine(self, self.states, self.transitions)
+        else:
+            self.__compiled__ = self._compiled_machine()
+        self.__machine__ = None
+        if self.__compiled__ is None:
+            self.__machine__ = Machine(
+                model=self,
+                states=list(self.states),
+                transitions=sorted(
+                    self.transitions,
+                    key=lambda x: (x.get("source"), x.get("conditions", "")),
+                    reverse=True,
+                ),
+                initial="zero",
             )
-        )
-        Machine(
-            model=self,
-            states=list(self.states),
-            transitions=transitions,
-            initial="zero",
-        )
+        else:
+            self.state = "zero"
 
         self.__input__ = None
         self.__callback__ = None
-        self.check_sanity()
+
+    @classmethod
+    def _compiled_machine(cls) -> Optional[_CompiledMachine]:
+        """Compile the class definition once and cache it on the class."""
+        if "__compiled_machine__" in cls.__dict__:
+            return cls.__compiled_machine__
+        cls.check_sanity()
+        compiled = _compile_machine(cls, cls.states, cls.transitions)
+        if compiled is not None:
+            for trigger in compiled.events:
+                existing = getattr(cls, trigger, None)
+                if existing is None or getattr(existing, "__jb_trigger__", False):
+                    setattr(cls, trigger, _trigger_method(trigger))
+        cls.__compiled_machine__ = compiled
+        return compiled
+
+    def __getattr__(self, name: str):
+        # only reached for attributes that do not exist, mirrors the helpers
+        # transitions.Machine adds to the model: to_<state>, is_<state>, may_<trigger>
+        compiled = self.__dict__.get("__compiled__")
+        if compiled is not None:
+            prefix, _, target = name.partition("_")
+            if prefix == "to" and target in compiled.states:
+                return lambda *args, **kwargs: self._change_state(target, args, kwargs)
+            if prefix == "is" and target in compiled.states:
+                return lambda: self.state == target
+            if prefix == "may" and target in compiled.events:
+                return lambda *args, **kwargs: self._may_trigger(target, args, kwargs)
+        raise AttributeError(
+            f"'{type(self).__name__}' object has no attribute '{name}'"
+        )
+
+    def _resolve(self, func) -> Callable:
+        if isinstance(func, str):
+            func = getattr(self, func)
+            if not callable(func):
+                value = func
+                return lambda *_, **__: value
+        return func
+
+    def _run_callbacks(self, funcs, args, kwargs):
+        for func in funcs:
+            self._resolve(func)(*args, **kwargs)
+
+    def _conditions_met(self, transition: _CompiledTransition, args, kwargs) -> bool:
+        for func, target in transition.conditions:
+            if not self._resolve(func)(*args, **kwargs) == target:
+                return False
+        return True
+
+    def _change_state(self, dest: str, args, kwargs):
+        compiled = self.__compiled__
+        if self.state in compiled.on_exit:
+            getattr(self, compiled.on_exit[self.state])(*args, **kwargs)
+        self.state = dest
+        if dest in compiled.on_enter:
+            getattr(self, compiled.on_enter[dest])(*args, **kwargs)
+        return True
+
+    def _transitions_for(self, trigger: str):
+        table = self.__compiled__.events.get(trigger)
+        if table is None:
+            raise AttributeError(f"Do not know event named '{trigger}'.")
+        candidates = table.get(self.state)
+        if candidates is None:
+            if self.state not in self.__compiled__.states:
+                raise ValueError(f"State '{self.state}' is not a registered state.")
+            raise MachineError(
+                f"Can't trigger event {trigger} from state {self.state}!"
+            )
+        return candidates
+
+    def _may_trigger(self, trigger: str, args, kwargs) -> bool:
+        for transition in self._transitions_for(trigger):
+            self._run_callbacks(transition.prepare, args, kwargs)
+            if self._conditions_met(transition, args, kwargs):
+                return True
+        return False
+
+    def trigger(self, trigger_name: str, *args, **kwargs) -> bool:
+        """Fire an event, e.g. ``self.trigger("next")``."""
+        if self.__machine__ is not None:
+            event = self.__machine__.events.get(trigger_name)
+            if event is None:
+                raise AttributeError(f"Do not know event named '{trigger_name}'.")
+            return event.trigger(self, *args, **kwargs)
+        for transition in self._transitions_for(trigger_name):
+            self._run_callbacks(transition.prepare, args, kwargs)
+            if not self._conditions_met(transition, args, kwargs):
+                continue
+            self._run_callbacks(transition.before, args, kwargs)
+            if transition.dest is not None:
+                self._change_state(transition.dest, args, kwargs)
+            self._run_callbacks(transition.after, args, kwargs)
+            return True
+        return False
 
     def initialise(self, **kwargs):
         """Method to initialise the FSM config."""
@@ -98,9 +327,26 @@ class AbstractFSM(ABC):
         self.__input__ = None
         self.__callback__ = None
 
+    def get_plugin(self, plugin: str) -> Optional["AbstractFSM"]:
+        """Return the plugin FSM, building and restoring it on first use."""
+        plugin_obj = self.plugins.get(plugin)
+        if plugin_obj is None or isinstance(plugin_obj, AbstractFSM):
+            return plugin_obj
+        plugin_obj = plugin_obj()
+        self.plugins[plugin] = plugin_obj
+        plugin_state = self.__plugin_states__.pop(plugin, None)
+        if plugin_state is not None:
+            plugin_obj._restore_state(
+                plugin_state["main"]["state"],
+                Status(plugin_state["main"]["status"]),
+                plugin_state["main"]["variables"],
+                plugin_state["plugins"],
+            )
+        return plugin_obj
+
     def run_plugin(self, plugin: str, **kwargs):
         """Method to run a plugin."""
-        plugin_obj: AbstractFSM = self.plugins.get(plugin)
+        plugin_obj: AbstractFSM = self.get_plugin(plugin)
         if not plugin_obj:
             raise ValueError(f"No such plugin found: {plugin}")
         if plugin_obj.state == "zero":
@@ -121,10 +367,13 @@ class AbstractFSM(ABC):
             "status": self.status.value,
             "variables": self.variables,
         }
-        plugin_states = {
-            plugin: plugin_obj._save_state()
-            for plugin, plugin_obj in self.plugins.items()
-        }
+        plugin_states = {}
+        for plugin, plugin_obj in self.plugins.items():
+            if isinstance(plugin_obj, AbstractFSM):
+                plugin_states[plugin] = plugin_obj._save_state()
+            elif plugin in self.__plugin_states__:
+                # never built this turn, carry its state over untouched
+                plugin_states[plugin] = self.__plugin_states__[plugin]
         return {"main": fsm_state, "plugins": plugin_states}
 
     def _restore_state(self, state, status, variables, plugin_states):
@@ -132,11 +381,15 @@ class AbstractFSM(ABC):
         self.status = Status(status)
         self.variables = variables
         for plugin, plugin_state in plugin_states.items():
+            plugin_obj = self.plugins[plugin]
+            if not isinstance(plugin_obj, AbstractFSM):
+                self.__plugin_states__[plugin] = plugin_state
+                continue
             state = plugin_state["main"]["state"]
             status = Status(plugin_state["main"]["status"])
             variables = plugin_state["main"]["variables"]
             plugins = plugin_state["plugins"]
-            self.plugins[plugin]._restore_state(state, status, variables, plugins)
+            plugin_obj._restore_state(state, status, variables, plugins)
 
     def reset(self):
         """Reset the FSM."""
@@ -145,7 +398,9 @@ class AbstractFSM(ABC):
         self.variables = {}
         self.outputs = {}
         for plugin in self.plugins.values():
-            plugin.reset()
+            if isinstance(plugin, AbstractFSM):
+                plugin.reset()
+        self.__plugin_states__ = {}
         self.reset_inputs()
 
     def set_outputs(self):
@@ -192,10 +447,10 @@ class AbstractFSM(ABC):
         if len(cls.transitions) == 0:
             raise ValueError("No transitions defined")
         for condition in cls.conditions:
-            if condition not in dir(cls):
+            if not hasattr(cls, condition):
                 raise ValueError(f"Condition {condition} not defined in class {cls}")
         for state in cls.states:
-            if not state == "zero" and f"on_enter_{state}" not in dir(cls):
+            if not state == "zero" and not hasattr(cls, f"on_enter_{state}"):
                 raise ValueError(
                     f"Implementation(On Enter Callback) of {state} not defined in class {cls}"
                 )
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
 
 class Status(Enum):
@@ -43,6 +43,15 @@ class UploadFile(BaseModel):
     mime_type: str
     filename: str
 
+class RAGQuery(BaseModel):
+    """
+    Model class to define what to retrieve for an output with dest="rag"."""
+
+    collection_name: Optional[str] = None
+    query: Optional[str] = None
+    top_chunk_k_value: Optional[int] = None
+    metadata: Optional[Dict[str, Any]] = None
+
 class FSMOutput(BaseModel):
     """
     Model class to define the FSM output."""
@@ -59,4 +68,5 @@ class FSMOutput(BaseModel):
     menu_selector: Optional[str] = None
     menu_title: Optional[str] = None
     form_token: Optional[str] = None
-    plugin_uuid: Optional[str] = None
\ No newline at end of file
+    plugin_uuid: Optional[str] = None
+    rag_query: Optional[RAGQuery] = None
\ No newline at end of file
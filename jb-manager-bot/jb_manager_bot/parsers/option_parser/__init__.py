@@ -1,7 +1,10 @@
 import os
 import json
+import threading
+from collections import Counter
 from pathlib import Path
 
+from jb_manager_bot.parsers.option_parser.matcher import match_option
 from jb_manager_bot.parsers.utils import LLMManager
 
 
@@ -13,6 +16,33 @@ class OptionParser:
     ) as f:
         system_prompt = f.read()
 
+    # how each parse was resolved: id, index, title, fuzzy or llm
+    match_counts = Counter()
+    _match_counts_lock = threading.Lock()
+
+    @classmethod
+    def _count(cls, method):
+        with cls._match_counts_lock:
+            cls.match_counts[method] += 1
+
+    @classmethod
+    def get_match_stats(cls):
+        """Return the parse counts per method and the share resolved without the LLM."""
+        with cls._match_counts_lock:
+            counts = dict(cls.match_counts)
+        total = sum(counts.values())
+        local = total - counts.get("llm", 0)
+        return {
+            "counts": counts,
+            "total": total,
+            "local_hit_rate": local / total if total else 0.0,
+        }
+
+    @classmethod
+    def reset_match_stats(cls):
+        with cls._match_counts_lock:
+            cls.match_counts.clear()
+
     @classmethod
     def parse(
         cls,
@@ -23,14 +53,27 @@ class OptionParser:
         azure_openai_api_key=None,
         azure_openai_api_version=None,
         azure_endpoint=None,
-        model="gpt-3.5-turbo"
+        model="gpt-3.5-turbo",
+        match_threshold=0.85,
     ):
-        """Parse the user input and return the most appropriate option ID based on the user's response."""
+        """Parse the user input and return the most appropriate option ID based on the user's response.
+
+        Replies that name an option by its id, number or title are matched locally;
+        the LLM is only asked when the reply is ambiguous. Pass ``match_threshold=None``
+        to always ask the LLM.
+        """
 
         for option in options:
             if "id" not in option and not hasattr(option, "id"):
                 raise ValueError("Option ID is required")
 
+        if match_threshold is not None:
+            match = match_option(options, user_input, threshold=match_threshold)
+            if match is not None:
+                cls._count(match.method)
+                return match.id
+        cls._count("llm")
+
         result = LLMManager.llm(
             messages=[
                 LLMManager.sm(cls.system_prompt),
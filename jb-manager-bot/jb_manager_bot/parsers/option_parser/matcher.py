@@ -0,0 +1,135 @@
+"""Deterministic option matching, tried before asking the LLM."""
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Iterator, List, NamedTuple, Optional
+
+_INDEX_PATTERN = re.compile(r"^(?:option|no|number)?\s*#?\s*(\d+)\s*[.)]?$")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+# negations, normalized, that may come in the two words before a title
+_NEGATIONS = {"no", "not", "never", "dont", "don t", "didn t", "won t", "can t"}
+_TITLE_SCORE = 0.9
+_TITLE_SHARE = 0.5  # of the words of the reply
+_TITLE_MIN_LENGTH = 4
+
+
+class OptionMatch(NamedTuple):
+    id: str
+    method: str  # id, index, title or fuzzy
+    score: float
+
+
+def normalize(text) -> str:
+    """Casefold, drop accents/combining marks and punctuation, collapse whitespace.
+
+    Dropping combining marks makes "Café" match "cafe" and also smooths over
+    spelling variants in Indic scripts (nukta, anusvara, chandrabindu).
+    """
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    text = _PUNCTUATION.sub(" ", text.casefold())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _option_field(option, field: str) -> str:
+    value = (
+        option.get(field) if isinstance(option, dict) else getattr(option, field, None)
+    )
+    return "" if value is None else str(value)
+
+
+def _occurrences(words: List[str], title_words: List[str]) -> Iterator[int]:
+    """Indexes of the whole-word occurrences of the title in the reply."""
+    size = len(title_words)
+    for start in range(len(words) - size + 1):
+        if size and words[start : start + size] == title_words:
+            yield start
+
+
+def _title_position(words: List[str], title_words: List[str]) -> Optional[int]:
+    """Index of the first whole-word occurrence of the title that is not negated."""
+    for start in _occurrences(words, title_words):
+        before = words[max(start - 2, 0) : start]
+        if " ".join(before) in _NEGATIONS or _NEGATIONS.intersection(before):
+            continue  # "not yes", "don't cancel", "not a refund"
+        return start
+    return None
+
+
+def _similarity(user_input: str, title: str) -> float:
+    if not user_input or not title:
+        return 0.0
+    score = SequenceMatcher(None, user_input, title).ratio()
+    # "yes please" or "i want the second plan" still name exactly one title, as
+    # long as the title is a real part of the reply: "a" in "i need a refund" is not
+    words = user_input.split()
+    title_words = title.split()
+    if (
+        len(title_words) / len(words) >= _TITLE_SHARE or len(title) >= _TITLE_MIN_LENGTH
+    ) and _title_position(words, title_words) is not None:
+        score = max(score, _TITLE_SCORE)
+    return score
+
+
+def match_option(
+    options: List, user_input, threshold: float = 0.85, margin: float = 0.1
+) -> Optional[OptionMatch]:
+    """Match the user input against the options without an LLM call.
+
+    Tries, in order: the option id, a 1-based option number, the normalized title
+    and finally fuzzy similarity to the titles. A fuzzy match is only accepted if
+    it scores at least ``threshold`` and beats the runner-up by ``margin``.
+    Returns None if the input is ambiguous.
+    """
+    if user_input is None or not options:
+        return None
+    raw = str(user_input).strip()
+    ids = [_option_field(option, "id") for option in options]
+    if raw in ids:
+        return OptionMatch(raw, "id", 1.0)
+
+    text = normalize(raw)
+    if not text:
+        return None
+    index = _INDEX_PATTERN.match(text)
+    if index is not None:
+        position = int(index.group(1))
+        if 1 <= position <= len(options):
+            return OptionMatch(ids[position - 1], "index", 1.0)
+        return None
+
+    titles = [normalize(_option_field(option, "title")) for option in options]
+    exact = [option_id for option_id, title in zip(ids, titles) if title == text]
+    if len(exact) == 1:
+        return OptionMatch(exact[0], "title", 1.0)
+    if len(exact) > 1:
+        return None
+    normalized_ids = [normalize(option_id) for option_id in ids]
+    if normalized_ids.count(text) == 1:
+        return OptionMatch(ids[normalized_ids.index(text)], "id", 1.0)
+
+    # "no, yes" names two options, which one the user means is for the LLM to decide
+    words = text.split()
+    mentioned = [
+        option_id
+        for option_id, title, normalized_id in zip(ids, titles, normalized_ids)
+        if next(_occurrences(words, title.split()), None) is not None
+        or next(_occurrences(words, normalized_id.split()), None) is not None
+    ]
+    if len(mentioned) > 1:
+        return None
+
+    scores = sorted(
+        (
+            (_similarity(text, title), option_id)
+            for option_id, title in zip(ids, titles)
+        ),
+        reverse=True,
+    )
+    best_score, best_id = scores[0]
+    runner_up = scores[1][0] if len(scores) > 1 else 0.0
+    if best_score >= threshold and best_score - runner_up >= margin:
+        return OptionMatch(best_id, "fuzzy", best_score)
+    return None
@@ -1,12 +1,117 @@
+import asyncio
+import copy
+import hashlib
+import inspect
 import json
-from typing import List
-from openai import OpenAI, AzureOpenAI
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    AsyncOpenAI,
+    AzureOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+_LLM_ARGS = ["model", "messages", "temperature", "tools", "stream", "response_format"]
+_RETRYABLE_ERRORS = (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+)
+
+
+class ResponseCache:
+    """Thread safe LRU cache of LLM responses with a time to live."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(args: Dict[str, Any], client_key: Tuple = ()) -> str:
+        # the client identity (credentials, api version, endpoint) is part of the key,
+        # so deployments behind different endpoints or keys never share responses
+        payload = json.dumps([client_key, args], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # tool call results are dicts, callers must not be able to mutate the cached one
+        return entry[1] if isinstance(entry[1], str) else copy.deepcopy(entry[1])
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class _AsyncRuntime:
+    """Async clients and the concurrency limit of one event loop."""
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.clients: Dict[Tuple, AsyncOpenAI] = {}
 
 
 class LLMManager:
     """Language Model Manager for OpenAI's GPT."""
 
-    client: OpenAI = None
+    # clients are keyed by their credentials, so switching keys gets a new client
+    _clients: Dict[Tuple, OpenAI] = {}
+    _clients_lock = threading.Lock()
+    # async clients are bound to the event loop that created them
+    _async_runtimes: (
+        "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _AsyncRuntime]"
+    ) = weakref.WeakKeyDictionary()
+
+    max_concurrency = 16
+    max_connections = 32
+    max_retries = 4
+    retry_base_delay = 0.5
+    retry_max_delay = 20.0
+    response_cache: Optional[ResponseCache] = None
+
+    @staticmethod
+    def _client_key(
+        openai_api_key, azure_openai_api_key, azure_openai_api_version, azure_endpoint
+    ) -> Tuple:
+        return (
+            openai_api_key,
+            azure_openai_api_key,
+            azure_openai_api_version,
+            azure_endpoint,
+        )
 
     @classmethod
     def get_client(
@@ -17,16 +122,142 @@ class LLMManager:
         azure_endpoint=None,
     ):
         """Return the OpenAI client."""
-        if cls.client is None:
+        key = cls._client_key(
+            openai_api_key,
+            azure_openai_api_key,
+            azure_openai_api_version,
+            azure_endpoint,
+        )
+        with cls._clients_lock:
+            client = cls._clients.get(key)
+            if client is None:
+                if azure_openai_api_key is not None:
+                    client = AzureOpenAI(
+                        api_key=azure_openai_api_key,
+                        api_version=azure_openai_api_version,
+                        azure_endpoint=azure_endpoint,
+                    )
+                else:
+                    client = OpenAI(api_key=openai_api_key)
+                cls._clients[key] = client
+        return client
+
+    @classmethod
+    def get_async_client(
+        cls,
+        openai_api_key=None,
+        azure_openai_api_key=None,
+        azure_openai_api_version=None,
+        azure_endpoint=None,
+    ):
+        """Return the async OpenAI client for the running event loop.
+
+        The client keeps a pool of up to ``max_connections`` connections. Retries are
+        done by ``allm`` itself, so the client's own retries are disabled.
+        """
+        runtime = cls._async_runtime()
+        key = cls._client_key(
+            openai_api_key,
+            azure_openai_api_key,
+            azure_openai_api_version,
+            azure_endpoint,
+        )
+        client = runtime.clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=cls.max_connections,
+                    max_keepalive_connections=cls.max_connections,
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
             if azure_openai_api_key is not None:
-                cls.client = AzureOpenAI(
+                client = AsyncAzureOpenAI(
                     api_key=azure_openai_api_key,
                     api_version=azure_openai_api_version,
                     azure_endpoint=azure_endpoint,
+                    http_client=http_client,
+                    max_retries=0,
                 )
             else:
-                cls.client = OpenAI(api_key=openai_api_key)
-        return cls.client
+                client = AsyncOpenAI(
+                    api_key=openai_api_key, http_client=http_client, max_retries=0
+                )
+            runtime.clients[key] = client
+        return client
+
+    @classmethod
+    def _async_runtime(cls) -> _AsyncRuntime:
+        loop = asyncio.get_running_loop()
+        runtime = cls._async_runtimes.get(loop)
+        if runtime is None:
+            runtime = _AsyncRuntime(cls.max_concurrency)
+            cls._async_runtimes[loop] = runtime
+        return runtime
+
+    @classmethod
+    def enable_response_cache(cls, max_size: int = 1024, ttl: float = 3600):
+        """Cache responses of deterministic calls (temperature ~0, no streaming)."""
+        cls.response_cache = ResponseCache(max_size=max_size, ttl=ttl)
+        return cls.response_cache
+
+    @classmethod
+    def disable_response_cache(cls):
+        cls.response_cache = None
+
+    @classmethod
+    def _build_args(cls, messages, kwargs) -> Dict[str, Any]:
+        args = {k: v for k, v in kwargs.items() if k in _LLM_ARGS}
+        args["model"] = kwargs.get("model")
+        args["messages"] = messages
+
+        if args.get("temperature", None) is None:
+            args["temperature"] = 1e-6
+        return args
+
+    @classmethod
+    def _cache_key(
+        cls, args: Dict[str, Any], use_cache: bool, client_key: Tuple
+    ) -> Optional[str]:
+        if (
+            not use_cache
+            or cls.response_cache is None
+            or args.get("stream", False)
+            or args["temperature"] > 1e-3
+        ):
+            return None
+        return ResponseCache.key(args, client_key)
+
+    @classmethod
+    def _parse_completion(cls, completions, args):
+        if args.get("tools", None) is None:
+            return completions.choices[0].message.content
+        if completions.choices[0].message.tool_calls is None:
+            return {
+                "function": None,
+                "message": completions.choices[0].message.content,
+            }
+        function = completions.choices[0].message.tool_calls[0].function
+        return {
+            "function": function.name,
+            "arguments": json.loads(function.arguments),
+        }
+
+    @classmethod
+    def _retry_delay(cls, attempt: int, error: Exception) -> float:
+        # same backoff as jb-lib's lib.retry.retry_delay; bots install this package
+        # from PyPI on its own, so it cannot import jb-lib
+        response = getattr(error, "response", None)
+        retry_after = (
+            response.headers.get("retry-after") if response is not None else None
+        )
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), cls.retry_max_delay)
+        except ValueError:
+            pass
+        delay = min(cls.retry_base_delay * 2**attempt, cls.retry_max_delay)
+        return delay * (0.5 + random.random() / 2)
 
     @classmethod
     def llm(
@@ -36,27 +267,25 @@ class LLMManager:
         azure_openai_api_key=None,
         azure_openai_api_version=None,
         azure_endpoint=None,
+        use_cache=True,
         **kwargs
     ):
         """Use the OpenAI Language Model API to generate a response based on the given messages."""
-        kwargs["model"] = kwargs.get("model")
-        kwargs["messages"] = messages
-        args = {
-            k: v
-            for k, v in kwargs.items()
-            if k
-            in [
-                "model",
-                "messages",
-                "temperature",
-                "tools",
-                "stream",
-                "response_format",
-            ]
-        }
-
-        if args.get("temperature", None) is None:
-            args["temperature"] = 1e-6
+        args = cls._build_args(messages, kwargs)
+        cache_key = cls._cache_key(
+            args,
+            use_cache,
+            cls._client_key(
+                openai_api_key,
+                azure_openai_api_key,
+                azure_openai_api_version,
+                azure_endpoint,
+            ),
+        )
+        if cache_key is not None:
+            cached = cls.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
 
         client = cls.get_client(
             openai_api_key=openai_api_key,
@@ -76,19 +305,81 @@ class LLMManager:
                         kwargs["callback"](choice.delta.content)
                         full_response += choice.delta.content
             return full_response
-        elif args.get("tools", None) is None:
-            return completions.choices[0].message.content
-        else:
-            if completions.choices[0].message.tool_calls is None:
-                return {
-                    "function": None,
-                    "message": completions.choices[0].message.content,
-                }
-            function = completions.choices[0].message.tool_calls[0].function
-            return {
-                "function": function.name,
-                "arguments": json.loads(function.arguments),
-            }
+
+        result = cls._parse_completion(completions, args)
+        if cache_key is not None:
+            cls.response_cache.set(cache_key, result)
+        return result
+
+    @classmethod
+    async def allm(
+        cls,
+        messages,
+        openai_api_key=None,
+        azure_openai_api_key=None,
+        azure_openai_api_version=None,
+        azure_endpoint=None,
+        use_cache=True,
+        **kwargs
+    ):
+        """Async version of ``llm``.
+
+        At most ``max_concurrency`` calls run at once per event loop, and rate limit,
+        timeout, connection and server errors are retried with exponential backoff
+        (honouring ``Retry-After``). For streaming, ``callback`` may be a coroutine
+        function.
+        """
+        args = cls._build_args(messages, kwargs)
+        cache_key = cls._cache_key(
+            args,
+            use_cache,
+            cls._client_key(
+                openai_api_key,
+                azure_openai_api_key,
+                azure_openai_api_version,
+                azure_endpoint,
+            ),
+        )
+        if cache_key is not None:
+            cached = cls.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        client = cls.get_async_client(
+            openai_api_key=openai_api_key,
+            azure_openai_api_key=azure_openai_api_key,
+            azure_openai_api_version=azure_openai_api_version,
+            azure_endpoint=azure_endpoint,
+        )
+        async with cls._async_runtime().semaphore:
+            attempt = 0
+            while True:
+                try:
+                    completions = await client.chat.completions.create(**args)
+                    break
+                except _RETRYABLE_ERRORS as error:
+                    if attempt >= cls.max_retries:
+                        raise
+                    await asyncio.sleep(cls._retry_delay(attempt, error))
+                    attempt += 1
+
+            if args.get("stream", False):
+                full_response = ""
+                async for chunk in completions:
+                    for choice in chunk.choices:
+                        if choice.finish_reason == "stop":
+                            break
+                        if choice.delta.content is not None:
+                            callback_result = kwargs["callback"](choice.delta.content)
+                            if inspect.isawaitable(callback_result):
+                                await callback_result
+                            full_response += choice.delta.content
+                return full_response
+
+        result = cls._parse_completion(completions, args)
+        if cache_key is not None:
+            cls.response_cache.set(cache_key, result)
+        return result
 
     @classmethod
     def sm(cls, prompt):
@@ -0,0 +1,102 @@
+"""Module to send streamed LLM responses to the user sentence by sentence.
+"""
+
+import re
+from typing import Callable, List, Optional
+
+from jb_manager_bot.data_models import FSMOutput, MessageData, MessageType
+
+# a sentence end is only certain once the next whitespace has arrived ("3.14", "e.g.")
+_SENTENCE_END = re.compile(r"[.!?।॥…]+[\"')\]]*\s+")
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+
+
+class SentenceStreamer:
+    """Buffer streamed deltas and send each completed chunk as its own message.
+
+    Pass an instance as the ``callback`` of ``LLMManager.llm(..., stream=True)``
+    (or ``allm``). A chunk is sent at every paragraph break and at the first
+    sentence boundary once it is at least ``min_chars`` long; text without a
+    usable boundary is cut at ``max_chars``, preferably at whitespace. Leaving
+    the ``with`` block sends whatever is left:
+
+        with SentenceStreamer(self.send_message) as streamer:
+            LLMManager.llm(messages, stream=True, callback=streamer, ...)
+    """
+
+    def __init__(
+        self,
+        send_message: Callable[[FSMOutput], None],
+        min_chars: int = 60,
+        max_chars: int = 600,
+        dest: str = "out",
+    ):
+        if min_chars > max_chars:
+            raise ValueError("min_chars must not be greater than max_chars")
+        self.send_message = send_message
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.dest = dest
+        self.sent: List[str] = []
+        self._buffer = ""
+
+    def __call__(self, delta: Optional[str]):
+        if not delta:
+            return
+        self._buffer += delta
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                return
+            self._send(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def flush(self):
+        """Send the buffered text, e.g. the last sentence of the response."""
+        self._send(self._buffer)
+        self._buffer = ""
+
+    @property
+    def text(self) -> str:
+        """Everything received so far."""
+        return "".join(self.sent) + self._buffer
+
+    def _find_cut(self) -> Optional[int]:
+        buffer = self._buffer
+        # a paragraph is always worth its own message, sentences are merged up to min_chars
+        for pattern, min_chars in (
+            (_PARAGRAPH_END, 1),
+            (_SENTENCE_END, self.min_chars),
+        ):
+            ends = [m.end() for m in pattern.finditer(buffer) if m.end() >= min_chars]
+            if ends and ends[0] <= self.max_chars:
+                return ends[0]
+        if len(buffer) <= self.max_chars:
+            return None
+        # no boundary within max_chars, use the last one that fits or any whitespace
+        window = buffer[: self.max_chars]
+        ends = [m.end() for m in _SENTENCE_END.finditer(window)]
+        if ends:
+            return ends[-1]
+        space = window.rfind(" ")
+        return space + 1 if space > 0 else self.max_chars
+
+    def _send(self, chunk: str):
+        self.sent.append(chunk)
+        body = chunk.strip()
+        if not body:
+            return
+        self.send_message(
+            FSMOutput(
+                dest=self.dest,
+                type=MessageType.TEXT,
+                message_data=MessageData(body=body),
+            )
+        )
@@ -0,0 +1,237 @@
+from unittest.mock import patch
+import pytest
+from transitions import MachineError
+
+from jb_manager_bot import AbstractFSM, FSMOutput, MessageData, Status
+
+
+def make_bot_class():
+    """A fresh class per call, so the compiled table is never shared between tests."""
+
+    class PluginFSM(AbstractFSM):
+        states = ["zero", "ask", "end"]
+        transitions = [
+            {"source": "zero", "dest": "ask", "trigger": "next"},
+            {"source": "ask", "dest": "end", "trigger": "next"},
+        ]
+        conditions = set()
+        output_variables = {"answer"}
+        built = 0
+
+        def __init__(self, send_message, credentials=None):
+            type(self).built += 1
+            super().__init__(send_message=send_message)
+
+        def on_enter_ask(self):
+            self.status = Status.WAIT_FOR_ME
+            self.send_message(FSMOutput(message_data=MessageData(body="plugin ask")))
+            self.status = Status.WAIT_FOR_USER_INPUT
+
+        def on_enter_end(self):
+            self.variables["answer"] = self.current_input
+            super().on_enter_end()
+
+    class Bot(AbstractFSM):
+        states = ["zero", "greet", "ask", "check", "retry", "plugin", "done", "end"]
+        transitions = [
+            {"source": "zero", "dest": "greet", "trigger": "next"},
+            {"source": "greet", "dest": "ask", "trigger": "next", "after": "log_after"},
+            {"source": "ask", "dest": "check", "trigger": "next"},
+            {
+                "source": "check",
+                "dest": "plugin",
+                "trigger": "next",
+                "conditions": "wants_plugin",
+                "before": "log_before",
+            },
+            {
+                "source": "check",
+                "dest": "done",
+                "trigger": "next",
+                "conditions": "is_number",
+                "unless": "is_zero_number",
+            },
+            {"source": "check", "dest": "retry", "trigger": "next"},
+            {"source": "retry", "dest": "=", "trigger": "again"},
+            {"source": "retry", "dest": "ask", "trigger": "next"},
+            {"source": "plugin", "dest": "done", "trigger": "next"},
+            {"source": "done", "dest": "end", "trigger": "next"},
+            {"source": "*", "dest": None, "trigger": "ping", "after": "log_ping"},
+        ]
+        conditions = {"wants_plugin", "is_number", "is_zero_number"}
+
+        def __init__(self, send_message, credentials=None):
+            self.trace = []
+            self.plugins = {"survey": lambda: PluginFSM(send_message)}
+            super().__init__(send_message=send_message)
+
+        def say(self, text):
+            self.send_message(FSMOutput(message_data=MessageData(body=text)))
+
+        def log_before(self):
+            self.trace.append("before")
+
+        def log_after(self):
+            self.trace.append("after")
+
+        def log_ping(self):
+            self.trace.append(f"ping:{self.state}")
+
+        def wants_plugin(self):
+            return self.variables.get("input") == "survey"
+
+        def is_number(self):
+            return str(self.variables.get("input", "")).isdigit()
+
+        def is_zero_number(self):
+            return self.variables.get("input") == "0"
+
+        def on_enter_greet(self):
+            self.status = Status.WAIT_FOR_ME
+            self.say("hello")
+            self.status = Status.MOVE_FORWARD
+
+        def on_enter_ask(self):
+            self.status = Status.WAIT_FOR_ME
+            self.say("give me a number")
+            self.status = Status.WAIT_FOR_USER_INPUT
+
+        def on_exit_ask(self):
+            self.trace.append("exit ask")
+
+        def on_enter_check(self):
+            self.status = Status.WAIT_FOR_ME
+            self.variables["input"] = self.current_input
+            self.status = Status.MOVE_FORWARD
+
+        def on_enter_retry(self):
+            self.status = Status.WAIT_FOR_ME
+            self.say("not a number")
+            if self.variables.pop("retry_twice", False):
+                self.trigger("again")
+                return
+            self.status = Status.MOVE_FORWARD
+
+        def on_enter_plugin(self):
+            self.status = Status.WAIT_FOR_ME
+            result = self.run_plugin("survey")
+            if result == self.RUN_TOKEN:
+                return
+            self.variables["survey"] = result["answer"]
+            self.status = Status.MOVE_FORWARD
+
+        def on_enter_done(self):
+            self.status = Status.WAIT_FOR_ME
+            self.say(f"done {self.variables.get('input')}")
+            self.status = Status.MOVE_FORWARD
+
+    return Bot, PluginFSM
+
+
+def play(bot_class, inputs):
+    messages = []
+    state = None
+    for user_input in inputs:
+        state = bot_class.run_machine(
+            send_message=lambda output: messages.append(output.message_data.body),
+            user_input=user_input,
+            state=state,
+        )
+    return messages, state
+
+
+SCRIPTS = [
+    [None, "abc", "42"],
+    [None, "0", "7"],
+    [None, "survey", "yes"],
+]
+
+
+@pytest.mark.parametrize("inputs", SCRIPTS)
+def test_same_behaviour_as_transitions_machine(inputs):
+    compiled_bot, _ = make_bot_class()
+    with patch("jb_manager_bot.abstract_fsm._compile_machine", return_value=None):
+        machine_bot, _ = make_bot_class()
+        expected = play(machine_bot, inputs)
+    assert play(compiled_bot, inputs) == expected
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_callbacks_and_helpers(compiled):
+    if compiled:
+        bot_class, _ = make_bot_class()
+    else:
+        with patch("jb_manager_bot.abstract_fsm._compile_machine", return_value=None):
+            bot_class, _ = make_bot_class()
+            bot_class.get_machine(send_message=lambda _: None)
+    bot = bot_class.get_machine(send_message=lambda _: None)
+    assert bot.state == "zero" and bot.is_zero()
+    assert bot.next() is True
+    assert bot.state == "greet"
+    bot.next()
+    assert bot.state == "ask"
+    assert bot.trace == ["after"]
+    bot.ping()
+    assert bot.state == "ask" and bot.trace[-1] == "ping:ask"
+    bot.to_retry()
+    assert bot.trace[-1] == "exit ask"
+    assert bot.may_next()
+    bot.to_done()
+    with pytest.raises(MachineError):
+        bot.trigger("again")
+    with pytest.raises(AttributeError):
+        bot.trigger("unknown")
+
+
+def test_reflexive_transition_reenters_state():
+    bot_class, _ = make_bot_class()
+    messages = []
+    bot = bot_class.get_machine(
+        send_message=lambda o: messages.append(o.message_data.body)
+    )
+    bot.variables["retry_twice"] = True
+    bot.to_retry()
+    assert messages == ["not a number", "not a number"]
+
+
+def test_compiled_once_per_class():
+    bot_class, _ = make_bot_class()
+    with patch(
+        "jb_manager_bot.abstract_fsm._compile_machine",
+        wraps=__import__("jb_manager_bot.abstract_fsm").abstract_fsm._compile_machine,
+    ) as compile_machine:
+        bot_class.get_machine(send_message=lambda _: None)
+        bot_class.get_machine(send_message=lambda _: None)
+    assert compile_machine.call_count == 1
+
+
+def test_plugins_are_built_lazily():
+    bot_class, plugin_class = make_bot_class()
+    messages, state = play(bot_class, [None, "survey"])
+    assert plugin_class.built == 1
+    assert state["plugins"]["survey"]["main"]["state"] == "ask"
+
+    # a turn that resumes the plugin restores it, one that does not never builds it
+    plugin_class.built = 0
+    bot = bot_class.get_machine(
+        send_message=lambda _: None,
+        state=state["main"]["state"],
+        status=state["main"]["status"],
+        variables=state["main"]["variables"],
+        plugin_states=state["plugins"],
+    )
+    assert plugin_class.built == 0
+    assert bot._save_state() == state
+    assert bot.get_plugin("survey").state == "ask"
+    assert plugin_class.built == 1
+
+
+def test_sanity_errors():
+    class Broken(AbstractFSM):
+        states = ["zero", "missing"]
+        transitions = [{"source": "zero", "dest": "missing", "trigger": "next"}]
+
+    with pytest.raises(ValueError):
+        Broken(lambda _: None)
+    with pytest.raises(ValueError):
+        Broken(lambda _: None)
@@ -0,0 +1,145 @@
+"""Cost of building and running an FSM with and without the compiled transition table.
+
+Each turn rebuilds the bot from its saved state, the same way flow does, so
+construction dominates for short turns. The "machine" variant forces the
+per-instance ``transitions.Machine`` fallback. Skipped unless RUN_BENCHMARKS is
+set; run from the jb-manager-bot directory with
+
+    RUN_BENCHMARKS=1 python -m pytest -s tests/test_abstract_fsm_benchmark.py
+
+or with more turns as ``python -m tests.test_abstract_fsm_benchmark --turns 2000``.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import time
+from unittest.mock import patch
+
+import pytest
+
+from jb_manager_bot import AbstractFSM, FSMOutput, MessageData, Status
+
+STEPS = 12
+TURNS = 1000
+
+
+def make_bot_class():
+    states = ["zero"] + [f"step_{i}" for i in range(STEPS)] + ["plugin", "end"]
+    transitions = [{"source": "zero", "dest": "step_0", "trigger": "next"}]
+    for i in range(STEPS - 1):
+        transitions.append(
+            {
+                "source": f"step_{i}",
+                "dest": "plugin",
+                "trigger": "next",
+                "conditions": "wants_plugin",
+            }
+        )
+        transitions.append(
+            {"source": f"step_{i}", "dest": f"step_{i + 1}", "trigger": "next"}
+        )
+    transitions.append({"source": "plugin", "dest": "step_0", "trigger": "next"})
+    transitions.append(
+        {"source": f"step_{STEPS - 1}", "dest": "step_0", "trigger": "next"}
+    )
+
+    class PluginFSM(AbstractFSM):
+        states = ["zero", "ask", "end"]
+        transitions = [
+            {"source": "zero", "dest": "ask", "trigger": "next"},
+            {"source": "ask", "dest": "end", "trigger": "next"},
+        ]
+
+        def __init__(self, send_message, credentials=None):
+            super().__init__(send_message=send_message)
+
+        def on_enter_ask(self):
+            self.status = Status.WAIT_FOR_USER_INPUT
+
+    def on_enter_step(self):
+        self.status = Status.WAIT_FOR_ME
+        self.send_message(FSMOutput(message_data=MessageData(body=self.state)))
+        self.status = Status.WAIT_FOR_USER_INPUT
+
+    def on_enter_plugin(self):
+        self.status = Status.WAIT_FOR_ME
+        if self.run_plugin("payment") == self.RUN_TOKEN:
+            return
+        self.status = Status.MOVE_FORWARD
+
+    def wants_plugin(self):
+        return self.current_input == "plugin"
+
+    def __init__(self, send_message, credentials=None):
+        self.plugins = {
+            name: (lambda: PluginFSM(send_message))
+            for name in ("payment", "location", "feedback")
+        }
+        AbstractFSM.__init__(self, send_message=send_message)
+
+    namespace = {
+        "states": states,
+        "transitions": transitions,
+        "conditions": {"wants_plugin"},
+        "__init__": __init__,
+        "wants_plugin": wants_plugin,
+        "on_enter_plugin": on_enter_plugin,
+        **{f"on_enter_step_{i}": on_enter_step for i in range(STEPS)},
+    }
+    return type("BenchmarkBot", (AbstractFSM,), namespace)
+
+
+def run(bot_class, turns: int):
+    latencies = []
+    state = None
+    for turn in range(turns):
+        start = time.perf_counter()
+        state = bot_class.run_machine(
+            send_message=lambda _: None,
+            user_input="plugin" if turn % 5 == 0 else f"message {turn}",
+            state=state,
+        )
+        latencies.append(time.perf_counter() - start)
+    return latencies, state
+
+
+def report(name: str, latencies: list):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:<10} turns={len(latencies)} "
+        f"mean={statistics.mean(latencies) * 1e6:9.1f}us "
+        f"p50={statistics.median(latencies) * 1e6:9.1f}us "
+        f"p95={p95 * 1e6:9.1f}us"
+    )
+
+
+def compare(turns: int):
+    # the fallback logs that AbstractFSM already defines trigger(), keep it out of the timings
+    logging.getLogger("transitions").setLevel(logging.ERROR)
+    with patch("jb_manager_bot.abstract_fsm._compile_machine", return_value=None):
+        machine, machine_state = run(make_bot_class(), turns)
+    compiled, compiled_state = run(make_bot_class(), turns)
+    report("machine", machine)
+    report("compiled", compiled)
+    return machine, machine_state, compiled, compiled_state
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1")
+def test_compiled_transition_table_is_faster():
+    machine, machine_state, compiled, compiled_state = compare(TURNS)
+    assert compiled_state == machine_state
+    assert statistics.median(compiled) < statistics.median(machine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=TURNS)
+    args = parser.parse_args()
+    compare(args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+import pytest
+from openai import RateLimitError
+
+from jb_manager_bot.parsers.utils import LLMManager, ResponseCache
+
+
+def completion(content):
+    message = SimpleNamespace(content=content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": "0"}, request=request)
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.fixture(autouse=True)
+def reset_llm_manager():
+    yield
+    LLMManager.disable_response_cache()
+    LLMManager._clients.clear()
+
+
+def test_clients_are_keyed_by_credentials():
+    first = LLMManager.get_client(openai_api_key="key-1")
+    assert LLMManager.get_client(openai_api_key="key-1") is first
+    assert LLMManager.get_client(openai_api_key="key-2") is not first
+
+
+def test_response_cache_ttl_and_size():
+    cache = ResponseCache(max_size=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    with patch("jb_manager_bot.parsers.utils.time.monotonic", return_value=10**9):
+        assert cache.get("a") is None
+
+
+def test_build_args_leaves_kwargs_alone():
+    kwargs = {"temperature": None, "callback": print}
+    args = LLMManager._build_args([LLMManager.um("hi")], kwargs)
+    assert kwargs == {"temperature": None, "callback": print}
+    assert args["temperature"] == 1e-6
+    assert "callback" not in args
+
+
+@patch.object(LLMManager, "get_client")
+def test_llm_caches_deterministic_calls(mock_get_client):
+    create = mock_get_client.return_value.chat.completions.create
+    create.return_value = completion("answer")
+    LLMManager.enable_response_cache()
+    messages = [LLMManager.um("hi")]
+
+    assert LLMManager.llm(messages, model="gpt") == "answer"
+    assert LLMManager.llm(messages, model="gpt") == "answer"
+    assert create.call_count == 1
+
+    LLMManager.llm(messages, model="gpt", temperature=0.7)
+    LLMManager.llm(messages, model="gpt", use_cache=False)
+    LLMManager.llm(messages, model="other")
+    assert create.call_count == 4
+
+
+@pytest.mark.asyncio
+@patch.object(LLMManager, "get_async_client")
+async def test_allm_retries_rate_limits(mock_get_client):
+    create = AsyncMock(
+        side_effect=[rate_limit_error(), rate_limit_error(), completion("ok")]
+    )
+    mock_get_client.return_value = MagicMock(
+        chat=MagicMock(completions=MagicMock(create=create))
+    )
+
+    assert await LLMManager.allm([LLMManager.um("hi")], model="gpt") == "ok"
+    assert create.call_count == 3
+
+    create.side_effect = rate_limit_error()
+    create.reset_mock()
+    with patch.object(LLMManager, "max_retries", 1), pytest.raises(RateLimitError):
+        await LLMManager.allm([LLMManager.um("hi")], model="gpt")
+    assert create.call_count == 2
+
+
+@pytest.mark.asyncio
+@patch.object(LLMManager, "get_async_client")
+async def test_allm_limits_concurrency(mock_get_client):
+    running = 0
+    peak = 0
+
+    async def create(**kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return completion("ok")
+
+    mock_get_client.return_value = MagicMock(
+        chat=MagicMock(completions=MagicMock(create=create))
+    )
+    with patch.object(LLMManager, "max_concurrency", 3):
+        # runtimes are per event loop, so this loop gets the patched limit
+        await asyncio.gather(
+            *(LLMManager.allm([LLMManager.um(str(i))], model="gpt") for i in range(10))
+        )
+    assert peak == 3
+
+
+@patch.object(LLMManager, "get_client")
+def test_response_cache_is_keyed_by_client(mock_get_client):
+    create = mock_get_client.return_value.chat.completions.create
+    create.return_value = completion("answer")
+    LLMManager.enable_response_cache()
+    messages = [LLMManager.um("hi")]
+    azure = {"azure_openai_api_key": "key", "azure_openai_api_version": "2024-02-01"}
+
+    LLMManager.llm(messages, model="gpt", azure_endpoint="https://a", **azure)
+    LLMManager.llm(messages, model="gpt", azure_endpoint="https://a", **azure)
+    assert create.call_count == 1
+
+    LLMManager.llm(messages, model="gpt", azure_endpoint="https://b", **azure)
+    LLMManager.llm(messages, model="gpt", openai_api_key="other")
+    assert create.call_count == 3
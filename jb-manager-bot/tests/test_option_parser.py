@@ -0,0 +1,92 @@
+from unittest.mock import patch
+import pytest
+
+from jb_manager_bot.data_models import OptionsListType
+from jb_manager_bot.parsers import OptionParser
+from jb_manager_bot.parsers.option_parser.matcher import match_option, normalize
+
+OPTIONS = [
+    {"id": "opt_yes", "title": "Yes"},
+    {"id": "opt_no", "title": "No"},
+    {"id": "opt_later", "title": "Remind me later"},
+]
+
+
+def test_normalize():
+    assert normalize("  Café, s'il VOUS plaît!  ") == "cafe s il vous plait"
+    assert normalize("हाँ") == normalize("हां")
+
+
+@pytest.mark.parametrize(
+    "user_input, expected_id, method",
+    [
+        ("opt_no", "opt_no", "id"),
+        ("2", "opt_no", "index"),
+        ("3.", "opt_later", "index"),
+        ("option 1", "opt_yes", "index"),
+        ("२", "opt_no", "index"),
+        ("YES!", "opt_yes", "title"),
+        ("remind me later", "opt_later", "title"),
+        ("remind me latr", "opt_later", "fuzzy"),
+        ("yes please", "opt_yes", "fuzzy"),
+    ],
+)
+def test_match_option(user_input, expected_id, method):
+    match = match_option(OPTIONS, user_input)
+    assert (match.id, match.method) == (expected_id, method)
+
+
+@pytest.mark.parametrize("user_input", ["7", "maybe tomorrow", "", None, "yes no"])
+def test_ambiguous_input_is_not_matched(user_input):
+    assert match_option(OPTIONS, user_input) is None
+
+
+def test_short_title_inside_reply_is_not_matched():
+    options = [{"id": "a", "title": "A"}, {"id": "b", "title": "B"}]
+    assert match_option(options, "I need a refund") is None
+
+
+@pytest.mark.parametrize("user_input", ["not yes", "don't yes", "no, not yes"])
+def test_negated_title_is_not_matched(user_input):
+    options = [{"id": "y", "title": "Yes"}, {"id": "n", "title": "No"}]
+    match = match_option(options, user_input)
+    assert match is None or match.id != "y"
+
+
+@pytest.mark.parametrize("user_input", ["no, yes", "yes... no", "opt_yes or no"])
+def test_reply_naming_several_options_is_not_matched(user_input):
+    assert match_option(OPTIONS, user_input) is None
+
+
+def test_long_title_inside_reply():
+    options = [
+        {"id": "refund", "title": "Refund"},
+        {"id": "replace", "title": "Replace"},
+    ]
+    assert match_option(options, "I need a refund").id == "refund"
+    assert match_option(options, "not a refund, no refund") is None
+
+
+def test_option_models_are_supported():
+    options = [OptionsListType(**option) for option in OPTIONS]
+    assert match_option(options, "No").id == "opt_no"
+
+
+@patch("jb_manager_bot.parsers.option_parser.LLMManager.llm")
+def test_parse_only_calls_llm_when_ambiguous(mock_llm):
+    mock_llm.return_value = '{"id": "opt_later"}'
+    OptionParser.reset_match_stats()
+
+    assert OptionParser.parse("Confirm", OPTIONS, "1") == "opt_yes"
+    assert OptionParser.parse("Confirm", OPTIONS, "no") == "opt_no"
+    mock_llm.assert_not_called()
+
+    assert OptionParser.parse("Confirm", OPTIONS, "not right now") == "opt_later"
+    assert (
+        OptionParser.parse("Confirm", OPTIONS, "1", match_threshold=None) == "opt_later"
+    )
+    assert mock_llm.call_count == 2
+
+    stats = OptionParser.get_match_stats()
+    assert stats["counts"] == {"index": 1, "title": 1, "llm": 2}
+    assert stats["local_hit_rate"] == 0.5
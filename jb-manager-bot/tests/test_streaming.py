@@ -0,0 +1,52 @@
+import pytest
+
+from jb_manager_bot import SentenceStreamer
+
+
+def stream(text, step=3, **kwargs):
+    bodies = []
+    with SentenceStreamer(
+        lambda output: bodies.append(output.message_data.body), **kwargs
+    ) as streamer:
+        for i in range(0, len(text), step):
+            streamer(text[i : i + step])
+    return bodies, streamer
+
+
+def test_sends_each_sentence_once_complete():
+    text = "The value of pi is 3.14 roughly. Is that right? Yes!\n\nNew paragraph here"
+    bodies, streamer = stream(text, min_chars=10)
+    assert bodies == [
+        "The value of pi is 3.14 roughly.",
+        "Is that right?",
+        "Yes!",
+        "New paragraph here",
+    ]
+    assert streamer.text == text
+
+
+def test_short_sentences_are_merged_up_to_min_chars():
+    bodies, _ = stream("Ok. Sure. Here is the longer explanation. Done.", min_chars=20)
+    assert bodies == ["Ok. Sure. Here is the longer explanation.", "Done."]
+
+
+def test_long_text_without_boundary_is_cut_at_whitespace():
+    bodies, _ = stream("word " * 50, min_chars=10, max_chars=52)
+    assert all(len(body) <= 52 for body in bodies)
+    assert " ".join(bodies).split() == ["word"] * 50
+
+
+def test_hindi_danda_is_a_sentence_end():
+    bodies, _ = stream("नमस्ते। आप कैसे हैं?", min_chars=1)
+    assert bodies == ["नमस्ते।", "आप कैसे हैं?"]
+
+
+def test_nothing_is_flushed_on_error():
+    bodies = []
+    with pytest.raises(RuntimeError):
+        with SentenceStreamer(
+            lambda output: bodies.append(output), min_chars=1
+        ) as streamer:
+            streamer("partial")
+            raise RuntimeError()
+    assert bodies == []
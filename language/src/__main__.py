@@ -1,7 +1,6 @@
 """Main module for language service."""
 
 import asyncio
-import json
 import os
 import logging
 import traceback
@@ -19,6 +18,7 @@ from lib.data_models import (
     FlowInput,
     LanguageInput,
     LanguageIntent,
+    language_input_adapter,
 )
 from lib.kafka_utils import KafkaConsumer, KafkaProducer
 from lib.model import Language
@@ -36,7 +36,7 @@ channel_topic = os.getenv("KAFKA_CHANNEL_TOPIC")
 logger.info("Connecting with topic: %s", language_topic)
 
 consumer = KafkaConsumer.from_env_vars(
-    group_id="cooler_group_id", auto_offset_reset="latest"
+    group_id="jb-language", auto_offset_reset="latest"
 )
 producer = KafkaProducer.from_env_vars()
 
@@ -46,9 +46,8 @@ logger.info("Connected with topic: %s", language_topic)
 def send_message(data: FlowInput | ChannelInput):
     """Sends message to Kafka topic"""
     topic = flow_topic if isinstance(data, FlowInput) else channel_topic
-    msg = data.model_dump_json()
-    logger.info("Sending message to %s topic: %s", topic, msg)
-    producer.send_message(topic, msg)
+    logger.info("Sending message to %s topic: %s", topic, data)
+    producer.send_model(topic, data)
 
 
 async def handle_incoming_message(
@@ -89,10 +88,7 @@ async def start():
     """Starts the language service."""
     while True:
         try:
-            msg = consumer.receive_message(language_topic)
-            logger.info("Received message %s", msg)
-            msg = json.loads(msg)
-            input_data = LanguageInput(**msg)
+            input_data = consumer.receive_model(language_topic, language_input_adapter)
             logger.info("Received message %s", input_data)
             await handle_incoming_message(input_data, callback=send_message)
         except Exception as e:
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("retriever")
+
+
+class EmbeddingBatcher:
+    """Collects concurrent query embedding requests into one embeddings call.
+
+    The first request of a batch starts a ``max_wait`` timer; the batch is sent
+    when the timer fires or ``max_batch_size`` distinct queries are waiting,
+    whichever comes first. Identical queries in a batch are embedded once.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, max_batch_size: int = 32, max_wait: float = 0.01
+    ):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight = set()
+        self.batches = 0
+        self.queries = 0
+
+    async def embed(self, query: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(query, []).append(future)
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch = list(self._pending.items())
+        self._pending = {}
+        task = asyncio.get_running_loop().create_task(self._embed_batch(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, List[asyncio.Future]]]):
+        self.batches += 1
+        self.queries += sum(len(futures) for _, futures in batch)
+        try:
+            vectors = await self.embeddings.aembed_documents(
+                [query for query, _ in batch]
+            )
+        except Exception as e:
+            logger.error("Error embedding a batch of %d queries: %s", len(batch), e)
+            for _, futures in batch:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for (_, futures), vector in zip(batch, vectors):
+            for future in futures:
+                if not future.done():
+                    future.set_result(vector)
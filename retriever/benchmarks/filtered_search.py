@@ -0,0 +1,183 @@
+"""Latency and recall of unfiltered, post-filtered and indexed filtered vector search.
+
+Creates a throwaway collection of random 1536 dimension vectors in the vector
+store database (the same POSTGRES_DATABASE_* variables as the retriever), whose
+chunks are spread evenly over --documents document names. A filter on one
+document name therefore keeps 1/--documents of the collection. It then compares:
+
+- unfiltered: plain HNSW search, as the retriever does without metadata
+- post-filter: the ``cmetadata ->> key = value`` filter PGVector generates
+- indexed: vector_search.FilteredVectorSearch (``@>`` + iterative scans)
+
+Recall is measured against an exact scan of the filtered rows. The collection
+is deleted afterwards. Run from the retriever directory after the migrations have
+created the HNSW index:
+
+    python -m benchmarks.filtered_search --rows 200000 --documents 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from vector_search import FilteredVectorSearch
+
+DIMENSIONS = 1536
+
+POST_FILTER_QUERY = text(
+    """
+    SELECT document FROM langchain_pg_embedding
+    WHERE collection_id = CAST(:collection_id AS uuid)
+    AND cmetadata ->> 'document_name' = :document_name
+    ORDER BY embedding <=> CAST(:embedding AS vector) LIMIT :k
+    """
+)
+UNFILTERED_QUERY = text(
+    """
+    SELECT document FROM langchain_pg_embedding
+    WHERE collection_id = CAST(:collection_id AS uuid)
+    ORDER BY embedding <=> CAST(:embedding AS vector) LIMIT :k
+    """
+)
+
+
+def random_vector() -> str:
+    return str([random.uniform(-0.5, 0.5) for _ in range(DIMENSIONS)])
+
+
+async def create_collection(engine, name: str, rows: int, documents: int) -> str:
+    collection_id = str(uuid.uuid4())
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(
+                "INSERT INTO langchain_pg_collection (uuid, name, cmetadata) "
+                "VALUES (CAST(:collection_id AS uuid), :name, '{}')"
+            ),
+            {"collection_id": collection_id, "name": name},
+        )
+        await connection.execute(
+            text(
+                """
+                INSERT INTO langchain_pg_embedding (id, collection_id, embedding, document, cmetadata)
+                SELECT :name || '-' || i, CAST(:collection_id AS uuid),
+                    CAST((SELECT array_agg(random() - 0.5) FROM generate_series(1, :dimensions)
+                          WHERE i > 0) AS vector),
+                    'chunk ' || i,
+                    jsonb_build_object('document_name', 'doc-' || (i % :documents))
+                FROM generate_series(1, :rows) AS i
+                """
+            ),
+            {
+                "name": name,
+                "collection_id": collection_id,
+                "dimensions": DIMENSIONS,
+                "documents": documents,
+                "rows": rows,
+            },
+        )
+        await connection.execute(text("ANALYZE langchain_pg_embedding"))
+    return collection_id
+
+
+async def timed_rows(engine, query, params, settings=()):
+    start = time.perf_counter()
+    async with engine.begin() as connection:
+        for setting in settings:
+            await connection.execute(text(setting))
+        rows = (await connection.execute(query, params)).scalars().all()
+    return time.perf_counter() - start, rows
+
+
+def report(name: str, latencies: list, recalls: list, returned: list):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:<12} p50={statistics.median(latencies) * 1000:8.2f}ms "
+        f"p95={p95 * 1000:8.2f}ms "
+        f"rows={statistics.mean(returned):5.1f} "
+        f"recall={statistics.mean(recalls) if recalls else float('nan'):.3f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    db_url = (
+        f"postgresql+psycopg://{os.getenv('POSTGRES_DATABASE_USERNAME')}:"
+        f"{os.getenv('POSTGRES_DATABASE_PASSWORD')}@{os.getenv('POSTGRES_DATABASE_HOST')}:"
+        f"{os.getenv('POSTGRES_DATABASE_PORT')}/{os.getenv('POSTGRES_DATABASE_NAME')}"
+    )
+    engine = create_async_engine(db_url)
+    name = f"benchmark-{uuid.uuid4().hex[:8]}"
+    print(f"Creating {args.rows} rows in collection {name}")
+    collection_id = await create_collection(engine, name, args.rows, args.documents)
+    indexed = FilteredVectorSearch(engine)
+    results = {
+        "unfiltered": ([], [], []),
+        "post-filter": ([], [], []),
+        "indexed": ([], [], []),
+    }
+    try:
+        for _ in range(args.queries):
+            embedding = random_vector()
+            document_name = f"doc-{random.randrange(args.documents)}"
+            params = {
+                "collection_id": collection_id,
+                "embedding": embedding,
+                "document_name": document_name,
+                "k": args.k,
+            }
+            _, exact = await timed_rows(
+                engine,
+                POST_FILTER_QUERY,
+                params,
+                settings=("SET LOCAL enable_indexscan = off",),
+            )
+            exact = set(exact)
+
+            latency, rows = await timed_rows(engine, UNFILTERED_QUERY, params)
+            results["unfiltered"][0].append(latency)
+            results["unfiltered"][2].append(len(rows))
+
+            latency, rows = await timed_rows(engine, POST_FILTER_QUERY, params)
+            results["post-filter"][0].append(latency)
+            results["post-filter"][1].append(
+                len(exact & set(rows)) / max(len(exact), 1)
+            )
+            results["post-filter"][2].append(len(rows))
+
+            start = time.perf_counter()
+            rows = await indexed.search(
+                name, json.loads(embedding), args.k, {"document_name": document_name}
+            )
+            results["indexed"][0].append(time.perf_counter() - start)
+            results["indexed"][1].append(
+                len(exact & {row["chunk"] for row in rows}) / max(len(exact), 1)
+            )
+            results["indexed"][2].append(len(rows))
+        for variant, (latencies, recalls, returned) in results.items():
+            report(variant, latencies, recalls, returned)
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(
+                text("DELETE FROM langchain_pg_collection WHERE name = :name"),
+                {"name": name},
+            )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,167 @@
+"""Recall, index size and latency of full precision, halfvec and binary quantized search.
+
+Creates a throwaway collection of random 1536 dimension vectors in the vector
+store database (the same POSTGRES_DATABASE_* variables as the retriever) and
+builds one partial HNSW index per mode on it, the way the indexer does for a
+quantized collection:
+
+- full: ``embedding vector_cosine_ops``
+- halfvec: ``embedding::halfvec(1536) halfvec_cosine_ops``, re-ranked
+- binary: ``binary_quantize(embedding)::bit(1536) bit_hamming_ops``, re-ranked
+
+Recall@k is measured against an exact scan of the collection. Needs pgvector
+>= 0.7. The collection and its indexes are deleted afterwards. Run from the
+retriever directory:
+
+    python -m benchmarks.quantization --rows 100000 --k 5 --binary-oversampling 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.filtered_search import create_collection, random_vector, report
+from vector_search import (
+    QUANTIZED_EXPRESSIONS,
+    QuantizedVectorSearch,
+    quantized_index_name,
+)
+
+FULL_INDEX = "(embedding) vector_cosine_ops"
+
+
+def search_query(collection_id: str):
+    return text(
+        f"""
+        SELECT document FROM langchain_pg_embedding
+        WHERE collection_id = '{collection_id}'::uuid
+        ORDER BY embedding <=> CAST(:embedding AS vector) LIMIT :k
+        """
+    )
+
+
+async def create_index(engine, mode: str, collection_id: str):
+    if mode == "full":
+        index_name, definition = quantized_index_name("full", collection_id), FULL_INDEX
+    else:
+        expression, opclass, _ = QUANTIZED_EXPRESSIONS[mode]
+        index_name, definition = (
+            quantized_index_name(mode, collection_id),
+            f"{expression} {opclass}",
+        )
+    start = time.perf_counter()
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(
+                f"CREATE INDEX {index_name} ON langchain_pg_embedding "
+                f"USING hnsw ({definition}) WHERE collection_id = '{collection_id}'::uuid"
+            )
+        )
+        size = (
+            await connection.execute(text(f"SELECT pg_relation_size('{index_name}')"))
+        ).scalar_one()
+    print(
+        f"{mode:<8} index {size / 2**20:9.1f} MiB, built in {time.perf_counter() - start:.1f}s"
+    )
+    return index_name
+
+
+async def exact(engine, collection_id: str, embedding: str, k: int) -> set:
+    async with engine.begin() as connection:
+        await connection.execute(text("SET LOCAL enable_indexscan = off"))
+        rows = await connection.execute(
+            search_query(collection_id), {"embedding": embedding, "k": k}
+        )
+        return set(rows.scalars().all())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ef-search", type=int, default=100)
+    parser.add_argument("--halfvec-oversampling", type=int, default=2)
+    parser.add_argument("--binary-oversampling", type=int, default=10)
+    args = parser.parse_args()
+
+    db_url = (
+        f"postgresql+psycopg://{os.getenv('POSTGRES_DATABASE_USERNAME')}:"
+        f"{os.getenv('POSTGRES_DATABASE_PASSWORD')}@{os.getenv('POSTGRES_DATABASE_HOST')}:"
+        f"{os.getenv('POSTGRES_DATABASE_PORT')}/{os.getenv('POSTGRES_DATABASE_NAME')}"
+    )
+    engine = create_async_engine(db_url)
+    name = f"benchmark-{uuid.uuid4().hex[:8]}"
+    print(f"Creating {args.rows} rows in collection {name}")
+    collection_id = await create_collection(engine, name, args.rows, documents=1)
+    search = QuantizedVectorSearch(
+        engine,
+        ef_search=args.ef_search,
+        oversampling={
+            "halfvec": args.halfvec_oversampling,
+            "binary": args.binary_oversampling,
+        },
+    )
+    modes = ("full", "halfvec", "binary")
+    index_names = []
+    try:
+        results = {}
+        # one index at a time, so each mode is measured with only its own index present
+        for mode in modes:
+            index_name = await create_index(engine, mode, collection_id)
+            index_names.append(index_name)
+            latencies, recalls, returned = results.setdefault(mode, ([], [], []))
+            random.seed(0)  # the same queries for every mode
+            for _ in range(args.queries):
+                embedding = random_vector()
+                expected = await exact(engine, collection_id, embedding, args.k)
+                start = time.perf_counter()
+                if mode == "full":
+                    async with engine.begin() as connection:
+                        await connection.execute(
+                            text(f"SET LOCAL hnsw.ef_search = {args.ef_search}")
+                        )
+                        rows = (
+                            (
+                                await connection.execute(
+                                    search_query(collection_id),
+                                    {"embedding": embedding, "k": args.k},
+                                )
+                            )
+                            .scalars()
+                            .all()
+                        )
+                else:
+                    rows = [
+                        row["chunk"]
+                        for row in await search.search_quantized(
+                            mode, collection_id, json.loads(embedding), args.k
+                        )
+                    ]
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(expected & set(rows)) / max(len(expected), 1))
+                returned.append(len(rows))
+            async with engine.begin() as connection:
+                await connection.execute(text(f"DROP INDEX {index_names.pop()}"))
+        for mode in modes:
+            report(mode, *results[mode])
+    finally:
+        async with engine.begin() as connection:
+            for index_name in index_names:
+                await connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+            await connection.execute(
+                text("DELETE FROM langchain_pg_collection WHERE name = :name"),
+                {"name": name},
+            )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
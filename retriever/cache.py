@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from lib.models import JBQueryEmbedding
+
+logger = logging.getLogger("retriever")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+class LRUCache:
+    """In-process LRU cache with an optional time to live (ttl=None never expires)."""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None or (self.ttl is not None and entry[0] < time.monotonic()):
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class QueryEmbeddingCache:
+    """Embeddings of normalized query texts, per embedding model.
+
+    Lookups go to the in-process LRU first and, if ``engine`` is given, to the
+    jb_query_embedding table, so the cache survives restarts and is shared by
+    all retriever replicas.
+    """
+
+    def __init__(self, max_size: int = 10000, engine: Optional[AsyncEngine] = None):
+        self.memory = LRUCache(max_size=max_size)
+        self.engine = engine
+
+    @staticmethod
+    def key(model: str, query: str) -> str:
+        return hashlib.sha256(
+            f"{model}\x00{normalize_query(query)}".encode()
+        ).hexdigest()
+
+    async def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = self.key(model, query)
+        embedding = self.memory.get(key)
+        if embedding is not None or self.engine is None:
+            return embedding
+        try:
+            async with self.engine.connect() as connection:
+                result = await connection.execute(
+                    select(JBQueryEmbedding.embedding).where(JBQueryEmbedding.id == key)
+                )
+                embedding = result.scalar_one_or_none()
+        except Exception as e:
+            logger.error("Error reading query embedding cache: %s", e)
+            return None
+        if embedding is not None:
+            self.memory.set(key, embedding)
+        return embedding
+
+    async def set(self, model: str, query: str, embedding: List[float]):
+        key = self.key(model, query)
+        self.memory.set(key, embedding)
+        if self.engine is None:
+            return
+        try:
+            async with self.engine.begin() as connection:
+                await connection.execute(
+                    insert(JBQueryEmbedding)
+                    .values(
+                        id=key,
+                        model=model,
+                        query=normalize_query(query),
+                        embedding=embedding,
+                    )
+                    .on_conflict_do_nothing(index_elements=[JBQueryEmbedding.id])
+                )
+        except Exception as e:
+            logger.error("Error writing query embedding cache: %s", e)
+
+
+class CollectionInfo(NamedTuple):
+    uuid: str
+    version: str
+    quantization: Optional[str]
+    embedding_backend: Optional[str] = None
+    embedding_model: Optional[str] = None
+
+
+class CollectionVersions:
+    """Current version of each collection, re-read at most every ``recheck_interval`` seconds.
+
+    The version is the collection row id plus the ``indexed_at`` stamp the indexer
+    writes into the collection metadata, so it changes whenever the collection is
+    (re-)indexed. None means the collection does not exist.
+    """
+
+    def __init__(self, engine: AsyncEngine, recheck_interval: float = 5):
+        self.engine = engine
+        self.recheck_interval = recheck_interval
+        self._infos: Dict[str, Tuple[float, Optional[CollectionInfo]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, collection_name: str) -> Optional[str]:
+        info = await self.info(collection_name)
+        return info.version if info is not None else None
+
+    async def info(self, collection_name: str) -> Optional[CollectionInfo]:
+        checked = self._infos.get(collection_name)
+        if checked is not None and checked[0] > time.monotonic():
+            return checked[1]
+        lock = self._locks.setdefault(collection_name, asyncio.Lock())
+        async with lock:
+            checked = self._infos.get(collection_name)
+            if checked is not None and checked[0] > time.monotonic():
+                return checked[1]
+            async with self.engine.connect() as connection:
+                result = await connection.execute(
+                    text(
+                        "SELECT uuid::text, coalesce(cmetadata->>'indexed_at', ''), "
+                        "cmetadata->>'quantization', cmetadata->>'embedding_backend', "
+                        "cmetadata->>'embedding_model' "
+                        "FROM langchain_pg_collection WHERE name = :name"
+                    ),
+                    {"name": collection_name},
+                )
+                row = result.first()
+            info = None
+            if row is not None:
+                info = CollectionInfo(
+                    uuid=row[0],
+                    version=f"{row[0]}:{row[1]}",
+                    quantization=row[2],
+                    embedding_backend=row[3],
+                    embedding_model=row[4],
+                )
+            self._infos[collection_name] = (
+                time.monotonic() + self.recheck_interval,
+                info,
+            )
+            return info
+
+
+class ResultCache:
+    """Search results keyed by (collection, normalized query, k, filter).
+
+    Every entry remembers the version of its collection, so results are dropped
+    as soon as the collection is re-indexed.
+    """
+
+    def __init__(
+        self,
+        versions: CollectionVersions,
+        max_size: int = 1024,
+        ttl: float = 600,
+    ):
+        self.versions = versions
+        self.results = LRUCache(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def key(
+        collection_name: str, query: str, k: int, metadata: Optional[dict]
+    ) -> Tuple:
+        return (
+            collection_name,
+            normalize_query(query),
+            k,
+            json.dumps(metadata or {}, sort_keys=True, default=str),
+        )
+
+    async def get(self, key: Tuple) -> Optional[List[dict]]:
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        version, results = entry
+        if version is None or version != await self.versions.get(key[0]):
+            return None
+        return results
+
+    async def set(self, key: Tuple, results: List[dict]):
+        version = await self.versions.get(key[0])
+        if version is not None:
+            self.results.set(key, (version, results))
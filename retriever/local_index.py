@@ -0,0 +1,215 @@
+"""In-process vector indexes for small and medium collections.
+
+For a collection of a few thousand chunks a Postgres round trip costs more
+than searching the vectors in memory. Selected collections are loaded from
+langchain_pg_embedding into a normalized float32 matrix and searched with a
+brute-force dot product. Collections above ``hnsw_threshold`` rows use an
+hnswlib HNSW index instead when hnswlib is installed (``poetry install -E hnsw``).
+
+Indexes are reloaded when the collection version changes (every indexer run
+stamps it) and evicted least recently used first once the loaded indexes
+exceed ``max_bytes``.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from cache import CollectionVersions
+
+try:
+    import hnswlib
+except ImportError:  # optional, brute force is used for every size without it
+    hnswlib = None
+
+logger = logging.getLogger("retriever")
+
+_LOAD_QUERY = text(
+    """
+    SELECT e.document, e.cmetadata, CAST(e.embedding AS real[]) AS embedding
+    FROM langchain_pg_embedding e
+    JOIN langchain_pg_collection c ON c.uuid = e.collection_id
+    WHERE c.name = :collection_name
+    """
+)
+_COUNT_QUERY = text(
+    """
+    SELECT count(*) FROM langchain_pg_embedding e
+    JOIN langchain_pg_collection c ON c.uuid = e.collection_id
+    WHERE c.name = :collection_name
+    """
+)
+
+
+class LocalIndex:
+    def __init__(
+        self,
+        version: str,
+        documents: List[str],
+        metadata: List[Dict[str, Any]],
+        vectors: np.ndarray,
+        hnsw_threshold: int = 20000,
+    ):
+        self.version = version
+        self.documents = documents
+        self.metadata = metadata
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+        self.hnsw = None
+        if hnswlib is not None and len(documents) >= hnsw_threshold:
+            self.hnsw = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+            self.hnsw.init_index(max_elements=len(documents), ef_construction=200, M=16)
+            self.hnsw.add_items(self.vectors, np.arange(len(documents)))
+            self.hnsw.set_ef(100)
+
+    @property
+    def nbytes(self) -> int:
+        # the hnsw graph roughly doubles the footprint of the vectors
+        return self.vectors.nbytes * (2 if self.hnsw is not None else 1)
+
+    def _matches(self, metadata: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not metadata:
+            return None
+        return np.fromiter(
+            (
+                all(row.get(key) == value for key, value in metadata.items())
+                for row in self.metadata
+            ),
+            dtype=bool,
+            count=len(self.metadata),
+        )
+
+    def search(
+        self, embedding: List[float], k: int, metadata: Optional[Dict[str, Any]] = None
+    ) -> List[dict]:
+        """Cosine similarity search, ``metadata`` is an equality filter."""
+        if not self.documents or k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        mask = self._matches(metadata)
+
+        if self.hnsw is not None and mask is None:
+            labels, _ = self.hnsw.knn_query(query, k=min(k, len(self.documents)))
+            rows = labels[0].tolist()
+        else:
+            scores = self.vectors @ query
+            if mask is not None:
+                scores = np.where(mask, scores, -np.inf)
+                k = min(k, int(mask.sum()))
+                if k == 0:
+                    return []
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows = top[np.argsort(-scores[top])].tolist()
+        return [
+            {"chunk": self.documents[i], "metadata": self.metadata[i]} for i in rows
+        ]
+
+
+class LocalIndexManager:
+    """Loads, refreshes and evicts the local indexes of the selected collections."""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        versions: CollectionVersions,
+        collections: Optional[List[str]] = None,
+        max_rows: int = 50000,
+        max_bytes: int = 512 * 1024 * 1024,
+        hnsw_threshold: int = 20000,
+    ):
+        self.engine = engine
+        self.versions = versions
+        # None selects every collection with at most max_rows chunks
+        self.collections = set(collections) if collections is not None else None
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.hnsw_threshold = hnsw_threshold
+        self._indexes: "OrderedDict[str, LocalIndex]" = OrderedDict()
+        self._too_large: Dict[str, str] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def selected(self, collection_name: str) -> bool:
+        return self.collections is None or collection_name in self.collections
+
+    @property
+    def nbytes(self) -> int:
+        return sum(index.nbytes for index in self._indexes.values())
+
+    async def get(self, collection_name: str) -> Optional[LocalIndex]:
+        """Return the up to date index of the collection, or None to search Postgres."""
+        if not self.selected(collection_name):
+            return None
+        version = await self.versions.get(collection_name)
+        if version is None or self._too_large.get(collection_name) == version:
+            return None
+        index = self._indexes.get(collection_name)
+        if index is not None and index.version == version:
+            self._indexes.move_to_end(collection_name)
+            return index
+
+        lock = self._locks.setdefault(collection_name, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(collection_name)
+            if index is None or index.version != version:
+                index = await self._load(collection_name, version)
+            if index is None:
+                self._indexes.pop(collection_name, None)
+                return None
+            self._indexes[collection_name] = index
+            self._indexes.move_to_end(collection_name)
+            self._evict()
+        return index
+
+    async def _load(self, collection_name: str, version: str) -> Optional[LocalIndex]:
+        async with self.engine.connect() as connection:
+            count = (
+                await connection.execute(
+                    _COUNT_QUERY, {"collection_name": collection_name}
+                )
+            ).scalar_one()
+            if count > self.max_rows:
+                logger.info(
+                    "Collection %s has %d chunks, searching it in Postgres",
+                    collection_name,
+                    count,
+                )
+                self._too_large[collection_name] = version
+                return None
+            rows = (
+                await connection.execute(
+                    _LOAD_QUERY, {"collection_name": collection_name}
+                )
+            ).all()
+        if not rows:
+            return None
+        index = await asyncio.to_thread(
+            LocalIndex,
+            version,
+            [row.document for row in rows],
+            [row.cmetadata or {} for row in rows],
+            np.asarray([row.embedding for row in rows], dtype=np.float32),
+            self.hnsw_threshold,
+        )
+        if index.nbytes > self.max_bytes:
+            self._too_large[collection_name] = version
+            return None
+        logger.info(
+            "Loaded local index of %s: %d chunks, %.1f MiB%s",
+            collection_name,
+            len(rows),
+            index.nbytes / 2**20,
+            ", hnsw" if index.hnsw is not None else "",
+        )
+        return index
+
+    def _evict(self):
+        while len(self._indexes) > 1 and self.nbytes > self.max_bytes:
+            collection_name, _ = self._indexes.popitem(last=False)
+            logger.info("Evicted local index of %s", collection_name)
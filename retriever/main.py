@@ -1,17 +1,17 @@
 import asyncio
-import json
+import functools
 import logging
 import os
 import sys
 import traceback
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
-from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
-from langchain_postgres.vectorstores import PGVector
-from openai import OpenAI
 
 from lib.data_models import FlowInput, RAGInput
 from lib.kafka_utils import KafkaConsumer, KafkaProducer
+from runtime import RetrieverRuntime
+from server import serve
 
 load_dotenv()
 
@@ -20,19 +20,14 @@ print("Inside Retriever", file=sys.stderr)
 kafka_broker = os.getenv("KAFKA_BROKER")
 rag_topic = os.getenv("KAFKA_RAG_TOPIC")
 flow_topic = os.getenv("KAFKA_FLOW_TOPIC")
+max_concurrency = int(os.getenv("RETRIEVER_MAX_CONCURRENCY", 16))
+# also serve searches over HTTP, for flow's inline retrieval
+http_port = os.getenv("RETRIEVER_HTTP_PORT")
 
 print("Connecting", file=sys.stderr)
 
-client = OpenAI()
-db_name = os.getenv("POSTGRES_DATABASE_NAME")
-db_user = os.getenv("POSTGRES_DATABASE_USERNAME")
-db_password = os.getenv("POSTGRES_DATABASE_PASSWORD")
-db_host = os.getenv("POSTGRES_DATABASE_HOST")
-db_port = os.getenv("POSTGRES_DATABASE_PORT")
-db_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-
 consumer = KafkaConsumer.from_env_vars(
-    group_id="cooler_group_id", auto_offset_reset="latest"
+    group_id="jb-retriever", auto_offset_reset="latest"
 )
 producer = KafkaProducer.from_env_vars()
 
@@ -41,12 +36,13 @@ print("Connections done", file=sys.stderr)
 logger = logging.getLogger("retriever")
 
 
-def send_message(data):
+def send_message(data: FlowInput):
     # logger.info(f"Sending message to {flow_topic}, msg_id:", data['msg_id'])
-    producer.send_message(flow_topic, data)
+    producer.send_model(flow_topic, data)
 
 
 async def querying_with_langchain(
+    runtime: RetrieverRuntime,
     session_id: str,
     turn_id: str,
     collection_name: str,
@@ -55,33 +51,12 @@ async def querying_with_langchain(
     metadata: dict = None,
     callback: callable = None,
 ):
-    print(query, collection_name, top_chunk_k_value)
-    if os.environ["OPENAI_API_TYPE"] == "azure":
-        embeddings = AzureOpenAIEmbeddings(
-            model="text-embedding-ada-002",
-            azure_deployment=os.environ["AZURE_DEPLOYMENT_NAME"],
-            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-            openai_api_type=os.environ["OPENAI_API_TYPE"],
-            openai_api_key=os.environ["AZURE_OPENAI_API_KEY"],
-        )
-    else:
-        embeddings = OpenAIEmbeddings(client="")
-
-    search_index = PGVector(
+    data = await runtime.search(
         collection_name=collection_name,
-        connection=db_url,
-        embeddings=embeddings,
+        query=query,
+        top_chunk_k_value=top_chunk_k_value,
+        metadata=metadata,
     )
-    # TODO: Check metadata is not None and add it to the search_index filter
-    if metadata:
-        documents = search_index.similarity_search(
-            query=query, k=top_chunk_k_value, filter=metadata
-        )
-    else:
-        documents = search_index.similarity_search(query=query, k=top_chunk_k_value)
-    data = []
-    for document in documents:
-        data.append({"chunk": document.page_content, "metadata": document.metadata})
     flow_input = {
         "source": "retriever",
         "session_id": session_id,
@@ -92,15 +67,12 @@ async def querying_with_langchain(
     # logging.info("flow Input %s", flow_input)
 
     if callback:
-        callback(flow_input.model_dump_json())
+        # producing flushes, keep it off the event loop
+        await asyncio.to_thread(callback, flow_input)
 
 
-while True:
+async def handle_message(runtime: RetrieverRuntime, data: RAGInput):
     try:
-        # will keep trying until non-null message is received
-        message = consumer.receive_message(rag_topic, timeout=1.0)
-        data = json.loads(message)
-        data = RAGInput(**data)
         retriver_input = data.model_dump(
             include={
                 "session_id",
@@ -108,9 +80,68 @@ while True:
                 "collection_name",
                 "query",
                 "top_chunk_k_value",
+                "metadata",
             }
         )
-        # Doubt: What is metadata in querying_with_langchain?
-        asyncio.run(querying_with_langchain(**retriver_input, callback=send_message))
+        await querying_with_langchain(runtime, **retriver_input, callback=send_message)
     except Exception as e:
         logger.error("Exception %s :: %s", e, traceback.format_exc())
+
+
+async def handle_in_order(
+    runtime: RetrieverRuntime, data: RAGInput, previous: Optional[asyncio.Task]
+):
+    # messages of a session arrive in order (they are keyed by session_id), and
+    # are answered in order: after the search of the previous one
+    if previous is not None:
+        await asyncio.wait({previous})
+    await handle_message(runtime, data)
+
+
+async def retriever_loop():
+    runtime = RetrieverRuntime.from_env_vars()
+    slots = asyncio.Semaphore(max_concurrency)
+    tasks = set()
+    # last search of each session, searches of different sessions run concurrently
+    session_tasks: Dict[str, asyncio.Task] = {}
+
+    def forget(session_id: str, task: asyncio.Task):
+        if session_tasks.get(session_id) is task:
+            del session_tasks[session_id]
+
+    if http_port:
+        server = asyncio.create_task(serve(runtime, int(http_port)))
+        tasks.add(server)
+        server.add_done_callback(tasks.discard)
+    try:
+        while True:
+            try:
+                # stop polling while max_concurrency requests are in flight
+                await slots.acquire()
+                # returns None after a second without messages, so the thread
+                # doesn't outlive a cancelled loop by more than that
+                message = await asyncio.to_thread(
+                    consumer.receive_model, rag_topic, RAGInput, 1.0
+                )
+            except Exception as e:
+                slots.release()
+                logger.error("Exception %s :: %s", e, traceback.format_exc())
+                continue
+            if message is None:
+                slots.release()
+                continue
+            session_id = message.session_id
+            task = asyncio.create_task(
+                handle_in_order(runtime, message, session_tasks.get(session_id))
+            )
+            session_tasks[session_id] = task
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+            task.add_done_callback(functools.partial(forget, session_id))
+    finally:
+        await runtime.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(retriever_loop())
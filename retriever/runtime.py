@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+from langchain_postgres.vectorstores import PGVector
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from lib.data_models import EmbeddingBackend
+from lib.local_embeddings import LocalEmbeddings
+from batching import EmbeddingBatcher
+from cache import CollectionInfo, CollectionVersions, QueryEmbeddingCache, ResultCache
+from local_index import LocalIndexManager
+from vector_search import (
+    QUANTIZED_EXPRESSIONS,
+    FilteredVectorSearch,
+    QuantizedVectorSearch,
+    is_containment_filter,
+)
+
+logger = logging.getLogger("retriever")
+
+
+def embeddings_from_env_vars() -> Dict[EmbeddingBackend, Embeddings]:
+    """The backends queries can be embedded with: OpenAI, through Azure when
+    OPENAI_API_TYPE is "azure", and the local model when EMBEDDING_LOCAL_MODEL_PATH
+    is set."""
+    embeddings = {}
+    if os.getenv("OPENAI_API_TYPE") == "azure":
+        embeddings[EmbeddingBackend.OPENAI] = AzureOpenAIEmbeddings(
+            model="text-embedding-ada-002",
+            azure_deployment=os.environ["AZURE_DEPLOYMENT_NAME"],
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            openai_api_type=os.environ["OPENAI_API_TYPE"],
+            openai_api_key=os.environ["AZURE_OPENAI_API_KEY"],
+        )
+    else:
+        embeddings[EmbeddingBackend.OPENAI] = OpenAIEmbeddings(client="")
+    if os.getenv("EMBEDDING_LOCAL_MODEL_PATH"):
+        embeddings[EmbeddingBackend.LOCAL] = LocalEmbeddings.from_env_vars()
+    return embeddings
+
+
+def embedding_model_key(embeddings: Embeddings) -> str:
+    # identifies the embedding space, cached query embeddings are per model
+    return ":".join(
+        str(part)
+        for part in (
+            getattr(embeddings, "model", None),
+            getattr(embeddings, "deployment", None),
+            getattr(embeddings, "dimensions", None),
+        )
+    )
+
+
+class RetrieverRuntime:
+    """Long lived state of the retriever.
+
+    One embeddings client per backend and one async connection pool are
+    shared by all requests, and the PGVector store of a collection is created
+    on its first query and reused afterwards. Queries are embedded by the
+    backend and model the indexer saved with the collection. Query embeddings
+    and search results are cached when the caches are given. Collections the
+    indexer stored with a quantized index are searched through it and
+    re-ranked at full precision.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        embeddings: Dict[EmbeddingBackend, Embeddings],
+        embedding_cache: Optional[QueryEmbeddingCache] = None,
+        result_cache: Optional[ResultCache] = None,
+        embedding_batchers: Optional[Dict[EmbeddingBackend, EmbeddingBatcher]] = None,
+        filtered_search: Optional[FilteredVectorSearch] = None,
+        local_indexes: Optional[LocalIndexManager] = None,
+        versions: Optional[CollectionVersions] = None,
+        quantized_search: Optional[QuantizedVectorSearch] = None,
+    ):
+        self.engine = engine
+        self.versions = versions or CollectionVersions(engine)
+        self.quantized_search = quantized_search or QuantizedVectorSearch(engine)
+        self.embeddings = embeddings
+        self.embedding_batchers = embedding_batchers or {}
+        self.filtered_search = filtered_search or FilteredVectorSearch(engine)
+        self.local_indexes = local_indexes
+        self.embedding_cache = embedding_cache
+        self.result_cache = result_cache
+        self.embedding_models = {
+            backend: embedding_model_key(backend_embeddings)
+            for backend, backend_embeddings in embeddings.items()
+        }
+        self._stores: Dict[str, PGVector] = {}
+        self._store_locks: Dict[str, asyncio.Lock] = {}
+
+    @classmethod
+    def from_env_vars(cls) -> "RetrieverRuntime":
+        """
+        Creates a RetrieverRuntime from environment variables.
+        Uses the following environment variables:
+        - POSTGRES_DATABASE_NAME, POSTGRES_DATABASE_USERNAME, POSTGRES_DATABASE_PASSWORD,
+          POSTGRES_DATABASE_HOST, POSTGRES_DATABASE_PORT: vector store database
+        - RETRIEVER_DB_POOL_SIZE: size of the connection pool (default: 10)
+        - RETRIEVER_EMBEDDING_CACHE_SIZE: query embeddings kept in memory, 0 disables
+          the cache (default: 10000)
+        - RETRIEVER_PERSIST_QUERY_EMBEDDINGS: also keep query embeddings in the
+          jb_query_embedding table (default: False)
+        - RETRIEVER_RESULT_CACHE_SIZE: search results kept in memory, 0 disables
+          the cache (default: 1024)
+        - RETRIEVER_RESULT_CACHE_TTL: seconds a search result is kept (default: 600)
+        - RETRIEVER_EMBEDDING_BATCH_SIZE: most queries embedded in one call, 1 disables
+          batching (default: 32)
+        - RETRIEVER_EMBEDDING_BATCH_WAIT_MS: how long the first query of a batch
+          waits for others (default: 10)
+        - RETRIEVER_HNSW_EF_SEARCH: hnsw.ef_search for filtered and quantized searches
+          (default: 100)
+        - RETRIEVER_BINARY_OVERSAMPLING: candidates re-ranked per result in collections
+          with a binary quantized index (default: 10)
+        - RETRIEVER_LOCAL_INDEX_COLLECTIONS: comma separated collections to search in
+          process, "*" for every collection small enough (default: none)
+        - RETRIEVER_LOCAL_INDEX_MAX_ROWS: largest collection loaded in process
+          (default: 50000)
+        - RETRIEVER_LOCAL_INDEX_MAX_MB: memory for local indexes across collections
+          (default: 512)
+        - OPENAI_API_TYPE and the matching OpenAI/Azure credentials for collections
+          embedded by OpenAI
+        - EMBEDDING_LOCAL_MODEL_PATH and the other EMBEDDING_LOCAL_* variables of
+          LocalEmbeddings for collections embedded by the local model
+        """
+        db_name = os.getenv("POSTGRES_DATABASE_NAME")
+        db_user = os.getenv("POSTGRES_DATABASE_USERNAME")
+        db_password = os.getenv("POSTGRES_DATABASE_PASSWORD")
+        db_host = os.getenv("POSTGRES_DATABASE_HOST")
+        db_port = os.getenv("POSTGRES_DATABASE_PORT")
+        db_url = f"postgresql+psycopg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+        engine = create_async_engine(
+            db_url,
+            pool_size=int(os.getenv("RETRIEVER_DB_POOL_SIZE", 10)),
+            pool_pre_ping=True,
+        )
+
+        embedding_cache = None
+        embedding_cache_size = int(os.getenv("RETRIEVER_EMBEDDING_CACHE_SIZE", 10000))
+        if embedding_cache_size > 0:
+            persist = os.getenv("RETRIEVER_PERSIST_QUERY_EMBEDDINGS")
+            persist = isinstance(persist, str) and persist.lower() == "true"
+            embedding_cache = QueryEmbeddingCache(
+                max_size=embedding_cache_size, engine=engine if persist else None
+            )
+        versions = CollectionVersions(engine)
+        result_cache = None
+        result_cache_size = int(os.getenv("RETRIEVER_RESULT_CACHE_SIZE", 1024))
+        if result_cache_size > 0:
+            result_cache = ResultCache(
+                versions,
+                max_size=result_cache_size,
+                ttl=float(os.getenv("RETRIEVER_RESULT_CACHE_TTL", 600)),
+            )
+        local_indexes = None
+        local_index_collections = os.getenv(
+            "RETRIEVER_LOCAL_INDEX_COLLECTIONS", ""
+        ).strip()
+        if local_index_collections:
+            local_indexes = LocalIndexManager(
+                engine,
+                versions,
+                collections=(
+                    None
+                    if local_index_collections == "*"
+                    else [name.strip() for name in local_index_collections.split(",")]
+                ),
+                max_rows=int(os.getenv("RETRIEVER_LOCAL_INDEX_MAX_ROWS", 50000)),
+                max_bytes=int(os.getenv("RETRIEVER_LOCAL_INDEX_MAX_MB", 512)) * 2**20,
+            )
+        ef_search = int(os.getenv("RETRIEVER_HNSW_EF_SEARCH", 100))
+        embeddings = embeddings_from_env_vars()
+        embedding_batchers = {}
+        batch_size = int(os.getenv("RETRIEVER_EMBEDDING_BATCH_SIZE", 32))
+        if batch_size > 1:
+            embedding_batchers = {
+                backend: EmbeddingBatcher(
+                    backend_embeddings,
+                    max_batch_size=batch_size,
+                    max_wait=float(os.getenv("RETRIEVER_EMBEDDING_BATCH_WAIT_MS", 10))
+                    / 1000,
+                )
+                for backend, backend_embeddings in embeddings.items()
+            }
+        return cls(
+            engine,
+            embeddings,
+            embedding_cache=embedding_cache,
+            result_cache=result_cache,
+            embedding_batchers=embedding_batchers,
+            filtered_search=FilteredVectorSearch(engine, ef_search=ef_search),
+            local_indexes=local_indexes,
+            versions=versions,
+            quantized_search=QuantizedVectorSearch(
+                engine,
+                ef_search=ef_search,
+                oversampling={
+                    "binary": int(os.getenv("RETRIEVER_BINARY_OVERSAMPLING", 10))
+                },
+            ),
+        )
+
+    def embedding_backend(
+        self, collection_name: str, info: Optional[CollectionInfo]
+    ) -> EmbeddingBackend:
+        """The backend the collection was indexed with, collections indexed before
+        backends were selectable are OpenAI's."""
+        backend = EmbeddingBackend.OPENAI
+        if info is not None and info.embedding_backend:
+            backend = EmbeddingBackend(info.embedding_backend)
+        embeddings = self.embeddings.get(backend)
+        if embeddings is None:
+            raise ValueError(
+                f"Collection {collection_name} is embedded by the {backend.value} "
+                "backend, which is not configured"
+            )
+        model = getattr(embeddings, "model", None)
+        if (
+            info is not None
+            and info.embedding_model
+            and model
+            and info.embedding_model != model
+        ):
+            raise ValueError(
+                f"Collection {collection_name} is embedded by {info.embedding_model}, "
+                f"queries would be embedded by {model}"
+            )
+        return backend
+
+    async def get_store(self, collection_name: str, embeddings: Embeddings) -> PGVector:
+        store = self._stores.get(collection_name)
+        if store is not None:
+            return store
+        lock = self._store_locks.setdefault(collection_name, asyncio.Lock())
+        async with lock:
+            store = self._stores.get(collection_name)
+            if store is None:
+                store = PGVector(
+                    collection_name=collection_name,
+                    connection=self.engine,
+                    embeddings=embeddings,
+                )
+                # creates the extension, tables and collection row once per process
+                await store.__apost_init__()
+                self._stores[collection_name] = store
+                logger.info("Created vector store for collection %s", collection_name)
+        return store
+
+    async def embed_query(
+        self, query: str, backend: EmbeddingBackend = EmbeddingBackend.OPENAI
+    ) -> List[float]:
+        model = self.embedding_models[backend]
+        if self.embedding_cache is not None:
+            embedding = await self.embedding_cache.get(model, query)
+            if embedding is not None:
+                return embedding
+        batcher = self.embedding_batchers.get(backend)
+        if batcher is not None:
+            embedding = await batcher.embed(query)
+        else:
+            embedding = await self.embeddings[backend].aembed_query(query)
+        if self.embedding_cache is not None:
+            await self.embedding_cache.set(model, query, embedding)
+        return embedding
+
+    async def search(
+        self,
+        collection_name: str,
+        query: str,
+        top_chunk_k_value: int = 5,
+        metadata: Optional[dict] = None,
+    ) -> List[dict]:
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.key(
+                collection_name, query, top_chunk_k_value, metadata
+            )
+            results = await self.result_cache.get(cache_key)
+            if results is not None:
+                return results
+
+        info = await self.versions.info(collection_name)
+        backend = self.embedding_backend(collection_name, info)
+        local_index = None
+        if self.local_indexes is not None and (
+            not metadata or is_containment_filter(metadata)
+        ):
+            local_index = await self.local_indexes.get(collection_name)
+        if local_index is not None:
+            embedding = await self.embed_query(query, backend)
+            results = local_index.search(embedding, top_chunk_k_value, metadata)
+            if cache_key is not None:
+                await self.result_cache.set(cache_key, results)
+            return results
+
+        if (
+            info is not None
+            and info.quantization in QUANTIZED_EXPRESSIONS
+            and (not metadata or is_containment_filter(metadata))
+        ):
+            embedding = await self.embed_query(query, backend)
+            results = await self.quantized_search.search_quantized(
+                info.quantization, info.uuid, embedding, top_chunk_k_value, metadata
+            )
+            if cache_key is not None:
+                await self.result_cache.set(cache_key, results)
+            return results
+
+        store = await self.get_store(collection_name, self.embeddings[backend])
+        # PGVector.asimilarity_search embeds with the blocking client, so embed here
+        embedding = await self.embed_query(query, backend)
+        if is_containment_filter(metadata):
+            results = await self.filtered_search.search(
+                collection_name, embedding, top_chunk_k_value, metadata
+            )
+        else:
+            documents = await store.asimilarity_search_by_vector(
+                embedding=embedding, k=top_chunk_k_value, filter=metadata or None
+            )
+            results = [
+                {"chunk": document.page_content, "metadata": document.metadata}
+                for document in documents
+            ]
+        if cache_key is not None:
+            await self.result_cache.set(cache_key, results)
+        return results
+
+    async def close(self):
+        await self.engine.dispose()
@@ -0,0 +1,41 @@
+"""HTTP search endpoint of the retriever.
+
+Serves the same searches as the Kafka loop, from the same RetrieverRuntime, so
+they share the connection pool, the caches and the query embedding batches.
+Flow calls it through lib.retriever_client to answer a bot's dest="rag" output
+in the same turn instead of a round trip through Kafka.
+"""
+
+import logging
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+
+from lib.data_models import RAGInput, RAGResponse
+from runtime import RetrieverRuntime
+
+logger = logging.getLogger("retriever")
+
+
+def create_app(runtime: RetrieverRuntime) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/search")
+    async def search(rag_input: RAGInput) -> List[RAGResponse]:
+        try:
+            return await runtime.search(
+                collection_name=rag_input.collection_name,
+                query=rag_input.query,
+                top_chunk_k_value=rag_input.top_chunk_k_value,
+                metadata=rag_input.metadata,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return app
+
+
+async def serve(runtime: RetrieverRuntime, port: int):
+    config = uvicorn.Config(create_app(runtime), host="0.0.0.0", port=port)
+    await uvicorn.Server(config).serve()
@@ -0,0 +1,57 @@
+import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from vector_search import MAX_EF_SEARCH, QuantizedVectorSearch
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append((str(statement), params))
+        return SimpleNamespace(all=lambda: [], scalar_one_or_none=lambda: "0.8.0")
+
+
+class FakeEngine:
+    def __init__(self):
+        self.connection = FakeConnection()
+
+    @asynccontextmanager
+    async def begin(self):
+        yield self.connection
+
+
+async def search(k, mode="binary", ef_search=100):
+    engine = FakeEngine()
+    vector_search = QuantizedVectorSearch(engine, ef_search=ef_search)
+    await vector_search.search_quantized(mode, str(uuid.uuid4()), [0.1, 0.2], k)
+    settings = [sql for sql, _ in engine.connection.statements if sql.startswith("SET")]
+    _, params = engine.connection.statements[-1]
+    return settings, params
+
+
+@pytest.mark.asyncio
+async def test_small_k_uses_oversampled_candidates():
+    settings, params = await search(5, mode="halfvec")
+    assert settings == ["SET LOCAL hnsw.ef_search = 100"]
+    assert params["candidates"] == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("k", [101, 150, 999])
+async def test_large_k_is_clamped_to_max_ef_search(k):
+    settings, params = await search(k)
+    assert settings == [f"SET LOCAL hnsw.ef_search = {MAX_EF_SEARCH}"]
+    assert params["candidates"] == min(k * 10, MAX_EF_SEARCH)
+    assert params["k"] == k
+
+
+@pytest.mark.asyncio
+async def test_candidates_never_fewer_than_k():
+    settings, params = await search(1500, mode="halfvec")
+    assert settings == [f"SET LOCAL hnsw.ef_search = {MAX_EF_SEARCH}"]
+    assert params["candidates"] == 1500
@@ -0,0 +1,208 @@
+"""Similarity search with metadata filters the database can index.
+
+PGVector turns ``{"key": "value"}`` filters into ``cmetadata ->> 'key' = 'value'``
+and applies them after the HNSW scan. A selective filter then throws away most
+of the ``ef_search`` candidates and returns fewer than ``k`` rows, or none.
+
+For equality filters this module instead queries with ``cmetadata @> filter``,
+which the GIN index on ``cmetadata`` can answer, so the planner can use it to
+pre-filter very selective filters. On pgvector >= 0.8 it also enables iterative
+index scans, so the HNSW scan keeps going until ``k`` rows pass the filter.
+
+Collections indexed with ``quantization`` set to "halfvec" or "binary" have their
+own partial HNSW index over a half precision or binary quantized copy of the
+embedding (pgvector >= 0.7). QuantizedVectorSearch scans that index for
+``oversampling * k`` candidates and re-ranks them by the full precision
+embedding stored in the table.
+"""
+
+import json
+import logging
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger("retriever")
+
+_SCALAR_TYPES = (str, int, float, bool)
+MAX_EF_SEARCH = 1000  # upper bound of hnsw.ef_search
+
+_SEARCH_QUERY = text(
+    """
+    WITH candidates AS MATERIALIZED (
+        SELECT document, cmetadata, embedding <=> CAST(:embedding AS vector) AS distance
+        FROM langchain_pg_embedding
+        WHERE collection_id = (
+            SELECT uuid FROM langchain_pg_collection WHERE name = :collection_name
+        )
+        AND cmetadata @> CAST(:metadata AS jsonb)
+        ORDER BY embedding <=> CAST(:embedding AS vector)
+        LIMIT :k
+    )
+    SELECT document, cmetadata, distance FROM candidates ORDER BY distance
+    """
+)
+
+
+DIMENSIONS = 1536
+
+# expressions the indexer builds the partial HNSW indexes of quantized collections on,
+# queries have to order by exactly the same expression for the index to be used
+QUANTIZED_EXPRESSIONS = {
+    "halfvec": (
+        f"(embedding::halfvec({DIMENSIONS}))",
+        "halfvec_cosine_ops",
+        f"embedding::halfvec({DIMENSIONS}) <=> CAST(:embedding AS halfvec({DIMENSIONS}))",
+    ),
+    "binary": (
+        f"(binary_quantize(embedding)::bit({DIMENSIONS}))",
+        "bit_hamming_ops",
+        f"binary_quantize(embedding)::bit({DIMENSIONS}) "
+        f"<~> binary_quantize(CAST(:embedding AS vector({DIMENSIONS})))",
+    ),
+}
+
+
+def quantized_index_name(mode: str, collection_id: str) -> str:
+    return f"langchain_embeddings_{mode}_{uuid.UUID(collection_id).hex}"
+
+
+def is_containment_filter(metadata: Optional[Dict[str, Any]]) -> bool:
+    """True for plain ``{"key": value}`` equality filters, which map to ``@>``."""
+    if not metadata:
+        return False
+    return all(
+        not key.startswith("$") and isinstance(value, _SCALAR_TYPES)
+        for key, value in metadata.items()
+    )
+
+
+def _version_tuple(version: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
+class FilteredVectorSearch:
+    def __init__(
+        self, engine: AsyncEngine, ef_search: int = 100, max_scan_tuples: int = 20000
+    ):
+        self.engine = engine
+        self.ef_search = ef_search
+        self.max_scan_tuples = max_scan_tuples
+        self._iterative_scan: Optional[bool] = None
+
+    async def _supports_iterative_scan(self, connection) -> bool:
+        if self._iterative_scan is None:
+            result = await connection.execute(
+                text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            )
+            version = result.scalar_one_or_none() or "0"
+            self._iterative_scan = _version_tuple(version) >= (0, 8, 0)
+            logger.info(
+                "pgvector %s, iterative index scans %s",
+                version,
+                "enabled" if self._iterative_scan else "not available",
+            )
+        return self._iterative_scan
+
+    async def search(
+        self,
+        collection_name: str,
+        embedding: List[float],
+        k: int,
+        metadata: Dict[str, Any],
+    ) -> List[dict]:
+        async with self.engine.begin() as connection:
+            # SET LOCAL only lasts until the end of this transaction
+            await connection.execute(
+                text(f"SET LOCAL hnsw.ef_search = {int(self.ef_search)}")
+            )
+            if await self._supports_iterative_scan(connection):
+                await connection.execute(
+                    text("SET LOCAL hnsw.iterative_scan = relaxed_order")
+                )
+                await connection.execute(
+                    text(
+                        f"SET LOCAL hnsw.max_scan_tuples = {int(self.max_scan_tuples)}"
+                    )
+                )
+            result = await connection.execute(
+                _SEARCH_QUERY,
+                {
+                    "embedding": str(list(embedding)),
+                    "collection_name": collection_name,
+                    "metadata": json.dumps(metadata),
+                    "k": k,
+                },
+            )
+            rows = result.all()
+        return [{"chunk": row.document, "metadata": row.cmetadata} for row in rows]
+
+
+class QuantizedVectorSearch(FilteredVectorSearch):
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        ef_search: int = 100,
+        max_scan_tuples: int = 20000,
+        oversampling: Optional[Dict[str, int]] = None,
+    ):
+        super().__init__(engine, ef_search=ef_search, max_scan_tuples=max_scan_tuples)
+        # binary codes lose far more ordering information than half precision
+        self.oversampling = {"halfvec": 2, "binary": 10, **(oversampling or {})}
+
+    @staticmethod
+    def _query(mode: str, collection_id: str, filtered: bool):
+        distance = QUANTIZED_EXPRESSIONS[mode][2]
+        # the collection id is inlined, the partial index predicate has to be provable
+        # at plan time and a bound parameter is not once the statement is prepared
+        collection_id = str(uuid.UUID(collection_id))
+        return text(
+            f"""
+            WITH candidates AS MATERIALIZED (
+                SELECT document, cmetadata, embedding
+                FROM langchain_pg_embedding
+                WHERE collection_id = '{collection_id}'::uuid
+                {"AND cmetadata @> CAST(:metadata AS jsonb)" if filtered else ""}
+                ORDER BY {distance}
+                LIMIT :candidates
+            )
+            SELECT document, cmetadata, embedding <=> CAST(:embedding AS vector) AS distance
+            FROM candidates ORDER BY distance LIMIT :k
+            """
+        )
+
+    async def search_quantized(
+        self,
+        mode: str,
+        collection_id: str,
+        embedding: List[float],
+        k: int,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> List[dict]:
+        # an HNSW scan returns at most ef_search rows, and pgvector rejects more
+        # than 1000, so a large k gets fewer candidates instead of an error
+        ef_search = min(max(self.ef_search, k * self.oversampling[mode]), MAX_EF_SEARCH)
+        candidates = max(min(k * self.oversampling[mode], ef_search), k)
+        params = {"embedding": str(list(embedding)), "candidates": candidates, "k": k}
+        if metadata:
+            params["metadata"] = json.dumps(metadata)
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+            )
+            if metadata and await self._supports_iterative_scan(connection):
+                await connection.execute(
+                    text("SET LOCAL hnsw.iterative_scan = relaxed_order")
+                )
+                await connection.execute(
+                    text(
+                        f"SET LOCAL hnsw.max_scan_tuples = {int(self.max_scan_tuples)}"
+                    )
+                )
+            result = await connection.execute(
+                self._query(mode, collection_id, bool(metadata)), params
+            )
+            rows = result.all()
+        return [{"chunk": row.document, "metadata": row.cmetadata} for row in rows]